@@ -1,7 +1,7 @@
 #ifndef SHEPHERD_COMMONS_H_
 #define SHEPHERD_COMMONS_H_
 // NOTE: a (almost) Copy of this definition-file exists for the kernel module (copy changes by hand)
-// NOTE: and most of the structs are hardcoded in read_buffer() in shepherd_io.py
+// NOTE: and SampleBuffer is mirrored as numpy-dtype in SharedMem of shepherd_io.py
 
 #include "simple_lock.h"
 #include "shepherd_config.h"
@@ -34,6 +34,7 @@ enum MsgType {
 	MSG_NONE = 0x00u,
 	MSG_BUF_FROM_HOST = 0x01u,
 	MSG_BUF_FROM_PRU = 0x02u,
+	MSG_BUF_RANGE_FROM_HOST = 0x03u, // value[0] = first index, value[1] = count
 	// DEBUG
 	MSG_DBG_ADC = 0xA0u,
 	MSG_DBG_DAC = 0xA1u,
@@ -275,6 +275,13 @@ static bool_ft handle_kernel_com(volatile struct SharedMem *const shared_mem, st
 		if (msg_in.type == MSG_BUF_FROM_HOST) {
 			ring_put(free_buffers_ptr, (uint8_t)msg_in.value[0]);
 			return 1U;
+		} else if (msg_in.type == MSG_BUF_RANGE_FROM_HOST) {
+			// bulk hand-over, used to fill the ring before start
+			uint32_t index = msg_in.value[0];
+			uint32_t count = msg_in.value[1];
+			if (count > FIFO_BUFFER_SIZE) count = FIFO_BUFFER_SIZE;
+			while (count--) ring_put(free_buffers_ptr, (uint8_t)(index++));
+			return 1U;
 		} else if ((msg_in.type == MSG_TEST) && (msg_in.value[0] == 1)) {
 			// pipeline-test for msg-system
 			send_message(shared_mem,MSG_TEST, msg_in.value[0], 0);
@@ -25,6 +25,7 @@ enum MsgType {
     MSG_NONE = 0x00u,
     MSG_BUF_FROM_HOST = 0x01u,
     MSG_BUF_FROM_PRU = 0x02u,
+    MSG_BUF_RANGE_FROM_HOST = 0x03u,
     // DEBUG
     MSG_DBG_ADC = 0xA0u,
     MSG_DBG_DAC = 0xA1u,
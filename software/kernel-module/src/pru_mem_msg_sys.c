@@ -5,6 +5,7 @@
 #include <linux/mutex.h>
 
 #include "pru_mem_msg_sys.h"
+#include "sysfs_interface.h"
 
 /***************************************************************/
 /***************************************************************/
@@ -139,7 +140,10 @@ static enum hrtimer_restart coordinator_callback(struct hrtimer *timer_for_resta
     struct ProtoMsg pru_msg;
     struct timespec ts_now;
     static unsigned int step_pos = 0;
+    static enum ShepherdState last_state = STATE_UNKNOWN;
+    enum ShepherdState state;
     uint8_t had_work = 0;
+    uint8_t msg_for_user = 0;
     uint32_t iter;
 
     /* Timestamp system clock */
@@ -159,6 +163,7 @@ static enum hrtimer_restart coordinator_callback(struct hrtimer *timer_for_resta
         if (pru_msg.type<0xC0)
         {
             ring_put(&msg_ringbuf_from_pru, &pru_msg);
+            msg_for_user = 1;
         }
         else
         {
@@ -182,16 +187,19 @@ static enum hrtimer_restart coordinator_callback(struct hrtimer *timer_for_resta
                 break;
             case MSG_ERR_INCMPLT:
                 ring_put(&msg_ringbuf_from_pru, &pru_msg);
+                msg_for_user = 1;
                 /* printk(KERN_ERR
                 "shprd.pru%u: sample-buffer not full (fill=%u)", had_work & 1u, pru_msg.value[0]); */
                 break;
             case MSG_ERR_INVLDCMD:
                 ring_put(&msg_ringbuf_from_pru, &pru_msg);
+                msg_for_user = 1;
                 /* printk(KERN_ERR
                 "shprd.pru%u: received invalid command / msg-type (%u)", had_work & 1u, pru_msg.value[0]); */
                 break;
             case MSG_ERR_NOFREEBUF:
                 ring_put(&msg_ringbuf_from_pru, &pru_msg);
+                msg_for_user = 1;
                 /* printk(KERN_ERR
                 "shprd.pru%u: ringbuffer is depleted - no free buffer (val=%u)", had_work & 1u, pru_msg.value[0]); */
                 break;
@@ -222,6 +230,17 @@ static enum hrtimer_restart coordinator_callback(struct hrtimer *timer_for_resta
         step_pos = coord_timer_steps_ns_size - 1;
     }
 
+    /* userspace can poll() on pru_msg_box instead of sleeping a whole buffer period */
+    if (msg_for_user) sysfs_interface_notify_msg();
+
+    /* state changes by PRU (reset -> idle) or delayed start (armed -> running) */
+    state = pru_comm_get_state();
+    if (state != last_state)
+    {
+        last_state = state;
+        sysfs_interface_notify_state();
+    }
+
     if (pru0_comm_check_send_status() && ring_get(&msg_ringbuf_to_pru, &pru_msg))
     {
         pru0_comm_send_msg(&pru_msg);
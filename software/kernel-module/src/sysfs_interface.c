@@ -1,6 +1,8 @@
 #include <linux/kobject.h>
 #include <linux/string.h>
 #include <linux/sysfs.h>
+#include <linux/atomic.h>
+#include <linux/ktime.h>
 #include <asm/io.h>
 
 #include "commons.h"
@@ -16,6 +18,12 @@ struct kobject *kobj_mem_ref;
 struct kobject *kobj_sync_ref;
 struct kobject *kobj_prog_ref;
 
+/* cached node for sysfs_notify_dirent(), sysfs_notify() itself may sleep */
+static struct kernfs_node *kn_pru_msg_box;
+/* CLOCK_MONOTONIC of the latest notification, userspace measures its wake-up latency with it */
+static atomic64_t msg_notify_ns = ATOMIC64_INIT(0);
+static struct kernfs_node *kn_state;
+
 static ssize_t sysfs_sync_error_show(struct kobject *kobj,
 				     struct kobj_attribute *attr, char *buf);
 
@@ -74,6 +82,8 @@ static ssize_t sysfs_pru_msg_system_store(struct kobject *kobj,
         const char *buffer, size_t count);
 static ssize_t sysfs_pru_msg_system_show(struct kobject *kobj,
         struct kobj_attribute *attr, char *buffer);
+static ssize_t sysfs_pru_msg_notify_ns_show(struct kobject *kobj,
+        struct kobj_attribute *attr, char *buffer);
 
 static ssize_t sysfs_prog_state_store(struct kobject *kobj,
 					   struct kobj_attribute *attr,
@@ -157,6 +167,9 @@ struct kobj_attr_struct_s attr_pru_msg_system_settings = {
 	.val_offset = 0
 };
 
+struct kobj_attribute attr_pru_msg_notify_ns =
+	__ATTR(pru_msg_notify_ns, 0440, sysfs_pru_msg_notify_ns_show, NULL);
+
 struct kobj_attr_struct_s attr_prog_state = {
 	.attr = __ATTR(state, 0660, sysfs_prog_state_show, sysfs_prog_state_store),
 	.val_offset = offsetof(struct SharedMem, programmer_ctrl) + offsetof(struct ProgrammerCtrl, state)
@@ -209,6 +222,7 @@ static struct attribute *pru_attrs[] = {
 	&attr_virtual_converter_settings.attr.attr,
 	&attr_virtual_harvester_settings.attr.attr,
 	&attr_pru_msg_system_settings.attr.attr,
+	&attr_pru_msg_notify_ns.attr,
 	NULL,
 };
 
@@ -676,6 +690,26 @@ static ssize_t sysfs_pru_msg_system_show(struct kobject *kobj,
     return count;
 }
 
+/* wakes up userspace that poll()s / select()s on pru_msg_box, safe in atomic context (hrtimer) */
+void sysfs_interface_notify_msg(void)
+{
+	atomic64_set(&msg_notify_ns, ktime_get_ns());
+	if (kn_pru_msg_box != NULL)
+		sysfs_notify_dirent(kn_pru_msg_box);
+}
+
+static ssize_t sysfs_pru_msg_notify_ns_show(struct kobject *kobj,
+        struct kobj_attribute *attr, char *buf)
+{
+	return sprintf(buf, "%llu\n", (unsigned long long) atomic64_read(&msg_notify_ns));
+}
+
+/* wakes up userspace that poll()s / select()s on state, safe in atomic context (hrtimer) */
+void sysfs_interface_notify_state(void)
+{
+	if (kn_state != NULL)
+		sysfs_notify_dirent(kn_state);
+}
 
 static ssize_t sysfs_prog_state_show(struct kobject *kobj,
 					   struct kobj_attribute *attr, char *buf)
@@ -845,6 +879,14 @@ int sysfs_interface_init(void)
 		goto r_state;
 	};
 
+	kn_pru_msg_box = sysfs_get_dirent(kobj_ref->sd, "pru_msg_box");
+	if (kn_pru_msg_box == NULL)
+		printk(KERN_WARNING "shprd.k: cannot get dirent of pru_msg_box -> no poll() support");
+
+	kn_state = sysfs_get_dirent(kobj_ref->sd, "state");
+	if (kn_state == NULL)
+		printk(KERN_WARNING "shprd.k: cannot get dirent of state -> no poll() support");
+
 	kobj_mem_ref = kobject_create_and_add("memory", kobj_ref);
 
 	if ((retval = sysfs_create_group(kobj_mem_ref, &attr_mem_group))) {
@@ -885,6 +927,16 @@ r_sysfs:
 
 void sysfs_interface_exit(void)
 {
+	if (kn_pru_msg_box != NULL)
+	{
+		sysfs_put(kn_pru_msg_box);
+		kn_pru_msg_box = NULL;
+	}
+	if (kn_state != NULL)
+	{
+		sysfs_put(kn_state);
+		kn_state = NULL;
+	}
 	sysfs_remove_group(kobj_ref, &attr_group);
 	sysfs_remove_file(kobj_ref, &attr_state.attr);
 	kobject_put(kobj_prog_ref);
@@ -3,5 +3,7 @@
 
 void sysfs_interface_exit(void);
 int sysfs_interface_init(void);
+void sysfs_interface_notify_msg(void);
+void sysfs_interface_notify_state(void);
 
 #endif /*__SYSFS_INTERFACE_H_*/
@@ -9,7 +9,6 @@ requirements = [
     "zerorpc",
     "invoke",
     "h5py",
-    "psutil",
     "pyserial",
     "pyyaml",
     "msgpack",
@@ -19,6 +18,8 @@ requirements = [
     "shepherd-data",
 ]
 
+test_requirements = ["pytest>=3.9", "pyfakefs", "pytest-timeout", "pytest-click"]
+
 # We are installing the DBUS module to build the docs, but the C libraries
 # required to build dbus aren't available on RTD, so we need to exclude it
 # from the installed dependencies here, and mock it for import in docs/conf.py
@@ -46,7 +47,8 @@ setup(
     ],
     install_requires=requirements,
     setup_requires=["pytest-runner"],
-    tests_require=["pytest>=3.9", "pyfakefs", "pytest-timeout", "pytest-click"],
+    tests_require=test_requirements,
+    extras_require={"test": test_requirements},
     author="Kai Geissdoerfer",
     author_email="kai dot geissdoerfer at tu-dresden dot de",
     entry_points={"console_scripts": ["shepherd-sheep=shepherd.cli:cli"]},
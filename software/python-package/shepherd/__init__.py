@@ -20,18 +20,27 @@ from typing import NoReturn, Union
 import msgpack
 import msgpack_numpy
 import numpy
+import h5py
 import invoke
 import signal
 
 from shepherd_data import Reader as ShpReader
 
 from shepherd.shepherd_io import ShepherdIO, DataBuffer
-from shepherd.virtual_harvester_data import VirtualHarvesterConfig
-from shepherd.virtual_source_data import VirtualSourceConfig
+from shepherd.virtual_harvester_config import VirtualHarvesterConfig
+from shepherd.virtual_source_config import VirtualSourceConfig
 from shepherd.shepherd_io import ShepherdIOException
 
 from shepherd.datalog import LogWriter
+from shepherd.datalog import LogReader
+from shepherd.datalog import LogFollower
 from shepherd.datalog import ExceptionRecord
+from shepherd.segments import SegmentedLogWriter
+from shepherd.segments import create_log_writer
+from shepherd.raw_log import RawLogWriter
+from shepherd.buffer_pipeline import PipelinedWriter
+from shepherd.buffer_pipeline import PrefetchReader
+from shepherd.sample_codec import DeltaZigzagStream, decode_buffers
 from shepherd.eeprom import EEPROM
 from shepherd.eeprom import CapeData
 from shepherd.calibration import CalibrationData
@@ -94,15 +103,12 @@ class Recorder(ShepherdIO):
         super().send_virtual_harvester_settings(self.harvester)
         super().send_calibration_settings(self.calibration)
 
-        super().reinitialize_prus()  # needed for ADCs
+        # needed for ADCs, PRU is ready (ADCs & ring initialized) when idle again
+        super().reinitialize_prus()
 
         # Give the PRU empty buffers to begin with
-        time.sleep(1)
-        for i in range(self.n_buffers):
-            time.sleep(
-                0.1 * float(self.buffer_period_ns) / 1e9
-            )  # could be as low as ~ 10us
-            self.return_buffer(i, True)
+        super()._return_buffer_range(0, self.n_buffers)
+        logger.debug(f"Sent {self.n_buffers} empty buffers to PRU")
 
         return self
 
@@ -188,17 +194,28 @@ class Emulator(ShepherdIO):
         self._sel_target_for_pwr = sel_target_for_pwr
         self._aux_target_voltage = aux_target_voltage
 
-        self._v_gain = 1e6 * calibration_recording["harvester"]["adc_voltage"]["gain"]
-        self._v_offset = (
+        # voltage in uV fits float32 well enough (< 1 uV error for 5 V),
+        # current in nA needs the resolution of float64
+        self._v_gain = numpy.float32(
+            1e6 * calibration_recording["harvester"]["adc_voltage"]["gain"]
+        )
+        self._v_offset = numpy.float32(
             1e6 * calibration_recording["harvester"]["adc_voltage"]["offset"]
         )
-        self._i_gain = 1e9 * calibration_recording["harvester"]["adc_current"]["gain"]
-        self._i_offset = (
+        self._i_gain = numpy.float64(
+            1e9 * calibration_recording["harvester"]["adc_current"]["gain"]
+        )
+        self._i_offset = numpy.float64(
             1e9 * calibration_recording["harvester"]["adc_current"]["offset"]
         )
+        # scratch-space for the conversion, allocated once the buffer-size is known
+        self._v_scratch = None
+        self._i_scratch = None
 
     def __enter__(self):
         super().__enter__()
+        self._v_scratch = numpy.empty(self.samples_per_buffer, dtype=numpy.float32)
+        self._i_scratch = numpy.empty(self.samples_per_buffer, dtype=numpy.float64)
 
         super().set_power_state_recorder(False)
         super().set_power_state_emulator(True)
@@ -208,43 +225,113 @@ class Emulator(ShepherdIO):
         super().send_virtual_converter_settings(self.vs_cfg)
         super().send_virtual_harvester_settings(self.vh_cfg)
 
-        super().reinitialize_prus()  # needed for ADCs
+        # needed for ADCs, PRU is ready (ADCs & ring initialized) when idle again
+        super().reinitialize_prus()
 
         super().set_target_io_level_conv(self._set_target_io_lvl_conv)
         super().select_main_target_for_io(self._sel_target_for_io)
         super().select_main_target_for_power(self._sel_target_for_pwr)
         super().set_aux_target_voltage(self.calibration, self._aux_target_voltage)
 
-        # Preload emulator with data
-        time.sleep(1)
+        # Preload emulator with data, hand it over with one message
         for idx, buffer in enumerate(self._initial_buffers):
-            time.sleep(
-                0.1 * float(self.buffer_period_ns) / 1e9
-            )  # could be as low as ~ 10us
-            self.return_buffer(idx, buffer, verbose=True)
+            self._fill_buffer(idx, buffer)
+        super()._return_buffer_range(0, len(self._initial_buffers))
+        logger.debug(f"Sent {len(self._initial_buffers)} emu-buffers to PRU")
 
         return self
 
-    def return_buffer(self, index, buffer, verbose: bool = False):
-        if verbose:
-            ts_start = time.time()
-
-        # Convert raw ADC data to SI-Units -> the virtual-source-emulator in PRU expects uV and nV
-        voltage_transformed = (buffer.voltage * self._v_gain + self._v_offset).astype(
-            "u4"
-        )
-        current_transformed = (buffer.current * self._i_gain + self._i_offset).astype(
-            "u4"
-        )
+    def return_buffer(
+        self, index, buffer, verbose: bool = False, calibrated: bool = False
+    ):
+        """Fills buffer in shared memory with emulation data and hands it to PRU
 
-        self.shared_mem.write_buffer(index, voltage_transformed, current_transformed)
-        super()._return_buffer(index)
+        :param index: (int) Index of the buffer. 0 <= index < n_buffers
+        :param buffer: DataBuffer with raw ADC data of the recording
+        :param verbose: chatter-prevention, performance-critical computation saver
+        :param calibrated: True if buffer already contains uV and nA as u4,
+            see get_input_converter()
+        """
+        ts_start = time.perf_counter_ns()
+        self._fill_buffer(index, buffer, calibrated)
+        super()._return_buffer(index, ts_start)
         if verbose:
             logger.debug(
                 f"Sending emu-buffer #{ index } to PRU took "
-                f"{ round(1e3 * (time.time()-ts_start), 2) } ms"
+                f"{ round((time.perf_counter_ns() - ts_start) / 1e6, 2) } ms"
+            )
+
+    def _fill_buffer(self, index, buffer, calibrated: bool = False) -> NoReturn:
+        """Writes emulation data into a buffer in shared memory
+
+        :param index: (int) Index of the buffer. 0 <= index < n_buffers
+        :param buffer: DataBuffer with raw ADC data of the recording
+        :param calibrated: True if buffer already contains uV and nA as u4
+        """
+        # Convert raw ADC data to SI-Units -> the virtual-source-emulator in PRU expects uV and nV
+        # result is written directly into shared memory, without temporary arrays
+        voltage_dst, current_dst = self.shared_mem.get_write_views(index)
+        if calibrated:
+            numpy.copyto(voltage_dst[: buffer.voltage.size], buffer.voltage)
+            numpy.copyto(current_dst[: buffer.current.size], buffer.current)
+        else:
+            self._transform(
+                buffer.voltage,
+                self._v_gain,
+                self._v_offset,
+                self._v_scratch,
+                voltage_dst,
+            )
+            self._transform(
+                buffer.current,
+                self._i_gain,
+                self._i_offset,
+                self._i_scratch,
+                current_dst,
+            )
+
+    def get_input_converter(self):
+        """Conversion of raw input data to uV and nA, usable from other threads
+
+        The returned function has its own scratch-space and writes into
+        the provided u4-arrays, that can then be handed to
+        return_buffer(..., calibrated=True).
+
+        :return: function(buffer, voltage_out, current_out)
+        """
+        v_scratch = numpy.empty(self.samples_per_buffer, dtype=numpy.float32)
+        i_scratch = numpy.empty(self.samples_per_buffer, dtype=numpy.float64)
+
+        def convert(
+            buffer: DataBuffer, voltage_out: numpy.ndarray, current_out: numpy.ndarray
+        ) -> NoReturn:
+            self._transform(
+                buffer.voltage, self._v_gain, self._v_offset, v_scratch, voltage_out
+            )
+            self._transform(
+                buffer.current, self._i_gain, self._i_offset, i_scratch, current_out
             )
 
+        return convert
+
+    @staticmethod
+    def _transform(
+        values: numpy.ndarray,
+        gain,
+        offset,
+        scratch: numpy.ndarray,
+        target: numpy.ndarray,
+    ) -> NoReturn:
+        """Calculates target = (values * gain + offset).astype("u4") in place
+
+        Computation happens in the dtype of scratch (float32 or float64)
+        """
+        n_values = values.size
+        tmp = scratch[:n_values]
+        numpy.multiply(values, gain, out=tmp, dtype=scratch.dtype)
+        numpy.add(tmp, offset, out=tmp)
+        numpy.copyto(target[:n_values], tmp, casting="unsafe")
+
 
 class ShepherdDebug(ShepherdIO):
     """API for direct access to ADC and DAC.
@@ -599,6 +686,20 @@ def run_recorder(
     start_time: float = None,
     warn_only: bool = False,
     output_compression=None,
+    compression_threads: int = 0,
+    sample_codec: str = None,
+    pipelined: bool = False,
+    buffers_per_write: int = 10,
+    implicit_time: bool = False,
+    segment_duration: float = None,
+    segment_size: int = None,
+    swmr: bool = False,
+    summary: bool = False,
+    energy: bool = False,
+    on_threshold_w: float = 0.0,
+    sysutil_intervall: float = None,
+    raw_output: bool = False,
+    hdf5_settings: dict = None,
 ):
     """Starts recording.
 
@@ -614,6 +715,33 @@ def run_recorder(
         start_time (float): Desired start time of emulation in unix epoch time
         warn_only (bool): Set true to continue recording after recoverable error
         output_compression: "lzf" recommended, alternatives are "gzip" (level 4) or gzip-level 1-9
+        compression_threads (int): compress gzip-chunks in a pool of that many
+            threads instead of the hdf5 filter pipeline, 0 disables it
+        sample_codec (str): "shuffle" or "delta_zigzag" to shrink voltage and
+            current before compression, see sample_codec.py
+        pipelined (bool): True to copy buffers out of shared memory and write
+            them to file in a separate thread, PRU gets buffers back immediately
+        buffers_per_write (int): number of buffers that get gathered for one
+            write to file
+        implicit_time (bool): True to omit the timestamp per sample, the
+            timebase is kept per buffer
+        segment_duration (float): start a new file (segment) every that many
+            seconds, see SegmentedLogWriter
+        segment_size (int): start a new file (segment) at that many bytes
+        swmr (bool): True to allow reading the file while it is written, see
+            LogFollower
+        summary (bool): True to keep min/max/mean per time-bin while
+            recording, costs cpu per sample
+        energy (bool): True to keep the energy-accounting while recording,
+            costs cpu per sample
+        on_threshold_w (float): power above that counts as on-time for the
+            energy-accounting
+        sysutil_intervall (float): seconds between two rows of
+            system-statistics, None keeps the default of LogWriter (1 s)
+        raw_output (bool): True to write flat binary files instead of hdf5,
+            see RawLogWriter and convert_raw()
+        hdf5_settings (dict): cache- and chunk-settings for LogWriter, e.g.
+            rdcc_nbytes or chunk_lengths, see testbench_hdf5.py
     """
     mode = "harvester"
     cal_data = retrieve_calibration(use_cal_default)
@@ -638,7 +766,7 @@ def run_recorder(
     )
 
     recorder = Recorder(shepherd_mode=mode, harvester=harvester, calibration=cal_data)
-    log_writer = LogWriter(
+    log_writer = create_log_writer(
         file_path=store_path,
         calibration_data=cal_data,
         mode=mode,
@@ -647,6 +775,20 @@ def run_recorder(
         samples_per_buffer=samples_per_buffer,
         samplerate_sps=samplerate_sps,
         output_compression=output_compression,
+        compression_threads=compression_threads,
+        sample_codec=sample_codec,
+        duration=duration,
+        buffers_per_write=buffers_per_write,
+        implicit_time=implicit_time,
+        segment_duration=segment_duration,
+        segment_size=segment_size,
+        swmr=swmr,
+        summary=summary,
+        energy=energy,
+        on_threshold_w=on_threshold_w,
+        sysutil_intervall=sysutil_intervall,
+        raw_output=raw_output,
+        **(hdf5_settings or {}),
     )
 
     verbose = (
@@ -659,6 +801,14 @@ def run_recorder(
             recorder
         )  # TODO: these are no real contextmanagers, open with "with", do proper exit
         stack.enter_context(log_writer)
+        if pipelined:
+            buffer_sink = stack.enter_context(
+                PipelinedWriter(log_writer, samples_per_buffer)
+            )
+        else:
+            buffer_sink = log_writer
+        recorder.telemetry.sink = buffer_sink.write_telemetry
+        stack.callback(recorder.telemetry.flush)
 
         # in_stream has to be disabled to avoid trouble with pytest
         res = invoke.run("hostname", hide=True, warn=True, in_stream=False)
@@ -695,14 +845,14 @@ def run_recorder(
                     f"ShepherdIOException(ID={e.id_num}, val={e.value}): {str(e)}"
                 )
                 err_rec = ExceptionRecord(int(time.time() * 1e9), str(e), e.value)
-                log_writer.write_exception(err_rec)
+                buffer_sink.write_exception(err_rec)
                 if not warn_only:
                     raise
 
             if (hrv_buf.timestamp_ns / 1e9) >= ts_end:
                 break
 
-            log_writer.write_buffer(hrv_buf)
+            buffer_sink.write_buffer(hrv_buf)
             recorder.return_buffer(idx, verbose=verbose)
 
 
@@ -725,6 +875,21 @@ def run_emulator(
     skip_log_current: bool = False,
     skip_log_gpio: bool = False,
     output_compression=None,
+    compression_threads: int = 0,
+    sample_codec: str = None,
+    pipelined: bool = False,
+    prefetch_buffers: int = 0,
+    buffers_per_write: int = 10,
+    implicit_time: bool = False,
+    segment_duration: float = None,
+    segment_size: int = None,
+    swmr: bool = False,
+    summary: bool = False,
+    energy: bool = False,
+    on_threshold_w: float = 0.0,
+    sysutil_intervall: float = None,
+    raw_output: bool = False,
+    hdf5_settings: dict = None,
 ):
     """Starts emulator.
 
@@ -752,6 +917,35 @@ def run_emulator(
         :param skip_log_gpio: [bool] reduce file-size by omitting this log
         :param skip_log_current: [bool] reduce file-size by omitting this log
         :param output_compression: "lzf" recommended, alternatives are "gzip" (level 4) or gzip-level 1-9
+        :param compression_threads: [int] compress gzip-chunks in a pool of that many
+            threads instead of the hdf5 filter pipeline, 0 disables it
+        :param sample_codec: [str] "shuffle" or "delta_zigzag" to shrink voltage and
+            current before compression, see sample_codec.py
+        :param pipelined: [bool] True to copy buffers out of shared memory and write
+            them to file in a separate thread, PRU gets buffers back immediately
+        :param prefetch_buffers: [int] number of input buffers that get read and
+            calibrated ahead of time in a separate thread, 0 (default) reads in the main loop
+        :param buffers_per_write: [int] number of buffers that get gathered for one
+            write to file
+        :param implicit_time: [bool] True to omit the timestamp per sample, the
+            timebase is kept per buffer
+        :param segment_duration: [float] start a new file (segment) every that many
+            seconds, see SegmentedLogWriter
+        :param segment_size: [int] start a new file (segment) at that many bytes
+        :param swmr: [bool] True to allow reading the file while it is written,
+            see LogFollower
+        :param summary: [bool] True to keep min/max/mean per time-bin while
+            recording, costs cpu per sample
+        :param energy: [bool] True to keep the energy-accounting while recording,
+            costs cpu per sample
+        :param on_threshold_w: [float] power above that counts as on-time for the
+            energy-accounting
+        :param sysutil_intervall: [float] seconds between two rows of
+            system-statistics, None keeps the default of LogWriter (1 s)
+        :param raw_output: [bool] True to write flat binary files instead of hdf5,
+            see RawLogWriter and convert_raw()
+        :param hdf5_settings: [dict] cache- and chunk-settings for LogWriter, e.g.
+            rdcc_nbytes or chunk_lengths, see testbench_hdf5.py
     """
     mode = "emulator"
     cal = retrieve_calibration(use_cal_default)
@@ -788,7 +982,7 @@ def run_emulator(
         else:
             store_path = output_path
 
-        log_writer = LogWriter(
+        log_writer = create_log_writer(
             file_path=store_path,
             force_overwrite=force_overwrite,
             mode=mode,
@@ -800,6 +994,20 @@ def run_emulator(
             samples_per_buffer=samples_per_buffer,
             samplerate_sps=samplerate_sps,
             output_compression=output_compression,
+            compression_threads=compression_threads,
+            sample_codec=sample_codec,
+            duration=duration,
+            buffers_per_write=buffers_per_write,
+            implicit_time=implicit_time,
+            segment_duration=segment_duration,
+            segment_size=segment_size,
+            swmr=swmr,
+            summary=summary,
+            energy=energy,
+            on_threshold_w=on_threshold_w,
+            sysutil_intervall=sysutil_intervall,
+            raw_output=raw_output,
+            **(hdf5_settings or {}),
         )
 
     if isinstance(input_path, str):
@@ -813,6 +1021,18 @@ def run_emulator(
     verbose = get_verbose_level() >= 4
 
     log_reader = ShpReader(input_path, verbose=verbose)
+    # shepherd_data hands out the stored values, the codec is undone here
+    with h5py.File(input_path, "r") as input_file:
+        codec_streams = {
+            channel: DeltaZigzagStream(input_file["data"][channel].chunks[0])
+            for channel in ["voltage", "current"]
+            if input_file["data"][channel].attrs.get("codec") == "delta_zigzag"
+        }
+    if codec_streams:
+        logger.info(f"input is delta_zigzag-encoded ({list(codec_streams)}) -> decoding")
+
+    def read_input(**kwargs):
+        return decode_buffers(log_reader.read_buffers(**kwargs), codec_streams)
     # TODO: new reader allow to check mode and dtype of recording (should be emu, ivcurves)
 
     with ExitStack() as stack:
@@ -825,11 +1045,17 @@ def run_emulator(
                 x for x in res.stdout if x.isprintable()
             ).strip()
             log_writer.start_monitors(uart_baudrate)
+            if pipelined:
+                buffer_sink = stack.enter_context(
+                    PipelinedWriter(log_writer, samples_per_buffer)
+                )
+            else:
+                buffer_sink = log_writer
 
         stack.enter_context(log_reader)
 
         fifo_buffer_size = sysfs_interface.get_n_buffers()
-        init_buffers = [DataBuffer(voltage=dsv, current=dsc) for _, dsv, dsc in log_reader.read_buffers(end_n=fifo_buffer_size)]
+        init_buffers = [DataBuffer(voltage=dsv, current=dsc) for _, dsv, dsc in read_input(end_n=fifo_buffer_size)]
 
         emu = Emulator(
             shepherd_mode=mode,  # TODO: this should not be needed anymore
@@ -847,6 +1073,24 @@ def run_emulator(
         stack.enter_context(emu)
         if output_path is not None:
             log_writer.embed_config(emu.vs_cfg.data)
+            emu.telemetry.sink = buffer_sink.write_telemetry
+            stack.callback(emu.telemetry.flush)
+
+        if prefetch_buffers > 0:
+            # decoding and calibration happen ahead of time in a separate thread
+            input_buffers = stack.enter_context(
+                PrefetchReader(
+                    read_input(start_n=fifo_buffer_size),
+                    emu.samples_per_buffer,
+                    emu.get_input_converter(),
+                    prefetch_buffers,
+                )
+            )
+        else:
+            input_buffers = (
+                DataBuffer(voltage=dsv, current=dsc)
+                for _, dsv, dsc in read_input(start_n=fifo_buffer_size)
+            )
         emu.start(start_time, wait_blocking=False)
         logger.info(f"waiting {start_time - time.time():.2f} s until start")
         emu.wait_for_start(start_time - time.time() + 15)
@@ -865,7 +1109,7 @@ def run_emulator(
         else:
             ts_end = start_time + duration
 
-        for _, dsv, dsc in log_reader.read_buffers(start_n=fifo_buffer_size):
+        for hrvst_buf in input_buffers:
             try:
                 idx, emu_buf = emu.get_buffer(verbose=verbose)
             except ShepherdIOException as e:
@@ -875,7 +1119,7 @@ def run_emulator(
 
                 err_rec = ExceptionRecord(int(time.time() * 1e9), str(e), e.value)
                 if output_path is not None:
-                    log_writer.write_exception(err_rec)
+                    buffer_sink.write_exception(err_rec)
                 if not warn_only:
                     raise
 
@@ -883,10 +1127,11 @@ def run_emulator(
                 break
 
             if output_path is not None:
-                log_writer.write_buffer(emu_buf)
+                buffer_sink.write_buffer(emu_buf)
 
-            hrvst_buf = DataBuffer(voltage=dsv, current=dsc)
-            emu.return_buffer(idx, hrvst_buf, verbose)
+            emu.return_buffer(
+                idx, hrvst_buf, verbose, calibrated=(prefetch_buffers > 0)
+            )
 
         # Read all remaining buffers from PRU
         while True:
@@ -895,7 +1140,7 @@ def run_emulator(
                 if emu_buf.timestamp_ns / 1e9 >= ts_end:
                     break
                 if output_path is not None:
-                    log_writer.write_buffer(emu_buf)
+                    buffer_sink.write_buffer(emu_buf)
             except ShepherdIOException as e:
                 # We're done when the PRU has processed all emulation data buffers
                 if e.id_num == commons.MSG_DEP_ERR_NOFREEBUF:
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.buffer_pipeline
+~~~~~
+Decouples the hand-back of PRU-buffers from file-access.
+Payload gets copied out of shared memory into a pool of preallocated blocks,
+so the buffer can be returned to the PRU right away. A writer-thread
+drains the bounded queue into the LogWriter.
+In the other direction a reader-thread keeps the emulation input decoded
+and calibrated in a ring of preallocated arrays.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+from typing import Iterable
+from typing import NoReturn
+
+import numpy as np
+
+from shepherd.commons import MAX_GPIO_EVT_PER_BUFFER
+from shepherd.datalog import ExceptionRecord
+from shepherd.datalog import LogWriter
+from shepherd.shepherd_io import DataBuffer
+from shepherd.shepherd_io import GPIOEdges
+from shepherd.shepherd_io import ShepherdIOException
+
+logger = logging.getLogger(__name__)
+
+
+class BufferBlock(object):
+    """Preallocated storage for the content of one shared-memory buffer"""
+
+    def __init__(self, samples_per_buffer: int):
+        self.voltage = np.zeros(samples_per_buffer, dtype="u4")
+        self.current = np.zeros(samples_per_buffer, dtype="u4")
+        self.gpio_timestamps_ns = np.zeros(MAX_GPIO_EVT_PER_BUFFER, dtype="u8")
+        self.gpio_values = np.zeros(MAX_GPIO_EVT_PER_BUFFER, dtype="u2")
+        self.buffer = None
+
+    def fill(self, buffer: DataBuffer) -> DataBuffer:
+        """Copies payload of buffer into this block
+
+        :param buffer: DataBuffer, usually with views into shared memory
+        :return: DataBuffer pointing to the copied data
+        """
+        n_samples = len(buffer)
+        n_edges = len(buffer.gpio_edges)
+        np.copyto(self.voltage[:n_samples], buffer.voltage[:n_samples])
+        np.copyto(self.current[:n_samples], buffer.current[:n_samples])
+        if n_edges > 0:
+            np.copyto(
+                self.gpio_timestamps_ns[:n_edges],
+                buffer.gpio_edges.timestamps_ns[:n_edges],
+            )
+            np.copyto(self.gpio_values[:n_edges], buffer.gpio_edges.values[:n_edges])
+        self.buffer = DataBuffer(
+            voltage=self.voltage[:n_samples],
+            current=self.current[:n_samples],
+            timestamp_ns=buffer.timestamp_ns,
+            gpio_edges=GPIOEdges(
+                self.gpio_timestamps_ns[:n_edges], self.gpio_values[:n_edges]
+            ),
+            util_mean=buffer.util_mean,
+            util_max=buffer.util_max,
+        )
+        return self.buffer
+
+
+class PipelinedWriter(object):
+    """Writes buffers to a LogWriter from a separate thread
+
+    write_buffer() copies the buffer into a pooled block and queues it, so the
+    caller can return the shared-memory buffer to the PRU immediately.
+    When all blocks are in flight, write_buffer() blocks until the writer has
+    caught up (counted as stall). Errors of the writer-thread are re-raised
+    in the calling thread with the next write_buffer() or on exit.
+
+    Offers write_buffer(), write_exception() and write_telemetry() like the
+    LogWriter itself.
+
+    Args:
+        log_writer (LogWriter): already entered writer, owned by the caller
+        samples_per_buffer (int): size of one buffer in samples
+        queue_size (int): number of buffers that can wait for the writer
+    """
+
+    _sentinel = None
+
+    def __init__(
+        self, log_writer: LogWriter, samples_per_buffer: int, queue_size: int = 16
+    ):
+        if queue_size < 1:
+            raise ValueError(f"queue_size must be positive, got {queue_size}")
+        self.log_writer = log_writer
+        self.queue_size = queue_size
+        # one extra block for the writer-thread and one for the caller
+        self._pool = queue.Queue()
+        for _ in range(queue_size + 2):
+            self._pool.put(BufferBlock(samples_per_buffer))
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._error = None
+        self.reset_stats()
+
+    def __enter__(self):
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._write_loop, name="PipelinedWriter", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._queue.put(self._sentinel)
+            self._thread.join()
+            self._thread = None
+        stats = self.get_stats()
+        logger.info(
+            f"[PipelinedWriter] {stats['buffers']} buffers, "
+            f"queue-depth max = {stats['queue_depth_max']} / {self.queue_size}, "
+            f"copy mean = {round(1e3 * stats['copy_mean_s'], 3)} ms, "
+            f"max = {round(1e3 * stats['copy_max_s'], 3)} ms, "
+            f"{stats['stalls']} stalls"
+        )
+        if exc[0] is None:
+            self._raise_pending()
+
+    def reset_stats(self) -> NoReturn:
+        self._n_buffers = 0
+        self._n_stalls = 0
+        self._copy_sum_s = 0.0
+        self._copy_max_s = 0.0
+        self._write_sum_s = 0.0
+        self._write_max_s = 0.0
+        self._depth_max = 0
+
+    def get_stats(self) -> dict:
+        """Metrics of the pipeline
+
+        :return: dict with number of buffers, current and max queue depth,
+            mean and max copy- and write-duration and stalls of write_buffer()
+        """
+        n_buffers = max(self._n_buffers, 1)
+        return {
+            "buffers": self._n_buffers,
+            "queue_depth": self._queue.qsize(),
+            "queue_depth_max": self._depth_max,
+            "copy_mean_s": self._copy_sum_s / n_buffers,
+            "copy_max_s": self._copy_max_s,
+            "write_mean_s": self._write_sum_s / n_buffers,
+            "write_max_s": self._write_max_s,
+            "stalls": self._n_stalls,
+        }
+
+    def write_buffer(self, buffer: DataBuffer) -> NoReturn:
+        """Copies buffer out of shared memory and queues it for writing
+
+        :param buffer: DataBuffer, can be returned to PRU after this call
+        """
+        self._raise_pending()
+        try:
+            block = self._pool.get_nowait()
+        except queue.Empty:
+            self._n_stalls += 1
+            block = self._pool.get()
+        ts_start = time.perf_counter()
+        block.fill(buffer)
+        duration = time.perf_counter() - ts_start
+        self._copy_sum_s += duration
+        self._copy_max_s = max(self._copy_max_s, duration)
+        self._n_buffers += 1
+        self._queue.put(block)
+        self._depth_max = max(self._depth_max, self._queue.qsize())
+
+    def write_exception(self, exception: ExceptionRecord) -> NoReturn:
+        """Queues exception, keeps order with the buffers and all
+        file-access in the writer-thread"""
+        self._queue.put(exception)
+
+    def write_telemetry(self, timestamps: np.ndarray, values: np.ndarray) -> NoReturn:
+        """Queues a block of telemetry, arrays must not be reused by caller"""
+        self._queue.put((timestamps, values))
+
+    def _raise_pending(self) -> NoReturn:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise ShepherdIOException(f"PipelinedWriter failed: {error}") from error
+
+    def _write_loop(self) -> NoReturn:
+        while True:
+            item = self._queue.get()
+            if item is self._sentinel:
+                break
+            if self._error is not None:
+                # drop data after failure, but keep the pool filled
+                if isinstance(item, BufferBlock):
+                    self._pool.put(item)
+                continue
+            try:
+                if isinstance(item, ExceptionRecord):
+                    self.log_writer.write_exception(item)
+                elif isinstance(item, tuple):
+                    self.log_writer.write_telemetry(*item)
+                else:
+                    ts_start = time.perf_counter()
+                    self.log_writer.write_buffer(item.buffer)
+                    duration = time.perf_counter() - ts_start
+                    self._write_sum_s += duration
+                    self._write_max_s = max(self._write_max_s, duration)
+            except Exception as e:
+                logger.error(f"[PipelinedWriter] writing failed: {e}")
+                self._error = e
+            finally:
+                if isinstance(item, BufferBlock):
+                    item.buffer = None
+                    self._pool.put(item)
+
+
+class PrefetchReader(object):
+    """Reads and converts emulation input ahead of time in a separate thread
+
+    The reader-thread pulls raw (voltage, current)-pairs from the source,
+    converts them into a ring of preallocated u4-arrays and keeps up to
+    `lookahead` of them ready. Iterating yields DataBuffers pointing into
+    the ring; a slot is reused after the next buffer was requested, so the
+    content has to be consumed (e.g. copied to shared memory) before that.
+    A shorter buffer (e.g. the last one of a file) is yielded as shorter
+    view, never with the tail of the slot's previous use.
+    Having to wait for the reader-thread is counted as underrun.
+
+    Args:
+        source (Iterable): yields tuples (timestamp, voltage, current) like
+            Reader.read_buffers(), with raw ADC values
+        samples_per_buffer (int): size of one buffer in samples
+        converter (Callable): function(buffer, voltage_out, current_out),
+            e.g. from Emulator.get_input_converter()
+        lookahead (int): number of converted buffers to keep ready
+    """
+
+    _sentinel = None
+    _poll_intervall = 0.1
+
+    def __init__(
+        self,
+        source: Iterable,
+        samples_per_buffer: int,
+        converter: Callable,
+        lookahead: int = 16,
+    ):
+        if lookahead < 1:
+            raise ValueError(f"lookahead must be positive, got {lookahead}")
+        self.source = source
+        self.converter = converter
+        self.lookahead = lookahead
+        # one extra slot is held by the consumer
+        self._slots = [
+            (
+                np.zeros(samples_per_buffer, dtype="u4"),
+                np.zeros(samples_per_buffer, dtype="u4"),
+            )
+            for _ in range(lookahead + 1)
+        ]
+        self._free = queue.Queue()
+        self._filled = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._error = None
+        self.reset_stats()
+
+    def __enter__(self):
+        self._stop.clear()
+        self._error = None
+        for index in range(len(self._slots)):
+            self._free.put(index)
+        self._thread = threading.Thread(
+            target=self._read_loop, name="PrefetchReader", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fifo in [self._free, self._filled]:
+            while not fifo.empty():
+                fifo.get_nowait()
+        stats = self.get_stats()
+        logger.info(
+            f"[PrefetchReader] {stats['buffers']} buffers, "
+            f"{stats['underruns']} underruns, "
+            f"fill-level min = {stats['fill_level_min']} / {self.lookahead}"
+        )
+
+    def __iter__(self):
+        slot_held = None
+        while True:
+            if slot_held is not None:
+                self._free.put(slot_held)
+                slot_held = None
+            try:
+                item = self._filled.get_nowait()
+            except queue.Empty:
+                self._n_underruns += 1
+                item = self._filled.get()
+            if item is self._sentinel:
+                if self._error is not None:
+                    raise ShepherdIOException(
+                        f"PrefetchReader failed: {self._error}"
+                    ) from self._error
+                return
+            slot_held, timestamp_ns, n_samples = item
+            self._n_buffers += 1
+            self._fill_min = min(self._fill_min, self._filled.qsize())
+            voltage, current = self._slots[slot_held]
+            yield DataBuffer(
+                voltage=voltage[:n_samples],
+                current=current[:n_samples],
+                timestamp_ns=timestamp_ns,
+            )
+
+    def reset_stats(self) -> NoReturn:
+        self._n_buffers = 0
+        self._n_underruns = 0
+        self._fill_min = self.lookahead
+
+    def get_stats(self) -> dict:
+        """Metrics of the prefetcher
+
+        :return: dict with number of buffers, underruns, current and min fill-level
+        """
+        return {
+            "buffers": self._n_buffers,
+            "underruns": self._n_underruns,
+            "fill_level": self._filled.qsize(),
+            "fill_level_min": self._fill_min,
+        }
+
+    def _read_loop(self) -> NoReturn:
+        try:
+            for timestamp, voltage, current in self.source:
+                index = None
+                while index is None:
+                    if self._stop.is_set():
+                        return
+                    try:
+                        index = self._free.get(timeout=self._poll_intervall)
+                    except queue.Empty:
+                        pass
+                voltage_out, current_out = self._slots[index]
+                n_samples = len(voltage)
+                self.converter(
+                    DataBuffer(voltage=voltage, current=current),
+                    voltage_out[:n_samples],
+                    current_out[:n_samples],
+                )
+                self._filled.put((index, timestamp, n_samples))
+        except Exception as e:
+            logger.error(f"[PrefetchReader] reading failed: {e}")
+            self._error = e
+        self._filled.put(self._sentinel)
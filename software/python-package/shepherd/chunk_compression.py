@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.chunk_compression
+~~~~~
+Compression of hdf5-chunks outside the filter pipeline. Whole chunks get
+deflated by zlib in a pool of threads (zlib releases the GIL) and are stored
+with write_direct_chunk(). The datasets carry the regular gzip-filter, so
+the files stay readable by any hdf5-reader.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+import logging
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NoReturn, Union
+
+import h5py
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def get_gzip_level(compression: Union[None, str, int]) -> Union[int, None]:
+    """Translates the compression-setting of h5py to a zlib-level
+
+    :param compression: setting as passed to h5py
+    :return: level 1-9 for gzip, None for other / no compression
+    """
+    if compression == "gzip":
+        return 4  # default of h5py
+    if isinstance(compression, int) and 0 < compression < 10:
+        return compression
+    return None
+
+
+def compress_chunk(
+    data: np.ndarray, chunk_shape: tuple, level: int, shuffle: bool = False
+) -> bytes:
+    """Deflates one chunk, edge-chunks get zero-padded to the full chunk-shape
+
+    :param data: content of the chunk
+    :param chunk_shape: shape of chunks of the dataset
+    :param level: zlib compression level
+    :param shuffle: True to apply the shuffle-filter of hdf5 first
+    :return: compressed chunk as stored by the filter pipeline of hdf5
+    """
+    if data.shape != chunk_shape:
+        padding = [(0, size - length) for size, length in zip(chunk_shape, data.shape)]
+        data = np.pad(data, padding)
+    data = np.ascontiguousarray(data)
+    if shuffle and data.itemsize > 1:
+        # byte k of all elements, then byte k+1, ...
+        data = np.ascontiguousarray(data.view("u1").reshape(-1, data.itemsize).T)
+    return zlib.compress(data, level)
+
+
+class ChunkCompressor(object):
+    """Compresses chunks in a thread-pool and writes them in order
+
+    Chunks get handed to the pool by submit() and are written to file by
+    write_completed(), either as soon as they are done or when the number of
+    pending chunks exceeds max_pending. Writing stays in the calling thread.
+
+    Args:
+        level (int): zlib compression level, has to match the gzip-filter
+            of the datasets
+        threads (int): size of thread-pool, defaults to number of cpus
+        max_pending (int): chunks that may wait for compression
+    """
+
+    def __init__(self, level: int, threads: int = None, max_pending: int = None):
+        self.level = level
+        self.threads = threads if threads else os.cpu_count()
+        self.max_pending = max_pending if max_pending else 4 * self.threads
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix="chunk_compression"
+        )
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def is_aligned(dataset: h5py.Dataset, offset: int, length: int) -> bool:
+        """Checks if a write to a 1D-dataset covers whole chunks"""
+        chunk_length = dataset.chunks[0]
+        return (offset % chunk_length == 0) and (length % chunk_length == 0)
+
+    def submit(self, dataset: h5py.Dataset, offset: int, data: np.ndarray) -> NoReturn:
+        """Hands a section of a 1D-dataset to the pool, see is_aligned()
+
+        The data gets copied, the caller may reuse the array right away.
+
+        :param dataset: target with gzip-filter, already resized to hold data
+        :param offset: position of data in dataset
+        :param data: content of whole chunks
+        """
+        chunk_length = dataset.chunks[0]
+        data = np.array(data, dtype=dataset.dtype)  # copy
+        for start in range(0, len(data), chunk_length):
+            self.submit_chunk(
+                dataset, (offset + start,), data[start : start + chunk_length]
+            )
+
+    def submit_chunk(
+        self, dataset: h5py.Dataset, offset: tuple, chunk: np.ndarray
+    ) -> NoReturn:
+        future = self._executor.submit(
+            compress_chunk, chunk, dataset.chunks, self.level, dataset.shuffle
+        )
+        self._pending.append((dataset, offset, future))
+        self.write_completed()
+
+    def write_completed(self, wait: bool = False) -> NoReturn:
+        """Writes compressed chunks to file, keeps the order of submission
+
+        :param wait: True to block until all pending chunks are written
+        """
+        while self._pending and (
+            wait or self._pending[0][2].done() or len(self._pending) > self.max_pending
+        ):
+            dataset, offset, future = self._pending.popleft()
+            dataset.id.write_direct_chunk(offset, future.result())
+
+    def close(self) -> NoReturn:
+        self.write_completed(wait=True)
+        self._executor.shutdown()
+
+
+def repack(
+    input_path: Path,
+    output_path: Path,
+    level: int = 1,
+    threads: int = None,
+) -> NoReturn:
+    """Copies a hdf5-file and (re-)compresses all chunked numeric datasets
+    with gzip, chunk by chunk in parallel
+
+    :param input_path: file to read
+    :param output_path: file to create
+    :param level: gzip compression level (1-9)
+    :param threads: size of thread-pool, defaults to number of cpus
+    """
+    if get_gzip_level(level) is None:
+        raise ValueError(f"gzip level must be in 1-9, got {level}")
+
+    with h5py.File(input_path, "r") as h5_in, h5py.File(
+        output_path, "w"
+    ) as h5_out, ChunkCompressor(level, threads) as compressor:
+        h5_out.attrs.update(h5_in.attrs)
+
+        def copy_item(name: str, item) -> NoReturn:
+            if isinstance(item, h5py.Group):
+                h5_out.require_group(name).attrs.update(item.attrs)
+            elif (item.chunks is None) or (item.dtype.kind not in "iuf"):
+                h5_in.copy(item, h5_out, name=name)
+            else:
+                dataset = h5_out.create_dataset(
+                    name,
+                    shape=item.shape,
+                    dtype=item.dtype,
+                    maxshape=item.maxshape,
+                    chunks=item.chunks,
+                    compression=level,
+                    shuffle=item.shuffle,
+                )
+                dataset.attrs.update(item.attrs)
+                if item.size == 0:
+                    return
+                for chunk_slice in item.iter_chunks():
+                    offset = tuple(section.start for section in chunk_slice)
+                    compressor.submit_chunk(dataset, offset, item[chunk_slice])
+
+        h5_in.visititems(copy_item)
+    logger.info(f"Repacked {input_path} to {output_path} (gzip level {level})")
@@ -25,6 +25,9 @@ import click_config_file
 from periphery import GPIO
 
 from shepherd import sysfs_interface
+from shepherd import simulation
+from shepherd import chunk_compression
+from shepherd import raw_log
 from shepherd import run_recorder
 from shepherd import run_emulator
 from shepherd.calibration import CalibrationData
@@ -53,6 +56,13 @@ logger.addHandler(consoleHandler)
 # TODO: clean up internal naming only have harvest/emulate to use harvester/emulator, even the commands should be "sheep harvester config"
 
 
+def load_hdf5_settings(file_path: str) -> Dict:
+    if file_path is None:
+        return None
+    with open(file_path, "r") as settings_data:
+        return yaml.safe_load(settings_data)
+
+
 def yamlprovider(file_path: str, cmd_name) -> Dict:
     logger.info(f"reading config from {file_path}, cmd={cmd_name}")
     with open(file_path, "r") as config_data:
@@ -87,16 +97,28 @@ def config_logger(verbose: int):
     default=2,
     help="4 Levels, but level 4 has serious performance impact",
 )
+@click.option(
+    "--simulate",
+    type=click.STRING,
+    default=None,
+    envvar=simulation.env_simulate,
+    help="Run on a simulated backend without hardware, "
+    "'1' uses the virtual harvester / source models, a path to a hdf5-file replays it",
+)
 @click.pass_context
-def cli(ctx, verbose: int):
+def cli(ctx, verbose: int, simulate: str):
     """Shepherd: Synchronized Energy Harvesting Emulator and Recorder
 
     Args:
         ctx:
         verbose:
+        simulate:
     Returns:
     """
     config_logger(verbose)
+    backend = simulation.create_backend(simulate)
+    if backend is not None:
+        ctx.with_resource(backend)
 
 
 @cli.command(short_help="Turns target power supply on or off (i.e. for programming)")
@@ -219,6 +241,90 @@ def run(mode, parameters: Dict, verbose):
     help="Desired start time in unix epoch time",
 )
 @click.option("--warn-only/--no-warn-only", default=True, help="Warn only on errors")
+@click.option(
+    "--pipelined",
+    is_flag=True,
+    help="Hand buffers back to PRU right away and write them to file in a separate thread",
+)
+@click.option(
+    "--buffers_per_write",
+    default=10,
+    type=click.INT,
+    help="Number of buffers that get gathered for one write to file",
+)
+@click.option(
+    "--implicit_time",
+    is_flag=True,
+    help="Omit the timestamp per sample, timebase is kept per buffer",
+)
+@click.option(
+    "--segment_duration",
+    type=click.FLOAT,
+    default=None,
+    help="Start a new file every that many seconds, segments get joined virtually",
+)
+@click.option(
+    "--segment_size",
+    type=click.INT,
+    default=None,
+    help="Start a new file at that many MiB, segments get joined virtually",
+)
+@click.option(
+    "--output_compression",
+    type=click.Choice(["lzf", "gzip"]),
+    default=None,
+    help="Compression of the hdf5-file",
+)
+@click.option(
+    "--compression_threads",
+    type=click.INT,
+    default=0,
+    help="Compress gzip-chunks in a pool of that many threads, 0 to disable",
+)
+@click.option(
+    "--sample_codec",
+    type=click.Choice(["shuffle", "delta_zigzag"]),
+    default=None,
+    help="Shrink voltage and current before compression, see sample_codec.py",
+)
+@click.option(
+    "--swmr",
+    is_flag=True,
+    help="Allow reading the output file while it is written (hdf5 swmr-mode)",
+)
+@click.option(
+    "--summary",
+    is_flag=True,
+    help="Keep min/max/mean per time-bin, costs cpu",
+)
+@click.option(
+    "--energy",
+    is_flag=True,
+    help="Keep the energy-accounting (per second and totals), costs cpu",
+)
+@click.option(
+    "--on_threshold_w",
+    type=click.FLOAT,
+    default=0.0,
+    help="Power [W] above that counts as on-time for the energy-accounting",
+)
+@click.option(
+    "--sysutil_intervall",
+    type=click.FLOAT,
+    default=None,
+    help="Seconds between two rows of system-statistics (cpu, ram, io, ...), default 1 s",
+)
+@click.option(
+    "--raw_output",
+    is_flag=True,
+    help="Write flat binary files instead of hdf5, see command 'convert'",
+)
+@click.option(
+    "--hdf5_settings",
+    type=click.Path(exists=True),
+    default=None,
+    help="yaml-file with cache- and chunk-settings for hdf5, see testbench_hdf5.py",
+)
 def harvester(
     output_path,
     algorithm,
@@ -227,6 +333,21 @@ def harvester(
     use_cal_default,
     start_time,
     warn_only,
+    pipelined,
+    buffers_per_write,
+    implicit_time,
+    segment_duration,
+    segment_size,
+    output_compression,
+    compression_threads,
+    sample_codec,
+    swmr,
+    summary,
+    energy,
+    on_threshold_w,
+    sysutil_intervall,
+    raw_output,
+    hdf5_settings,
 ):
     run_recorder(
         output_path=Path(output_path),
@@ -236,6 +357,21 @@ def harvester(
         use_cal_default=use_cal_default,
         start_time=start_time,
         warn_only=warn_only,
+        pipelined=pipelined,
+        buffers_per_write=buffers_per_write,
+        implicit_time=implicit_time,
+        segment_duration=segment_duration,
+        segment_size=None if segment_size is None else segment_size * 2**20,
+        output_compression=output_compression,
+        compression_threads=compression_threads,
+        sample_codec=sample_codec,
+        swmr=swmr,
+        summary=summary,
+        energy=energy,
+        on_threshold_w=on_threshold_w,
+        sysutil_intervall=sysutil_intervall,
+        raw_output=raw_output,
+        hdf5_settings=load_hdf5_settings(hdf5_settings),
     )
 
 
@@ -312,6 +448,96 @@ def harvester(
     is_flag=True,
     help="record / log virtual intermediate (cap-)voltage and -current (out) instead of output-voltage and -current",
 )
+@click.option(
+    "--pipelined",
+    is_flag=True,
+    help="Hand buffers back to PRU right away and write them to file in a separate thread",
+)
+@click.option(
+    "--prefetch_buffers",
+    default=0,
+    type=click.INT,
+    help="Number of input buffers to read and calibrate ahead in a separate thread, 0 to disable",
+)
+@click.option(
+    "--buffers_per_write",
+    default=10,
+    type=click.INT,
+    help="Number of buffers that get gathered for one write to file",
+)
+@click.option(
+    "--implicit_time",
+    is_flag=True,
+    help="Omit the timestamp per sample, timebase is kept per buffer",
+)
+@click.option(
+    "--segment_duration",
+    type=click.FLOAT,
+    default=None,
+    help="Start a new file every that many seconds, segments get joined virtually",
+)
+@click.option(
+    "--segment_size",
+    type=click.INT,
+    default=None,
+    help="Start a new file at that many MiB, segments get joined virtually",
+)
+@click.option(
+    "--output_compression",
+    type=click.Choice(["lzf", "gzip"]),
+    default=None,
+    help="Compression of the hdf5-file",
+)
+@click.option(
+    "--compression_threads",
+    type=click.INT,
+    default=0,
+    help="Compress gzip-chunks in a pool of that many threads, 0 to disable",
+)
+@click.option(
+    "--sample_codec",
+    type=click.Choice(["shuffle", "delta_zigzag"]),
+    default=None,
+    help="Shrink voltage and current before compression, see sample_codec.py",
+)
+@click.option(
+    "--swmr",
+    is_flag=True,
+    help="Allow reading the output file while it is written (hdf5 swmr-mode)",
+)
+@click.option(
+    "--summary",
+    is_flag=True,
+    help="Keep min/max/mean per time-bin, costs cpu",
+)
+@click.option(
+    "--energy",
+    is_flag=True,
+    help="Keep the energy-accounting (per second and totals), costs cpu",
+)
+@click.option(
+    "--on_threshold_w",
+    type=click.FLOAT,
+    default=0.0,
+    help="Power [W] above that counts as on-time for the energy-accounting",
+)
+@click.option(
+    "--sysutil_intervall",
+    type=click.FLOAT,
+    default=None,
+    help="Seconds between two rows of system-statistics (cpu, ram, io, ...), default 1 s",
+)
+@click.option(
+    "--raw_output",
+    is_flag=True,
+    help="Write flat binary files instead of hdf5, see command 'convert'",
+)
+@click.option(
+    "--hdf5_settings",
+    type=click.Path(exists=True),
+    default=None,
+    help="yaml-file with cache- and chunk-settings for hdf5, see testbench_hdf5.py",
+)
 def emulator(
     input_path,
     output_path,
@@ -330,6 +556,22 @@ def emulator(
     skip_log_current,
     skip_log_gpio,
     log_mid_voltage,
+    pipelined,
+    prefetch_buffers,
+    buffers_per_write,
+    implicit_time,
+    segment_duration,
+    segment_size,
+    output_compression,
+    compression_threads,
+    sample_codec,
+    swmr,
+    summary,
+    energy,
+    on_threshold_w,
+    sysutil_intervall,
+    raw_output,
+    hdf5_settings,
 ):
     if output_path is None:
         pl_store = None
@@ -354,6 +596,22 @@ def emulator(
         skip_log_voltage=skip_log_voltage,
         skip_log_current=skip_log_current,
         skip_log_gpio=skip_log_gpio,
+        pipelined=pipelined,
+        prefetch_buffers=prefetch_buffers,
+        buffers_per_write=buffers_per_write,
+        implicit_time=implicit_time,
+        segment_duration=segment_duration,
+        segment_size=None if segment_size is None else segment_size * 2**20,
+        output_compression=output_compression,
+        compression_threads=compression_threads,
+        sample_codec=sample_codec,
+        swmr=swmr,
+        summary=summary,
+        energy=energy,
+        on_threshold_w=on_threshold_w,
+        sysutil_intervall=sysutil_intervall,
+        raw_output=raw_output,
+        hdf5_settings=load_hdf5_settings(hdf5_settings),
     )
 
 
@@ -475,6 +733,45 @@ def make(filename, output_path):
             f.write(repr(cd))
 
 
+@cli.command(
+    short_help="Recompress a hdf5-file with gzip, chunks get compressed in parallel"
+)
+@click.argument("input_path", type=click.Path(exists=True))
+@click.argument("output_path", type=click.Path())
+@click.option("--level", "-l", type=click.IntRange(1, 9), default=1)
+@click.option(
+    "--threads",
+    "-t",
+    type=click.INT,
+    default=None,
+    help="Size of thread-pool, defaults to number of cpus",
+)
+def repack(input_path, output_path, level, threads):
+    chunk_compression.repack(Path(input_path), Path(output_path), level, threads)
+
+
+@cli.command(
+    short_help="Convert the output of --raw_output (directory *.raw) to a hdf5-file"
+)
+@click.argument("input_path", type=click.Path(exists=True, file_okay=False))
+@click.argument("output_path", type=click.Path())
+@click.option("--force_overwrite", "-f", is_flag=True, help="Overwrite existing file")
+@click.option(
+    "--output_compression",
+    "-c",
+    type=click.Choice(["lzf", "gzip"]),
+    default=None,
+    help="Compression of the hdf5-file",
+)
+def convert(input_path, output_path, force_overwrite, output_compression):
+    raw_log.convert_raw(
+        Path(input_path),
+        Path(output_path),
+        force_overwrite=force_overwrite,
+        output_compression=output_compression,
+    )
+
+
 @cli.command(short_help="Start zerorpc server")
 @click.option("--port", "-p", type=click.INT, default=4242)
 def rpc(port):
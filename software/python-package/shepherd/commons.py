@@ -16,6 +16,7 @@ MAX_GPIO_EVT_PER_BUFFER = (
 
 MSG_BUF_FROM_HOST = 0x01
 MSG_BUF_FROM_PRU = 0x02
+MSG_BUF_RANGE_FROM_HOST = 0x03  # value[0] = first index, value[1] = count
 
 MSG_DBG_ADC = 0xA0
 MSG_DBG_DAC = 0xA1
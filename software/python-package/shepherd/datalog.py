@@ -11,6 +11,7 @@ HDF5 files.
 :license: MIT, see LICENSE for more details.
 """
 
+import bisect
 import logging
 import subprocess
 import threading
@@ -21,8 +22,7 @@ import numpy as np
 from pathlib import Path
 import h5py
 from itertools import product
-from collections import namedtuple
-import psutil as psutil
+from collections import namedtuple, deque
 import serial
 import yaml
 
@@ -32,6 +32,15 @@ from shepherd.calibration import cal_channel_emu_dict
 from shepherd.calibration import cal_parameter_list
 
 from shepherd.shepherd_io import DataBuffer
+from shepherd.chunk_compression import ChunkCompressor, get_gzip_level
+from shepherd.sample_codec import codec_list, encode_delta_zigzag
+from shepherd.sample_codec import decode_delta_zigzag
+from shepherd.sysutil_sampler import SysutilSampler
+from shepherd.uart_capture import UartCapture
+from shepherd.summary import SummaryPyramid
+from shepherd.summary import EnergyMeter
+from shepherd.summary import totals_list
+from shepherd.summary import channel_list as summary_channel_list
 from shepherd.commons import GPIO_LOG_BIT_POSITIONS, MAX_GPIO_EVT_PER_BUFFER
 
 logger = logging.getLogger(__name__)
@@ -69,6 +78,48 @@ class LogWriter:
             shepherd buffer
         samplerate_sps (int): Duration of a single shepherd buffer in
             nanoseconds
+        duration (float): Expected length of the recording in seconds, the
+            iv-datasets get preallocated to fit it
+        buffers_per_write (int): iv-data of that many buffers is gathered and
+            written with one call per dataset, 1 writes every buffer directly
+        implicit_time (bool): omit the timestamp per sample (data/time), the
+            timebase is kept in the buffer-table (buffers/time, n_samples)
+            and data.attrs["sample_interval_ns"], see LogReader
+        compression_threads (int): compress iv-data chunk by chunk in a pool
+            of that many threads instead of the filter pipeline, only for
+            gzip, 0 disables it
+        sample_codec (str): storage codec for voltage and current, "shuffle"
+            adds the shuffle filter, "delta_zigzag" additionally stores the
+            difference to the preceding sample, see sample_codec.py. The
+            codec is noted in dataset.attrs["codec"], LogReader decodes it
+        swmr (bool): allow reading the file while it is written (hdf5
+            single-writer/multiple-reader, needs hdf5 >= 1.10 to read). The file
+            switches to swmr with the first buffer, attributes and config have
+            to be set before. It gets flushed every swmr_flush_intervall_ns,
+            see LogFollower
+        summary (bool): keep summaries (min, max, mean of voltage, current
+            and power) per bin of summary_bins_ns, see LogReader.get_summary().
+            Off by default, it calibrates every sample on the hot path of
+            write_buffer()
+        energy (bool): keep the energy-accounting, per second in
+            summary/energy and for the whole recording in the root-attributes
+            (see totals_list). Off by default, shares the calibration with summary
+        on_threshold_w (float): power above that counts as on-time for the
+            energy-accounting
+        sysutil_intervall (float): time between two rows of system-statistics
+            [s], None keeps sys_log_intervall_ns
+        rdcc_nbytes (int): size of the chunk-cache per dataset [byte]
+        rdcc_nslots (int): slots of the chunk-cache hash-table, preferably
+            a prime about 100 times the number of chunks fitting the cache
+        rdcc_w0 (float): preemption of fully written chunks, 0 to 1
+        mdc_nbytes (int): initial size of the metadata-cache [byte]
+        page_buf_size (int): size of the page-buffer [byte], switches the
+            file to paged allocation
+        chunk_lengths (dict): rows per chunk for the datasets of a group,
+            e.g. {"data": 20_000, "sysutil": 100}, see chunk_groups.
+            iv-data defaults to samples_per_buffer, the rest to h5py's choice
+        None keeps the default of hdf5 for the cache-settings, testbench_hdf5.py
+        helps to find better ones for a platform
 
     """
 
@@ -80,7 +131,24 @@ class LogWriter:
     # NOTE for quick and easy performance improvements: remove compression for monitor-datasets, or even group_value
     compression_algo = None
     sys_log_intervall_ns = 1 * (10**9)  # step-size is 1 s
-    sys_log_next_ns = 0
+    stage_intervall_ns = 2 * (10**9)  # staged iv-data gets written at least that often
+    monitor_intervall_ns = 1 * (10**9)  # queued monitor-entries get written that often
+    monitor_next_ns = 0
+    swmr_flush_intervall_ns = 1 * (10**9)  # readers see new data that often
+    swmr_flush_next_ns = 0
+    summary_bins_ns = [10**6, 10**8, 10**10]  # levels of 1 kHz, 10 Hz, 0.1 Hz
+    chunk_groups = [
+        "data",
+        "buffers",
+        "gpio",
+        "exceptions",
+        "uart",
+        "sysutil",
+        "dmesg",
+        "timesync",
+        "telemetry",
+        "summary",
+    ]
     uart_path = "/dev/ttyO1"
     dmesg_mon_t = None
     ptp4l_mon_t = None
@@ -106,6 +174,22 @@ class LogWriter:
         skip_current: bool = False,
         skip_gpio: bool = False,
         output_compression: Union[None, str, int] = None,
+        duration: float = None,
+        buffers_per_write: int = 1,
+        implicit_time: bool = False,
+        compression_threads: int = 0,
+        sample_codec: str = None,
+        swmr: bool = False,
+        summary: bool = False,
+        energy: bool = False,
+        on_threshold_w: float = 0.0,
+        sysutil_intervall: float = None,
+        rdcc_nbytes: int = None,
+        rdcc_nslots: int = None,
+        rdcc_w0: float = None,
+        mdc_nbytes: int = None,
+        page_buf_size: int = None,
+        chunk_lengths: dict = None,
     ):
         file_path = Path(file_path)
         if force_overwrite or not file_path.exists():
@@ -137,7 +221,29 @@ class LogWriter:
         self.datatype = self.datatype_default if (datatype is None) else datatype
 
         self.calibration_data = calibration_data
-        self.chunk_shape = (samples_per_buffer,)
+        self.chunk_lengths = {} if chunk_lengths is None else dict(chunk_lengths)
+        for group, length in self.chunk_lengths.items():
+            if group not in self.chunk_groups:
+                raise ValueError(
+                    f"chunk_lengths: group must be one of {self.chunk_groups}"
+                )
+            if length < 1:
+                raise ValueError(f"chunk_lengths: length for {group} must be positive")
+        self.chunk_shape = (self.chunk_lengths.get("data", samples_per_buffer),)
+        # passed to h5py.File, None keeps the default
+        self._file_settings = {
+            key: value
+            for key, value in [
+                ("rdcc_nbytes", rdcc_nbytes),
+                ("rdcc_nslots", rdcc_nslots),
+                ("rdcc_w0", rdcc_w0),
+                ("page_buf_size", page_buf_size),
+            ]
+            if value is not None
+        }
+        if page_buf_size is not None:
+            self._file_settings["fs_strategy"] = "page"
+        self.mdc_nbytes = mdc_nbytes
         self.samplerate_sps = int(samplerate_sps)
         self.sample_interval_ns = int(10**9 // samplerate_sps)
         self.buffer_timeseries = self.sample_interval_ns * np.arange(
@@ -145,11 +251,42 @@ class LogWriter:
         ).astype("u8")
         self._write_voltage = not skip_voltage
         self._write_current = not skip_current
-        self._write_gpio = (not skip_gpio) and ("emulat" in mode)
+        self._write_gpio = (not skip_gpio) and (self.mode == "emulator")
+        self._write_time = not implicit_time
         self._write_uart = Path(self.uart_path).exists()
 
-        if output_compression in [None, "lzf", 1]:  # order of recommendation
+        if output_compression in [None, "lzf", "gzip"] + list(range(1, 10)):
             self.compression_algo = output_compression
+        self.compression_threads = compression_threads
+        if compression_threads and get_gzip_level(self.compression_algo) is None:
+            logger.warning(
+                f"Threaded compression only supports gzip, "
+                f"{self.compression_algo} stays in filter pipeline"
+            )
+            self.compression_threads = 0
+        self._compressor = None
+        if sample_codec not in codec_list:
+            raise ValueError(f"sample_codec must be one of {codec_list}")
+        self.sample_codec = sample_codec
+        self._codec_previous = {"voltage": 0, "current": 0}
+        self.swmr = swmr
+        self._summary = None
+        if summary:
+            self._summary = SummaryPyramid(
+                [bin_ns // self.sample_interval_ns for bin_ns in self.summary_bins_ns],
+                self.sample_interval_ns,
+            )
+            self.summary_pos = [0 for _ in self.summary_bins_ns]
+        self._energy = None
+        if energy:
+            self._energy = EnergyMeter(self.sample_interval_ns, on_threshold_w)
+            self.energy_pos = 0
+        if summary or energy:
+            # summaries and energy are kept in physical units
+            self._summary_cal = {
+                channel: self.get_calibration(channel)
+                for channel in ["voltage", "current"]
+            }
 
         logger.debug(
             f"Set log-writing for voltage:     {'enabled' if self._write_voltage else 'disabled'}"
@@ -161,29 +298,72 @@ class LogWriter:
             f"Set log-writing for gpio:        {'enabled' if self._write_gpio else 'disabled'}"
         )
 
-        # initial sysutil-reading and delta-history
-        self.sysutil_io_last = np.array(psutil.disk_io_counters()[0:4])
-        self.sysutil_nw_last = np.array(psutil.net_io_counters()[0:2])
+        if sysutil_intervall is not None:
+            if sysutil_intervall <= 0:
+                raise ValueError(
+                    f"sysutil_intervall must be positive, got {sysutil_intervall}"
+                )
+            self.sys_log_intervall_ns = int(sysutil_intervall * 10**9)
+        self.sysutil_sampler = SysutilSampler(self.sys_log_intervall_ns)
         # Optimization: allowing larger more efficient resizes (before .resize() was called per element)
         # h5py v3.4 is taking 20% longer for .write_buffer() than v2.1
         # this change speeds up v3.4 by 30% (even system load drops from 90% to 70%), v2.1 by 16%
+        # lengths of the datasets are tracked here, asking h5py for .shape costs a lookup
         inc_duration = int(100)
         inc_length = int(inc_duration * samplerate_sps)
         self.data_pos = 0
-        self.data_inc = inc_length
+        # steps of whole chunks and whole buffers
+        data_step = int(np.lcm(self.chunk_shape[0], samples_per_buffer))
+        self.data_inc = self.align_to_chunks(inc_length, data_step)
+        if duration is None:
+            self.data_length = self.data_inc
+        else:
+            # one extra buffer, the last one may reach beyond duration
+            length = int(duration * samplerate_sps) + samples_per_buffer
+            self.data_length = self.align_to_chunks(length, data_step)
+        self.buffers_pos = 0
+        self.buffers_inc = self.data_inc // samples_per_buffer
+        self.buffers_length = self.data_length // samples_per_buffer
         self.gpio_pos = 0
         self.gpio_inc = MAX_GPIO_EVT_PER_BUFFER
+        self.gpio_length = 0
+
+        # staging area for write-behind of iv-data, gets flushed when full or due
+        if buffers_per_write < 1:
+            raise ValueError(
+                f"buffers_per_write must be positive, got {buffers_per_write}"
+            )
+        stage_size = (
+            buffers_per_write * samples_per_buffer if buffers_per_write > 1 else 0
+        )
+        self._stage_voltage = np.zeros(stage_size, dtype="u4")
+        self._stage_current = np.zeros(stage_size, dtype="u4")
+        self._stage_time = np.zeros(stage_size if self._write_time else 0, dtype="u8")
+        self._stage_buffer_time = np.zeros(buffers_per_write, dtype="u8")
+        self._stage_n_samples = np.zeros(buffers_per_write, dtype="u4")
+        self._stage_pos = 0
+        self._stage_n_buffers = 0
+        self._stage_deadline_ns = 0
+
+        # monitor-threads only append (timestamp, value) to these queues,
+        # writing to file stays with the thread calling write_buffer()
+        self._dmesg_queue = deque()
+        self._timesync_queue = deque()
+        self.uart_capture = UartCapture()
         self.sysutil_pos = 0
         self.sysutil_inc = inc_duration
         self.uart_pos = 0
-        self.uart_inc = 100
+        self.uart_inc = 1000
+        self.uart_data_pos = 0
+        self.uart_data_inc = 2**16
         self.dmesg_pos = 0
         self.dmesg_inc = 100
         self.xcpt_pos = 0
         self.xcpt_inc = 100
         self.timesync_pos = 0
         self.timesync_inc = inc_duration
-        # NOTE for possible optimization: align resize with chunk-size -> rely on autochunking -> inc = h5ds.chunks
+        self.telemetry_pos = 0
+        self.telemetry_inc = inc_duration
 
     def __enter__(self):
         """Initializes the structure of the HDF5 file
@@ -197,76 +377,111 @@ class LogWriter:
         the state of the GPIO pins.
 
         """
-        self._h5file = h5py.File(self.store_path, "w")
+        self._h5file = h5py.File(
+            self.store_path,
+            "w",
+            libver="latest" if self.swmr else None,
+            **self._file_settings,
+        )
+        if self.mdc_nbytes is not None:
+            mdc_config = self._h5file.id.get_mdc_config()
+            mdc_config.set_initial_size = True
+            mdc_config.initial_size = self.mdc_nbytes
+            mdc_config.min_size = min(mdc_config.min_size, self.mdc_nbytes)
+            mdc_config.max_size = max(mdc_config.max_size, self.mdc_nbytes)
+            self._h5file.id.set_mdc_config(mdc_config)
+        if self.compression_threads:
+            self._compressor = ChunkCompressor(
+                get_gzip_level(self.compression_algo), self.compression_threads
+            )
 
         # show key parameters for h5-performance
         settings = list(self._h5file.id.get_access_plist().get_cache())
         logger.debug(f"H5Py Cache_setting={settings} (_mdc, _nslots, _nbytes, _w0)")
+        logger.debug(f"H5Py MDC_size={self._h5file.id.get_mdc_size()[0]}")
 
         # Store the mode in order to allow user to differentiate harvesting vs emulation data
-        if isinstance(self._mode, str) and self._mode in self.mode_dtype_dict:
-            self.h5file.attrs["mode"] = self._mode
-
-        if (
-            isinstance(self._datatype, str)
-            and self._datatype in self.mode_dtype_dict[self.get_mode()]
-        ):
-            self.h5file["data"].attrs["datatype"] = self._datatype
+        # (mode and datatype got validated by __init__)
+        self._h5file.attrs["mode"] = self.mode
 
         # Store voltage and current samples in the data group, both are stored as 4 Byte unsigned int
         self.data_grp = self._h5file.create_group("data")
+        self.data_grp.attrs["datatype"] = self.datatype
         # the size of window_samples-attribute in harvest-data indicates ivcurves as input -> emulator uses virtual-harvester
         self.data_grp.attrs["window_samples"] = 0  # will be adjusted by .embed_config()
 
-        self.add_dataset_time(self.data_grp, self.data_inc, self.chunk_shape)
+        self.data_grp.attrs["sample_interval_ns"] = self.sample_interval_ns
+        if self._write_time:
+            self.add_dataset_time(self.data_grp, self.data_length, self.chunk_shape)
         self.data_grp.create_dataset(
             "current",
-            (self.data_inc,),
+            (self.data_length,),
             dtype="u4",
             maxshape=(None,),
             chunks=self.chunk_shape,
             compression=self.compression_algo,
+            shuffle=self.sample_codec is not None,
         )
+        if self.sample_codec is not None:
+            self.data_grp["current"].attrs["codec"] = self.sample_codec
         self.data_grp["current"].attrs["unit"] = "A"
         self.data_grp["current"].attrs[
             "description"
         ] = "current [A] = value * gain + offset"
         self.data_grp.create_dataset(
             "voltage",
-            (self.data_inc,),
+            (self.data_length,),
             dtype="u4",
             maxshape=(None,),
             chunks=self.chunk_shape,
             compression=self.compression_algo,
+            shuffle=self.sample_codec is not None,
         )
+        if self.sample_codec is not None:
+            self.data_grp["voltage"].attrs["codec"] = self.sample_codec
         self.data_grp["voltage"].attrs["unit"] = "V"
         self.data_grp["voltage"].attrs[
             "description"
         ] = "voltage [V] = value * gain + offset"
 
         for channel, parameter in product(["current", "voltage"], cal_parameter_list):
-            # TODO: not the cleanest cal-selection, maybe just hand the resulting two and rename them already to "current, voltage" in calling FN
-            cal_channel = (
-                cal_channel_hrv_dict[channel]
-                if (self.mode == "harvester")
-                else cal_channel_emu_dict[channel]
-            )
-            self.data_grp[channel].attrs[parameter] = self.calibration_data[self.mode][
-                cal_channel
-            ][parameter]
+            self.data_grp[channel].attrs[parameter] = self.get_calibration(channel)[
+                parameter
+            ]
+
+        # Create buffer-table, one entry per buffer -> timebase, gaps & jitter
+        self.buffers_grp = self._h5file.create_group("buffers")
+        self.add_dataset_time(
+            self.buffers_grp, self.buffers_length, self.get_chunks("buffers")
+        )
+        self.buffers_grp["time"].attrs["description"] = "timestamp of first sample [ns]"
+        self.buffers_grp.create_dataset(
+            "n_samples",
+            (self.buffers_length,),
+            dtype="u4",
+            maxshape=(None,),
+            chunks=self.get_chunks("buffers"),
+            compression=self.compression_algo,
+        )
+        self.buffers_grp["n_samples"].attrs["unit"] = "n"
 
         if self._write_gpio:
             # Create group for gpio data
             self.gpio_grp = self._h5file.create_group("gpio")
-            self.add_dataset_time(self.gpio_grp, self.gpio_inc)
+            self.add_dataset_time(self.gpio_grp, self.gpio_inc, self.get_chunks("gpio"))
             self.gpio_grp.create_dataset(
                 "value",
                 (self.gpio_inc,),
                 dtype="u2",
                 maxshape=(None,),
-                chunks=True,
+                chunks=self.get_chunks("gpio"),
                 compression=LogWriter.compression_algo,
             )
+            # later growth-steps in whole chunks
+            self.gpio_length = self.gpio_inc
+            self.gpio_inc = self.align_to_chunks(
+                self.gpio_inc, self.gpio_grp["value"].chunks[0]
+            )
             self.gpio_grp["value"].attrs["unit"] = "n"
             self.gpio_grp["value"].attrs["description"] = yaml.safe_dump(
                 GPIO_LOG_BIT_POSITIONS, default_flow_style=False, sort_keys=False
@@ -274,7 +489,9 @@ class LogWriter:
 
         # Create group for exception logs, entry consists of a timestamp, a message and a value
         self.xcpt_grp = self._h5file.create_group("exceptions")
-        self.add_dataset_time(self.xcpt_grp, self.xcpt_inc)
+        self.add_dataset_time(
+            self.xcpt_grp, self.xcpt_inc, self.get_chunks("exceptions")
+        )
         self.xcpt_grp.create_dataset(
             "message",
             (self.xcpt_inc,),
@@ -282,97 +499,213 @@ class LogWriter:
                 vlen=str
             ),  # TODO: switch to string_dtype() (h5py >v3.0)
             maxshape=(None,),
-            chunks=True,
+            chunks=self.get_chunks("exceptions"),
         )
         self.xcpt_grp.create_dataset(
-            "value", (self.xcpt_inc,), dtype="u4", maxshape=(None,), chunks=True
+            "value",
+            (self.xcpt_inc,),
+            dtype="u4",
+            maxshape=(None,),
+            chunks=self.get_chunks("exceptions"),
         )
         self.xcpt_grp["value"].attrs["unit"] = "n"
 
         # UART-Logger
         if self._write_uart:
             self.uart_grp = self._h5file.create_group("uart")
-            self.add_dataset_time(self.uart_grp, self.uart_inc)
-            # Every log entry consists of a timestamp and a message
+            # received bytes in one stream, every read (chunk) has a
+            # timestamp and the offset of its first byte in data
+            self.add_dataset_time(self.uart_grp, self.uart_inc, self.get_chunks("uart"))
+            self.uart_grp["time"].attrs["description"] = "receive-time of chunk [ns]"
             self.uart_grp.create_dataset(
-                "message",
+                "offset",
                 (self.uart_inc,),
-                dtype=h5py.special_dtype(vlen=bytes),
+                dtype="u8",
                 maxshape=(None,),
-                chunks=True,
+                chunks=self.get_chunks("uart"),
             )
-            self.uart_grp["message"].attrs["description"] = f"raw ascii-bytes"
+            self.uart_grp["offset"].attrs["description"] = "first byte of chunk"
+            self.uart_grp.create_dataset(
+                "data",
+                (self.uart_data_inc,),
+                dtype="u1",
+                maxshape=(None,),
+                chunks=(self.uart_data_inc,),
+                compression=self.compression_algo,
+            )
+            self.uart_grp["data"].attrs["description"] = "raw bytes"
 
         # Create sys-Logger
         self.sysutil_grp = self._h5file.create_group("sysutil")
-        self.add_dataset_time(self.sysutil_grp, self.sysutil_inc, (self.sysutil_inc,))
+        sysutil_chunk = self.chunk_lengths.get("sysutil", self.sysutil_inc)
+        self.add_dataset_time(self.sysutil_grp, self.sysutil_inc, (sysutil_chunk,))
         self.sysutil_grp["time"].attrs["unit"] = "ns"
         self.sysutil_grp["time"].attrs["description"] = "system time [ns]"
-        self.sysutil_grp.create_dataset(
-            "cpu",
-            (self.sysutil_inc,),
-            dtype="u1",
-            maxshape=(None,),
-            chunks=(self.sysutil_inc,),
-        )
-        self.sysutil_grp["cpu"].attrs["unit"] = "%"
-        self.sysutil_grp["cpu"].attrs["description"] = "cpu_util [%]"
-        self.sysutil_grp.create_dataset(
-            "ram",
-            (self.sysutil_inc, 2),
-            dtype="u1",
-            maxshape=(None, 2),
-            chunks=(self.sysutil_inc, 2),
-        )
-        self.sysutil_grp["ram"].attrs["unit"] = "%"
-        self.sysutil_grp["ram"].attrs["description"] = "ram_available [%], ram_used [%]"
-        self.sysutil_grp.create_dataset(
-            "io",
-            (self.sysutil_inc, 4),
-            dtype="u8",
-            maxshape=(None, 4),
-            chunks=(self.sysutil_inc, 4),
-        )
-        self.sysutil_grp["io"].attrs["unit"] = "n"
-        self.sysutil_grp["io"].attrs[
-            "description"
-        ] = "io_read [n], io_write [n], io_read [byte], io_write [byte]"
-        self.sysutil_grp.create_dataset(
-            "net",
-            (self.sysutil_inc, 2),
-            dtype="u8",
-            maxshape=(None, 2),
-            chunks=(self.sysutil_inc, 2),
-        )
-        self.sysutil_grp["net"].attrs["unit"] = "n"
-        self.sysutil_grp["net"].attrs["description"] = "nw_sent [byte], nw_recv [byte]"
-        self.sys_log_next_ns = int(time.time()) * (10**9)
-        self.log_sys_stats()
+        sysutil_datasets = {
+            # name: width, dtype, unit, description
+            "cpu": (None, "u1", "%", "cpu_util [%]"),
+            "ram": (2, "u1", "%", "ram_available [%], ram_used [%]"),
+            "io": (
+                4,
+                "u8",
+                "n",
+                "io_read [n], io_write [n], io_read [byte], io_write [byte]",
+            ),
+            "net": (2, "u8", "n", "nw_sent [byte], nw_recv [byte]"),
+            "cpu_core": (
+                self.sysutil_sampler.n_cores,
+                "u1",
+                "%",
+                "cpu_util per core [%]",
+            ),
+            "ctxt": (None, "u8", "n", "context switches [n]"),
+            "temp": (
+                len(self.sysutil_sampler.thermal_zones),
+                "i4",
+                "m°C",
+                "temperature per thermal zone [m°C]",
+            ),
+            "write_latency": (None, "u4", "us", "longest iv-write of LogWriter [us]"),
+        }
+        for name in self.sysutil_sampler.columns:
+            width, dtype, unit, description = sysutil_datasets[name]
+            shape = (self.sysutil_inc,) if width is None else (self.sysutil_inc, width)
+            self.sysutil_grp.create_dataset(
+                name,
+                shape,
+                dtype=dtype,
+                maxshape=(None,) + shape[1:],
+                chunks=(sysutil_chunk,) + shape[1:],
+            )
+            self.sysutil_grp[name].attrs["unit"] = unit
+            self.sysutil_grp[name].attrs["description"] = description
+        self.sysutil_sampler.start()
 
         # Create dmesg-Logger -> consists of a timestamp and a message
         self.dmesg_grp = self._h5file.create_group("dmesg")
-        self.add_dataset_time(self.dmesg_grp, self.dmesg_inc)
+        self.add_dataset_time(self.dmesg_grp, self.dmesg_inc, self.get_chunks("dmesg"))
         self.dmesg_grp.create_dataset(
             "message",
             (self.dmesg_inc,),
             dtype=h5py.special_dtype(vlen=str),
             maxshape=(None,),
-            chunks=True,
+            chunks=self.get_chunks("dmesg"),
         )
 
         # Create timesync-Logger
         self.timesync_grp = self._h5file.create_group("timesync")
-        self.add_dataset_time(self.timesync_grp, self.timesync_inc)
+        self.add_dataset_time(
+            self.timesync_grp, self.timesync_inc, self.get_chunks("timesync")
+        )
         self.timesync_grp.create_dataset(
-            "value", (self.timesync_inc, 3), dtype="i8", maxshape=(None, 3), chunks=True
+            "value",
+            (self.timesync_inc, 3),
+            dtype="i8",
+            maxshape=(None, 3),
+            chunks=self.get_chunks("timesync", 3),
         )
         self.timesync_grp["value"].attrs["unit"] = "ns, Hz, ns"
         self.timesync_grp["value"].attrs[
             "description"
         ] = "master offset [ns], s2 freq [Hz], path delay [ns]"
 
+        # Create telemetry-Logger -> one entry per buffer, see BufferTelemetry
+        self.telemetry_grp = self._h5file.create_group("telemetry")
+        self.add_dataset_time(
+            self.telemetry_grp, self.telemetry_inc, self.get_chunks("telemetry")
+        )
+        self.telemetry_grp["time"].attrs["description"] = "buffer timestamp [ns]"
+        self.telemetry_grp.create_dataset(
+            "value",
+            (self.telemetry_inc, 5),
+            dtype="i4",
+            maxshape=(None, 5),
+            chunks=self.get_chunks("telemetry", 5),
+        )
+        self.telemetry_grp["value"].attrs["unit"] = "us, us, us, us, n"
+        self.telemetry_grp["value"].attrs["description"] = (
+            "latency [us], read [us], handle [us], return [us], "
+            "buffers owned by PRU [n]"
+        )
+
+        # Create summary-pyramid -> one group per level, one row per bin
+        if self.keeps_summary:
+            self.summary_grp = self._h5file.create_group("summary")
+            summary_chunk = self.chunk_lengths.get("summary", 1000)
+        if self._summary is not None:
+            for level, bin_ns in enumerate(self.summary_bins_ns):
+                level_grp = self.summary_grp.create_group(f"level_{level}")
+                level_grp.attrs["bin_interval_ns"] = bin_ns
+                level_grp.attrs["bin_samples"] = self._summary.bin_samples[level]
+                self.add_dataset_time(level_grp, 0, (summary_chunk,))
+                level_grp["time"].attrs[
+                    "description"
+                ] = "timestamp of first sample [ns]"
+                for channel, unit in zip(summary_channel_list, ["V", "A", "W"]):
+                    level_grp.create_dataset(
+                        channel,
+                        (0, 3),
+                        dtype="f4",
+                        maxshape=(None, 3),
+                        chunks=(summary_chunk, 3),
+                        compression=self.compression_algo,
+                    )
+                    level_grp[channel].attrs["unit"] = f"{unit}, {unit}, {unit}"
+                    level_grp[channel].attrs["description"] = "min, max, mean"
+
+        # energy-accounting -> one row per second, totals get updated on exit
+        if self._energy is not None:
+            self.energy_grp = self.summary_grp.create_group("energy")
+            self.energy_grp.attrs["on_threshold_w"] = self._energy.on_threshold_w
+            self.add_dataset_time(self.energy_grp, 0, (summary_chunk,))
+            self.energy_grp["time"].attrs[
+                "description"
+            ] = "timestamp of first sample [ns]"
+            energy_datasets = {
+                # name: width, dtype, unit, description
+                "energy": (None, "f8", "J", "energy [J]"),
+                "power": (3, "f4", "W, W, W", "min, max, mean"),
+                "on_time": (None, "f4", "s", "power above on_threshold_w [s]"),
+            }
+            for name, (width, dtype, unit, description) in energy_datasets.items():
+                shape = (0,) if width is None else (0, width)
+                self.energy_grp.create_dataset(
+                    name,
+                    shape,
+                    dtype=dtype,
+                    maxshape=(None,) + shape[1:],
+                    chunks=(summary_chunk,) + shape[1:],
+                    compression=self.compression_algo,
+                )
+                self.energy_grp[name].attrs["unit"] = unit
+                self.energy_grp[name].attrs["description"] = description
+            # swmr allows no new attributes later on
+            self._h5file.attrs.update(self._energy.totals)
+
         return self
 
+    def get_chunks(self, group: str, width: int = None) -> Union[bool, tuple]:
+        """Chunk-shape for the datasets of a group, see chunk_lengths
+
+        :param group: name of group
+        :param width: second dimension of dataset, None for 1D
+        :return: True lets h5py choose, if chunk_lengths has no entry
+        """
+        if group not in self.chunk_lengths:
+            return True
+        length = self.chunk_lengths[group]
+        return (length,) if width is None else (length, width)
+
+    def get_calibration(self, channel: str) -> dict:
+        """Calibration (gain, offset) of iv-channel "voltage" or "current" """
+        # TODO: not the cleanest cal-selection, maybe just hand the resulting two and rename them already to "current, voltage" in calling FN
+        cal_channel = (
+            cal_channel_hrv_dict[channel]
+            if (self.mode == "harvester")
+            else cal_channel_emu_dict[channel]
+        )
+        return self.calibration_data[self.mode][cal_channel]
+
     def embed_config(self, data: dict) -> NoReturn:
         """
         Important Step to get a self-describing Output-File
@@ -389,26 +722,45 @@ class LogWriter:
 
     def __exit__(self, *exc):
         global monitors_end
-        monitors_end.set()
-        time.sleep(0.1)
+        self.flush_stage()
+        if self._compressor is not None:
+            self._compressor.close()
+        if any([self.dmesg_mon_t, self.ptp4l_mon_t, self.uart_mon_t]):
+            monitors_end.set()
+            time.sleep(0.1)
+        if self.uart_mon_t is not None:
+            self.uart_capture.stop()
+        self.sysutil_sampler.stop()
+        self.flush_monitors()
+        if self._summary is not None:
+            self._summary.finish()
+        if self._energy is not None:
+            self._energy.finish()
+        if self.keeps_summary:
+            self.flush_summary()
+        if self._energy is not None:
+            self._h5file.attrs.update(self._energy.totals)
+            logger.info(
+                f"[LogWriter] recorded {self._energy.totals['energy_j']:.6f} J "
+                f"in {self._energy.totals['duration_s']:.1f} s"
+            )
 
         # meantime: trim over-provisioned parts
-        self.data_grp["time"].resize(
-            (self.data_pos if self._write_current or self._write_voltage else 0,)
-        )
+        if self._write_time:
+            self.data_grp["time"].resize((self.data_pos,))
+        self.buffers_grp["time"].resize((self.buffers_pos,))
+        self.buffers_grp["n_samples"].resize((self.buffers_pos,))
         self.data_grp["voltage"].resize((self.data_pos if self._write_voltage else 0,))
         self.data_grp["current"].resize((self.data_pos if self._write_current else 0,))
         if self._write_gpio:
             self.gpio_grp["time"].resize((self.gpio_pos if self._write_gpio else 0,))
             self.gpio_grp["value"].resize((self.gpio_pos if self._write_gpio else 0,))
-        self.sysutil_grp["time"].resize((self.sysutil_pos,))
-        self.sysutil_grp["cpu"].resize((self.sysutil_pos,))
-        self.sysutil_grp["ram"].resize((self.sysutil_pos, 2))
-        self.sysutil_grp["io"].resize((self.sysutil_pos, 4))
-        self.sysutil_grp["net"].resize((self.sysutil_pos, 2))
+        for name in self.sysutil_grp:
+            self.sysutil_grp[name].resize(self.sysutil_pos, axis=0)
         if self._write_uart:
             self.uart_grp["time"].resize((self.uart_pos,))
-            self.uart_grp["message"].resize((self.uart_pos,))
+            self.uart_grp["offset"].resize((self.uart_pos,))
+            self.uart_grp["data"].resize((self.uart_data_pos,))
         self.dmesg_grp["time"].resize((self.dmesg_pos,))
         self.dmesg_grp["message"].resize((self.dmesg_pos,))
         self.xcpt_grp["time"].resize((self.xcpt_pos,))
@@ -416,6 +768,8 @@ class LogWriter:
         self.xcpt_grp["value"].resize((self.xcpt_pos,))
         self.timesync_grp["time"].resize((self.timesync_pos,))
         self.timesync_grp["value"].resize((self.timesync_pos, 3))
+        self.telemetry_grp["time"].resize((self.telemetry_pos,))
+        self.telemetry_grp["value"].resize((self.telemetry_pos, 5))
 
         if self.dmesg_mon_t is not None:
             logger.info(
@@ -430,10 +784,11 @@ class LogWriter:
         if self.uart_mon_t is not None:
             if self._write_uart:
                 logger.info(
-                    f"[LogWriter] terminate UART-Monitor  ({self.uart_grp['time'].shape[0]} entries)"
+                    f"[LogWriter] terminate UART-Monitor  ({self.uart_grp['time'].shape[0]} chunks, "
+                    f"{self.uart_data_pos} bytes, {self.uart_capture.n_dropped} dropped)"
                 )
             self.uart_mon_t = None
-        runtime = round(self.data_grp["time"].shape[0] / self.samplerate_sps, 1)
+        runtime = round(self.data_pos / self.samplerate_sps, 1)
         gpevents = self.gpio_grp["time"].shape[0] if self._write_gpio else 0
         logger.info(
             f"[LogWriter] flushing hdf5 file ({runtime} s iv-data, "
@@ -449,40 +804,34 @@ class LogWriter:
         Args:
             buffer (DataBuffer): Buffer containing IV data
         """
+        if self.swmr and not self._h5file.swmr_mode:
+            # all datasets exist by now, swmr forbids adding new ones
+            self._h5file.swmr_mode = True
+            self.swmr_flush_next_ns = time.monotonic_ns() + self.swmr_flush_intervall_ns
 
-        # First, we have to resize the corresponding datasets
-        data_end_pos = self.data_pos + len(buffer)
-        data_length = self.data_grp["time"].shape[0]
-        if data_end_pos >= data_length:
-            data_length += self.data_inc
-            self.data_grp["time"].resize((data_length,))
-            self.data_grp["voltage"].resize(
-                (data_length if self._write_voltage else 0,)
-            )
-            self.data_grp["current"].resize(
-                (data_length if self._write_current else 0,)
-            )
-
-        if self._write_voltage:
-            self.data_grp["voltage"][self.data_pos : data_end_pos] = buffer.voltage
+        if self.keeps_summary:
+            cal_voltage = self._summary_cal["voltage"]
+            cal_current = self._summary_cal["current"]
+            voltage = buffer.voltage * cal_voltage["gain"] + cal_voltage["offset"]
+            current = buffer.current * cal_current["gain"] + cal_current["offset"]
+            power = voltage * current
+            if self._summary is not None:
+                self._summary.add(buffer.timestamp_ns, voltage, current, power)
+            if self._energy is not None:
+                self._energy.add(buffer.timestamp_ns, power)
 
-        if self._write_current:
-            self.data_grp["current"][self.data_pos : data_end_pos] = buffer.current
-
-        if self._write_voltage or self._write_current:
-            self.data_grp["time"][self.data_pos : data_end_pos] = (
-                self.buffer_timeseries + buffer.timestamp_ns
-            )
-            self.data_pos = data_end_pos
+        if self._stage_voltage.size > 0:
+            self._stage_data(buffer)
+        else:
+            self._write_direct(buffer)
 
         len_edges = len(buffer.gpio_edges)
         if self._write_gpio and (len_edges > 0):
             gpio_new_pos = self.gpio_pos + len_edges
-            data_length = self.gpio_grp["time"].shape[0]
-            if gpio_new_pos >= data_length:
-                data_length += self.gpio_inc
-                self.gpio_grp["time"].resize((data_length,))
-                self.gpio_grp["value"].resize((data_length,))
+            if gpio_new_pos > self.gpio_length:
+                self.gpio_length = self.align_to_chunks(gpio_new_pos, self.gpio_inc)
+                self.gpio_grp["time"].resize((self.gpio_length,))
+                self.gpio_grp["value"].resize((self.gpio_length,))
             self.gpio_grp["time"][
                 self.gpio_pos : gpio_new_pos
             ] = buffer.gpio_edges.timestamps_ns
@@ -496,7 +845,133 @@ class LogWriter:
             expt = ExceptionRecord(int(time.time() * 1e9), warn_msg, 42)
             self.write_exception(expt)
 
-        self.log_sys_stats()
+        if time.monotonic_ns() >= self.monitor_next_ns:
+            self.monitor_next_ns = time.monotonic_ns() + self.monitor_intervall_ns
+            self.flush_monitors()
+            if self.keeps_summary:
+                self.flush_summary()
+
+        if self.swmr and (time.monotonic_ns() >= self.swmr_flush_next_ns):
+            self.swmr_flush_next_ns = time.monotonic_ns() + self.swmr_flush_intervall_ns
+            self.flush()
+
+    def _stage_data(self, buffer: DataBuffer) -> NoReturn:
+        """Copies iv-data into the staging area, writes it when full or due"""
+        n_samples = len(buffer)
+        if self._stage_pos + n_samples > self._stage_voltage.size:
+            self.flush_stage()
+        if n_samples > self._stage_voltage.size:
+            self.flush_stage()
+            self._write_direct(buffer)
+            return
+        if self._stage_pos == 0:
+            self._stage_deadline_ns = time.monotonic_ns() + self.stage_intervall_ns
+        stage_end = self._stage_pos + n_samples
+        np.copyto(self._stage_voltage[self._stage_pos : stage_end], buffer.voltage)
+        np.copyto(self._stage_current[self._stage_pos : stage_end], buffer.current)
+        if self._write_time:
+            np.add(
+                self.buffer_timeseries[:n_samples],
+                buffer.timestamp_ns,
+                out=self._stage_time[self._stage_pos : stage_end],
+                casting="unsafe",
+            )
+        self._stage_buffer_time[self._stage_n_buffers] = buffer.timestamp_ns
+        self._stage_n_samples[self._stage_n_buffers] = n_samples
+        self._stage_n_buffers += 1
+        self._stage_pos = stage_end
+        if (self._stage_n_buffers == self._stage_n_samples.size) or (
+            time.monotonic_ns() >= self._stage_deadline_ns
+        ):
+            self.flush_stage()
+
+    def flush_stage(self) -> NoReturn:
+        """Writes iv-data that is still in the staging area to file"""
+        if self._stage_n_buffers > 0:
+            self._write_data(
+                self._stage_voltage[: self._stage_pos],
+                self._stage_current[: self._stage_pos],
+                self._stage_time[: self._stage_pos] if self._write_time else None,
+                self._stage_buffer_time[: self._stage_n_buffers],
+                self._stage_n_samples[: self._stage_n_buffers],
+            )
+            self._stage_pos = 0
+            self._stage_n_buffers = 0
+
+    def flush(self) -> NoReturn:
+        """Hands everything written so far to the file, readers in swmr-mode
+        see it afterwards. Staged iv-data stays staged.
+        """
+        if self._compressor is not None:
+            # the buffer-table is already written, data has to follow
+            self._compressor.write_completed(wait=True)
+        self._h5file.flush()
+
+    def _write_direct(self, buffer: DataBuffer) -> NoReturn:
+        n_samples = len(buffer)
+        self._write_data(
+            buffer.voltage,
+            buffer.current,
+            (
+                self.buffer_timeseries[:n_samples] + buffer.timestamp_ns
+                if self._write_time
+                else None
+            ),
+            np.array([buffer.timestamp_ns], dtype="u8"),
+            np.array([n_samples], dtype="u4"),
+        )
+
+    def _write_data(
+        self,
+        voltage: np.ndarray,
+        current: np.ndarray,
+        timestamps: Union[np.ndarray, None],
+        buffer_time: np.ndarray,
+        n_samples: np.ndarray,
+    ) -> NoReturn:
+        """Writes iv-data to file, one hyperslab per dataset"""
+        if not (self._write_voltage or self._write_current):
+            return
+        ts_start_ns = time.perf_counter_ns()
+
+        # First, we have to resize the corresponding datasets
+        data_end_pos = self.data_pos + len(voltage)
+        if data_end_pos > self.data_length:
+            self.data_length = self.align_to_chunks(data_end_pos, self.data_inc)
+            if self._write_time:
+                self.data_grp["time"].resize((self.data_length,))
+            self.data_grp["voltage"].resize(
+                (self.data_length if self._write_voltage else 0,)
+            )
+            self.data_grp["current"].resize(
+                (self.data_length if self._write_current else 0,)
+            )
+
+        if self._write_voltage:
+            self._write_iv_dataset(
+                self.data_grp["voltage"], self._encode("voltage", voltage)
+            )
+
+        if self._write_current:
+            self._write_iv_dataset(
+                self.data_grp["current"], self._encode("current", current)
+            )
+
+        if self._write_time:
+            self._write_iv_dataset(self.data_grp["time"], timestamps)
+        self.data_pos = data_end_pos
+
+        buffers_end_pos = self.buffers_pos + len(buffer_time)
+        if buffers_end_pos > self.buffers_length:
+            self.buffers_length = self.align_to_chunks(
+                buffers_end_pos, self.buffers_inc
+            )
+            self.buffers_grp["time"].resize((self.buffers_length,))
+            self.buffers_grp["n_samples"].resize((self.buffers_length,))
+        self.buffers_grp["time"][self.buffers_pos : buffers_end_pos] = buffer_time
+        self.buffers_grp["n_samples"][self.buffers_pos : buffers_end_pos] = n_samples
+        self.buffers_pos = buffers_end_pos
+        self.sysutil_sampler.add_write_latency(time.perf_counter_ns() - ts_start_ns)
 
     def write_exception(self, exception: ExceptionRecord) -> NoReturn:
         """Writes an exception to the hdf5 file.
@@ -515,49 +990,26 @@ class LogWriter:
         self.xcpt_grp["message"][self.xcpt_pos] = exception.message
         self.xcpt_pos += 1
 
-    def log_sys_stats(self) -> NoReturn:
-        """captures state of system in a fixed intervall
-            https://psutil.readthedocs.io/en/latest/#cpu
-        :return: none
+    def write_telemetry(self, timestamps: np.ndarray, values: np.ndarray) -> NoReturn:
+        """Writes a block of buffer-telemetry to the hdf5 file.
+
+        Args:
+            timestamps (np.ndarray): timestamps of the buffers
+            values (np.ndarray): one row per buffer, see BufferTelemetry
         """
-        ts_now_ns = int(time.time() * (10**9))
-        if ts_now_ns >= self.sys_log_next_ns:
-            data_length = self.sysutil_grp["time"].shape[0]
-            if self.sysutil_pos >= data_length:
-                # self._h5file.flush()
-                # logger.info(f"flushed output-file @ {data_length} s")
-                data_length += self.sysutil_inc
-                self.sysutil_grp["time"].resize((data_length,))
-                self.sysutil_grp["cpu"].resize((data_length,))
-                self.sysutil_grp["ram"].resize((data_length, 2))
-                self.sysutil_grp["io"].resize((data_length, 4))
-                self.sysutil_grp["net"].resize((data_length, 2))
-            self.sys_log_next_ns += self.sys_log_intervall_ns
-            if self.sys_log_next_ns < ts_now_ns:
-                self.sys_log_next_ns = int(time.time()) * (10**9)
-            self.sysutil_grp["time"][self.sysutil_pos] = ts_now_ns
-            self.sysutil_grp["cpu"][self.sysutil_pos] = int(
-                round(psutil.cpu_percent(0))
-            )
-            mem_stat = psutil.virtual_memory()[0:3]
-            self.sysutil_grp["ram"][self.sysutil_pos, 0:2] = [
-                int(100 * mem_stat[1] / mem_stat[0]),
-                int(mem_stat[2]),
-            ]
-            sysutil_io_now = np.array(psutil.disk_io_counters()[0:4])
-            self.sysutil_grp["io"][self.sysutil_pos, :] = (
-                sysutil_io_now - self.sysutil_io_last
-            )
-            self.sysutil_io_last = sysutil_io_now
-            sysutil_nw_now = np.array(psutil.net_io_counters()[0:2])
-            self.sysutil_grp["net"][self.sysutil_pos, :] = (
-                sysutil_nw_now - self.sysutil_nw_last
-            )
-            self.sysutil_nw_last = sysutil_nw_now
-            self.sysutil_pos += 1
-            # TODO: add temp, not working: https://psutil.readthedocs.io/en/latest/#psutil.sensors_temperatures
+        data_end_pos = self.telemetry_pos + len(timestamps)
+        data_length = self.telemetry_grp["time"].shape[0]
+        if data_end_pos > data_length:
+            data_length = data_end_pos + self.telemetry_inc
+            self.telemetry_grp["time"].resize((data_length,))
+            self.telemetry_grp["value"].resize((data_length, 5))
+        self.telemetry_grp["time"][self.telemetry_pos : data_end_pos] = timestamps
+        self.telemetry_grp["value"][self.telemetry_pos : data_end_pos, :] = values
+        self.telemetry_pos = data_end_pos
 
     def start_monitors(self, uart_baudrate: int = 0) -> NoReturn:
+        global monitors_end
+        monitors_end.clear()
         self.dmesg_mon_t = threading.Thread(target=self.monitor_dmesg, daemon=True)
         self.dmesg_mon_t.start()
         self.ptp4l_mon_t = threading.Thread(target=self.monitor_ptp4l, daemon=True)
@@ -567,44 +1019,37 @@ class LogWriter:
         )
         self.uart_mon_t.start()
 
-    def monitor_uart(self, baudrate: int, poll_intervall: float = 0.01) -> NoReturn:
-        # TODO: TEST - Not final, goal: raw bytes in hdf5
-        # - uart is bytes-type -> storing in hdf5 is hard, tried 'S' and opaque-type -> failed with errors
-        # - converting is producing ValueError on certain chars, errors="backslashreplace" does not help
-        # TODO: evaluate https://pyserial.readthedocs.io/en/latest/pyserial_api.html#serial.to_bytes
+    def adopt_monitors(self, log_writer: "LogWriter") -> NoReturn:
+        """Takes over the running monitors of another writer (e.g. the
+        previous segment), their pending entries end up in the file that
+        flushes first
+        """
+        self._dmesg_queue = log_writer._dmesg_queue
+        self._timesync_queue = log_writer._timesync_queue
+        self.uart_capture = log_writer.uart_capture
+        self.dmesg_mon_t, log_writer.dmesg_mon_t = log_writer.dmesg_mon_t, None
+        self.ptp4l_mon_t, log_writer.ptp4l_mon_t = log_writer.ptp4l_mon_t, None
+        self.uart_mon_t, log_writer.uart_mon_t = log_writer.uart_mon_t, None
+
+    @property
+    def file_size(self) -> int:
+        """Current size of the hdf5-file in bytes"""
+        return self._h5file.id.get_filesize()
+
+    def monitor_uart(self, baudrate: int) -> NoReturn:
+        # pyserial only configures the port, UartCapture reads raw bytes from its fd
         if (not self._write_uart) or (not isinstance(baudrate, int)) or (baudrate == 0):
             return
         global monitors_end
         logger.debug(
             f"Will start UART-Monitor for target on '{self.uart_path}' @ {baudrate} baud"
         )
-        tevent = threading.Event()
         try:
             # open serial as non-exclusive
             with serial.Serial(self.uart_path, baudrate, timeout=0) as uart:
-                while True:
-                    if monitors_end.is_set():
-                        break
-                    if uart.in_waiting > 0:
-                        output = (
-                            uart.read(uart.in_waiting)
-                            .decode("ascii", errors="replace")
-                            .replace("\x00", "")
-                        )
-                        if len(output) > 0:
-                            data_length = self.uart_grp["time"].shape[0]
-                            if self.sysutil_pos >= data_length:
-                                data_length += self.uart_inc
-                                self.uart_grp["time"].resize((data_length,))
-                                self.uart_grp["message"].resize((data_length,))
-                            self.uart_grp["time"][self.uart_pos] = int(time.time()) * (
-                                10**9
-                            )
-                            self.uart_grp["message"][
-                                self.uart_pos
-                            ] = output  # np.void(uart_rx)
-                            self.uart_pos += 1
-                    tevent.wait(poll_intervall)  # rate limiter
+                self.uart_capture.start(uart.fileno())
+                monitors_end.wait()
+                self.uart_capture.stop()
         except ValueError as e:
             logger.error(
                 f"[UartMonitor] PySerial ValueError '{e}' - couldn't configure serial-port '{self.uart_path}' with baudrate={baudrate} -> will skip logging"
@@ -634,18 +1079,7 @@ class LogWriter:
             if monitors_end.is_set():
                 break
             line = str(line).strip()[:128]
-            try:
-                data_length = self.dmesg_grp["time"].shape[0]
-                if self.dmesg_pos >= data_length:
-                    data_length += self.dmesg_inc
-                    self.dmesg_grp["time"].resize((data_length,))
-                    self.dmesg_grp["message"].resize((data_length,))
-                self.dmesg_grp["time"][self.dmesg_pos] = int(time.time() * (10**9))
-                self.dmesg_grp["message"][self.dmesg_pos] = line
-            except OSError:
-                logger.error(
-                    f"[DmesgMonitor] Caught a Write Error for Line: [{type(line)}] {line}"
-                )
+            self._dmesg_queue.append((int(time.time() * (10**9)), line))
             tevent.wait(poll_intervall)  # rate limiter
         logger.debug(f"[DmesgMonitor] ended itself")
 
@@ -665,7 +1099,7 @@ class LogWriter:
         )
         tevent = threading.Event()
         for line in iter(proc_ptp4l.stdout.readline, ""):
-            if monitors_end:
+            if monitors_end.is_set():
                 break
             try:
                 words = str(line).split()
@@ -677,23 +1111,155 @@ class LogWriter:
                 ]
             except ValueError:
                 continue
-            try:
-                data_length = self.timesync_grp["time"].shape[0]
-                if self.timesync_pos > data_length:
-                    data_length += self.timesync_inc
-                    self.timesync_grp["time"].resize((data_length,))
-                    self.timesync_grp["values"].resize((data_length, 3))
-                self.timesync_grp["time"][self.timesync_pos] = int(
-                    time.time() * (10**9)
-                )
-                self.timesync_grp["values"][self.timesync_pos, :] = values[0:3]
-            except OSError:
-                logger.error(
-                    f"[PTP4lMonitor] Caught a Write Error for Line: [{type(line)}] {line}"
-                )
+            self._timesync_queue.append((int(time.time() * (10**9)), values[0:3]))
             tevent.wait(poll_intervall)  # rate limiter
         logger.debug(f"[PTP4lMonitor] ended itself")
 
+    def flush_monitors(self) -> NoReturn:
+        """Writes the entries queued by the monitor-threads, in bulk per group"""
+        self.dmesg_pos = self._write_queue(
+            self._dmesg_queue,
+            self.dmesg_grp,
+            ["message"],
+            self.dmesg_pos,
+            self.dmesg_inc,
+        )
+        self.timesync_pos = self._write_queue(
+            self._timesync_queue,
+            self.timesync_grp,
+            ["value"],
+            self.timesync_pos,
+            self.timesync_inc,
+        )
+        if self._write_uart:
+            self.flush_uart()
+        self.sysutil_pos = self._write_queue(
+            self.sysutil_sampler.queue,
+            self.sysutil_grp,
+            self.sysutil_sampler.columns,
+            self.sysutil_pos,
+            self.sysutil_inc,
+        )
+
+    def flush_uart(self) -> NoReturn:
+        """Appends the bytes captured from uart and their chunk-table"""
+        captured = self.uart_capture.pop()
+        n_bytes = captured["data"].shape[0]
+        n_chunks = captured["time"].shape[0]
+        if n_bytes == 0:
+            return
+        data_end_pos = self.uart_data_pos + n_bytes
+        if data_end_pos > self.uart_grp["data"].shape[0]:
+            data_length = self.align_to_chunks(data_end_pos, self.uart_data_inc)
+            self.uart_grp["data"].resize((data_length,))
+        end_pos = self.uart_pos + n_chunks
+        if end_pos > self.uart_grp["time"].shape[0]:
+            self.uart_grp["time"].resize((end_pos + self.uart_inc,))
+            self.uart_grp["offset"].resize((end_pos + self.uart_inc,))
+        self.uart_grp["data"][self.uart_data_pos : data_end_pos] = captured["data"]
+        self.uart_grp["time"][self.uart_pos : end_pos] = captured["time"]
+        self.uart_grp["offset"][self.uart_pos : end_pos] = captured[
+            "offset"
+        ] + np.uint64(self.uart_data_pos)
+        self.uart_data_pos = data_end_pos
+        self.uart_pos = end_pos
+
+    def flush_summary(self) -> NoReturn:
+        """Appends the completed bins of every summary-level and the
+        completed rows of the energy-accounting
+        """
+        if self._summary is not None:
+            for level in range(len(self.summary_bins_ns)):
+                self.summary_pos[level] = self._append_rows(
+                    self.summary_grp[f"level_{level}"],
+                    self._summary.pop(level),
+                    self.summary_pos[level],
+                )
+        if self._energy is not None:
+            self.energy_pos = self._append_rows(
+                self.energy_grp, self._energy.pop(), self.energy_pos
+            )
+
+    @staticmethod
+    def _append_rows(grp: h5py.Group, rows: dict, pos: int) -> int:
+        """Writes rows (name: values) to the datasets of grp at pos
+
+        :return: position after the appended rows
+        """
+        end_pos = pos + rows["time"].shape[0]
+        if end_pos > pos:
+            # grows exactly, there are no unwritten rows to skip for readers
+            for name, values in rows.items():
+                grp[name].resize(end_pos, axis=0)
+                grp[name][pos:end_pos] = values
+        return end_pos
+
+    @property
+    def keeps_summary(self) -> bool:
+        """True if summary-pyramid or energy-accounting run in write_buffer()"""
+        return (self._summary is not None) or (self._energy is not None)
+
+    @property
+    def energy_totals(self) -> dict:
+        """Totals of the energy-accounting so far, see totals_list"""
+        if self._energy is None:
+            return {}
+        return self._energy.totals
+
+    def _write_queue(
+        self, queue: deque, grp: h5py.Group, names: list, pos: int, inc: int
+    ) -> int:
+        """Appends (timestamp, *values)-entries to dataset time and the
+        datasets of grp given by names, in that order
+
+        :return: position after the appended entries
+        """
+        n_entries = len(queue)
+        if n_entries == 0:
+            return pos
+        # popleft() is atomic, monitors may append meanwhile
+        columns = list(zip(*[queue.popleft() for _ in range(n_entries)]))
+        end_pos = pos + n_entries
+        data_length = grp["time"].shape[0]
+        if end_pos > data_length:
+            data_length = end_pos + inc
+            for name in ["time"] + names:
+                grp[name].resize(data_length, axis=0)
+        try:
+            for name, column in zip(["time"] + names, columns):
+                if grp[name].dtype.kind == "O":
+                    grp[name][pos:end_pos] = np.array(column, dtype=object)
+                else:
+                    grp[name][pos:end_pos] = column
+        except OSError:
+            logger.error(f"[LogWriter] Caught a Write Error for {grp.name}: {columns}")
+            return pos
+        return end_pos
+
+    def _encode(self, channel: str, data: np.ndarray) -> np.ndarray:
+        """Applies the sample_codec to data that gets written at data_pos"""
+        if self.sample_codec != "delta_zigzag":
+            return data
+        encoded = encode_delta_zigzag(
+            data, self.data_pos, self._codec_previous[channel], self.chunk_shape[0]
+        )
+        self._codec_previous[channel] = data[-1]
+        return encoded
+
+    def _write_iv_dataset(self, dataset: h5py.Dataset, data: np.ndarray) -> NoReturn:
+        """Writes data at data_pos, whole chunks go through the compressor"""
+        if (self._compressor is not None) and self._compressor.is_aligned(
+            dataset, self.data_pos, len(data)
+        ):
+            self._compressor.submit(dataset, self.data_pos, data)
+        else:
+            dataset[self.data_pos : self.data_pos + len(data)] = data
+
+    @staticmethod
+    def align_to_chunks(length: int, step: int) -> int:
+        """Rounds length up to a multiple of step (e.g. the chunk-length)"""
+        return -(-length // step) * step
+
     def add_dataset_time(
         self, grp: h5py.Group, length: int, chunks: Union[bool, tuple] = True
     ) -> NoReturn:
@@ -711,3 +1277,273 @@ class LogWriter:
     def __setitem__(self, key, item):
         """Offer a convenient interface to store any relevant key-value data"""
         return self._h5file.attrs.__setitem__(key, item)
+
+
+class LogReader:
+    """Reads timebase and iv-data of files written by LogWriter
+
+    Works for both layouts, with a timestamp per sample (data/time) and with
+    implicit_time, where the timestamps get rebuilt from the buffer-table
+    (buffers/time, buffers/n_samples) and the sample-interval on demand.
+    Voltage and current get decoded according to their attribute "codec".
+
+    Args:
+        file_path (Path): Path of hdf5 file
+    """
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+
+    def __enter__(self):
+        self._h5file = h5py.File(self.file_path, "r")
+        self._load()
+        return self
+
+    def _load(self) -> NoReturn:
+        self.data_grp = self._h5file["data"]
+        self.sample_interval_ns = int(self.data_grp.attrs["sample_interval_ns"])
+        self.buffer_time = np.zeros(0, dtype="u8")
+        self.buffer_n_samples = np.zeros(0, dtype="u8")
+        # index of first sample of every buffer
+        self.buffer_offsets = np.zeros(1, dtype="u8")
+        self._load_buffers()
+
+    def _load_buffers(self) -> NoReturn:
+        """Appends the buffers that are new in the buffer-table"""
+        start = self.buffer_time.shape[0]
+        n_samples = self._h5file["buffers"]["n_samples"][start:].astype("u8")
+        # unfinished files are preallocated, unwritten rows are zero
+        unwritten = np.flatnonzero(n_samples == 0)
+        end = start + (unwritten[0] if unwritten.size > 0 else n_samples.shape[0])
+        n_samples = n_samples[: end - start]
+        self.buffer_time = np.concatenate(
+            (self.buffer_time, self._h5file["buffers"]["time"][start:end])
+        )
+        self.buffer_n_samples = np.concatenate((self.buffer_n_samples, n_samples))
+        self.buffer_offsets = np.concatenate(
+            (
+                self.buffer_offsets,
+                self.buffer_offsets[-1] + np.cumsum(n_samples, dtype="u8"),
+            )
+        )
+
+    def __exit__(self, *exc):
+        self._h5file.close()
+
+    @property
+    def implicit_time(self) -> bool:
+        return "time" not in self.data_grp
+
+    @property
+    def n_samples(self) -> int:
+        return int(self.buffer_offsets[-1])
+
+    def get_time(self, start: int = 0, end: int = None) -> np.ndarray:
+        """Timestamps of the samples in [start, end)
+
+        :param start: index of first sample
+        :param end: index after last sample, None for all samples
+        :return: timestamps in ns
+        """
+        end = self.n_samples if end is None else min(end, self.n_samples)
+        if not self.implicit_time:
+            return self.data_grp["time"][start:end]
+        index = np.arange(start, end, dtype="u8")
+        buffer = np.searchsorted(self.buffer_offsets, index, side="right") - 1
+        return (
+            self.buffer_time[buffer]
+            + (index - self.buffer_offsets[buffer]) * self.sample_interval_ns
+        )
+
+    def get_data(self, channel: str, start: int = 0, end: int = None) -> np.ndarray:
+        """Raw samples of voltage or current in [start, end)
+
+        :param channel: "voltage" or "current"
+        :param start: index of first sample
+        :param end: index after last sample, None for all samples
+        :return: raw values as u4, apply calibration from dataset.attrs
+        """
+        dataset = self.data_grp[channel]
+        end = self.n_samples if end is None else min(end, self.n_samples)
+        end = min(end, dataset.shape[0])
+        if dataset.attrs.get("codec") != "delta_zigzag":
+            return dataset[start:end]
+        chunk_length = dataset.chunks[0]
+        chunk_start = start - start % chunk_length
+        values = decode_delta_zigzag(
+            dataset[chunk_start:end], chunk_start, chunk_length
+        )
+        return values[start - chunk_start :]
+
+    def read_time(self, chunk_size: int = 10_000):
+        """Generator for timestamps, chunk by chunk
+
+        :param chunk_size: samples per chunk
+        """
+        for start in range(0, self.n_samples, chunk_size):
+            yield self.get_time(start, start + chunk_size)
+
+    def get_buffer_jitter(self) -> np.ndarray:
+        """Deviation of buffer timestamps from the expected ones
+
+        :return: start of buffer minus end of its predecessor, in ns
+        """
+        expected = (
+            self.buffer_time[:-1] + self.buffer_n_samples[:-1] * self.sample_interval_ns
+        )
+        return self.buffer_time[1:].astype("i8") - expected.astype("i8")
+
+    def find_gaps(self, tolerance_ns: int = None) -> np.ndarray:
+        """Buffers that do not continue seamlessly from their predecessor
+
+        :param tolerance_ns: accepted jitter, defaults to one sample interval
+        :return: indices of buffers that follow a gap (or overlap)
+        """
+        if tolerance_ns is None:
+            tolerance_ns = self.sample_interval_ns
+        return np.flatnonzero(np.abs(self.get_buffer_jitter()) > tolerance_ns) + 1
+
+    def get_uart(self) -> list:
+        """Bytes received from the target-uart, one entry per read
+
+        :return: list of (time [ns], bytes)
+        """
+        if "uart" not in self._h5file:
+            return []
+        uart_grp = self._h5file["uart"]
+        data = uart_grp["data"][:].tobytes()
+        offsets = list(uart_grp["offset"][:]) + [len(data)]
+        return [
+            (int(timestamp), data[offsets[index] : offsets[index + 1]])
+            for index, timestamp in enumerate(uart_grp["time"][:])
+        ]
+
+    @property
+    def energy_totals(self) -> dict:
+        """Energy and power of the whole recording, see LogWriter(on_threshold_w)"""
+        return {
+            key: float(self._h5file.attrs[key])
+            for key in totals_list
+            if key in self._h5file.attrs
+        }
+
+    def get_summary(self, t0: int = None, t1: int = None, max_points: int = 1000):
+        """Min, max and mean of voltage, current and power for plotting
+
+        Reads only the summary-pyramid, takes the finest level that covers
+        [t0, t1) with at most max_points bins. Coarser output than the
+        coarsest level gets merged from its bins.
+
+        :param t0: start in ns, None for start of recording
+        :param t1: end in ns, None for end of recording
+        :param max_points: upper limit for the returned bins
+        :return: dict with "time" [ns] of the bins and per channel an array
+            with columns min, max, mean in V, A, W
+        """
+        if "summary" not in self._h5file:
+            raise ValueError(f"{self.file_path} has no summary, see LogWriter(summary)")
+        levels = sorted(
+            [
+                grp
+                for name, grp in self._h5file["summary"].items()
+                if name.startswith("level_")
+            ],
+            key=lambda grp: grp.attrs["bin_samples"],
+        )
+        if len(levels) == 0:
+            summary = {"time": np.zeros(0, dtype="u8")}
+            for channel in summary_channel_list:
+                summary[channel] = np.zeros((0, 3))
+            return summary
+        for level_grp in levels:
+            bin_ns = int(level_grp.attrs["bin_interval_ns"])
+            time = level_grp["time"]
+            if time.shape[0] == 0:
+                continue
+            start_ns = int(time[0]) if t0 is None else t0
+            end_ns = int(time[-1]) + bin_ns if t1 is None else t1
+            if (end_ns - start_ns) / bin_ns <= max_points:
+                break
+        time = level_grp["time"]
+        # bisect reads single timestamps, the bins are sorted by time
+        start = 0 if t0 is None else max(bisect.bisect_right(time, t0) - 1, 0)
+        end = time.shape[0] if t1 is None else bisect.bisect_left(time, t1)
+        summary = {"time": time[start:end]}
+        for channel in summary_channel_list:
+            summary[channel] = level_grp[channel][start:end].astype("f8")
+
+        n_bins = summary["time"].shape[0]
+        if n_bins > max_points:
+            step = -(-n_bins // max_points)
+            index = np.arange(0, n_bins, step)
+            counts = np.diff(np.append(index, n_bins))
+            summary["time"] = summary["time"][index]
+            for channel in summary_channel_list:
+                values = summary[channel]
+                summary[channel] = np.column_stack(
+                    (
+                        np.minimum.reduceat(values[:, 0], index),
+                        np.maximum.reduceat(values[:, 1], index),
+                        np.add.reduceat(values[:, 2], index) / counts,
+                    )
+                )
+        return summary
+
+
+class LogFollower(LogReader):
+    """Follows a recording that is still written by LogWriter(swmr=True)
+
+    Offers the interface of LogReader for all data that reached the file
+    so far, refresh() and follow() pick up what was written meanwhile.
+
+    Args:
+        file_path (Path): Path of hdf5 file
+    """
+
+    def __enter__(self):
+        self._h5file = h5py.File(self.file_path, "r", libver="latest", swmr=True)
+        self._load()
+        return self
+
+    def refresh(self) -> int:
+        """Updates the view of the file to the last flush of the writer
+
+        :return: number of samples that are new
+        """
+        n_samples = self.n_samples
+        groups = [self._h5file["buffers"], self.data_grp]
+        if "summary" in self._h5file:
+            groups += list(self._h5file["summary"].values())
+        for grp in groups:
+            for dataset in grp.values():
+                dataset.refresh()
+        self._load_buffers()
+        return self.n_samples - n_samples
+
+    def follow(self, poll_intervall: float = 1.0, timeout: float = None):
+        """Generator for new samples, waits for the writer in between
+
+        Stops after timeout seconds without new samples, e.g. when the
+        recording ended. Breaking out of the loop is fine at any time.
+
+        :param poll_intervall: seconds between refreshes
+        :param timeout: seconds without new samples, None to follow forever
+        :return: (timestamps, voltage, current) for every batch of new samples
+        """
+        start = 0
+        ts_last = time.monotonic()
+        while True:
+            self.refresh()
+            end = self.n_samples
+            if end > start:
+                yield (
+                    self.get_time(start, end),
+                    self.get_data("voltage", start, end),
+                    self.get_data("current", start, end),
+                )
+                start = end
+                ts_last = time.monotonic()
+            elif (timeout is not None) and (time.monotonic() - ts_last > timeout):
+                return
+            else:
+                time.sleep(poll_intervall)
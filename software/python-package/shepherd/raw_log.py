@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.raw_log
+~~~~~
+Append-only binary output for the most demanding configurations. Buffers
+get written as they are, with one os.writev() per buffer, and a record of
+fixed size per buffer goes to an index. No hdf5 is involved while
+recording, convert_raw() builds the usual LogWriter-file afterwards, on the
+node when it is idle or on the server.
+
+Layout of the output directory (e.g. 'rec.raw' for output 'rec.h5'):
+    - meta.yaml: calibration, mode, datatype, sample-rate, attributes, config
+    - index.bin: one record of index_dtype per buffer
+    - iv.bin: per buffer voltage (u4), current (u4), gpio-timestamps (u8),
+      gpio-values (u2), padded to a multiple of alignment
+    - telemetry.bin: one record of telemetry_dtype per buffer
+    - exceptions.yaml: list of exceptions, appended entry by entry
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+import logging
+import os
+import time
+from pathlib import Path
+from typing import NoReturn
+
+import numpy as np
+import yaml
+
+from shepherd.calibration import CalibrationData
+from shepherd.datalog import ExceptionRecord
+from shepherd.datalog import LogWriter
+from shepherd.datalog import unique_path
+from shepherd.shepherd_io import DataBuffer
+from shepherd.shepherd_io import GPIOEdges
+
+logger = logging.getLogger(__name__)
+
+raw_format_version = 1
+index_dtype = np.dtype(
+    [
+        ("timestamp_ns", "<u8"),
+        ("offset", "<u8"),  # position of payload in iv.bin [byte]
+        ("n_samples", "<u4"),
+        ("n_gpio", "<u4"),
+        ("util_mean", "<f4"),
+        ("util_max", "<f4"),
+    ]
+)
+telemetry_dtype = np.dtype([("timestamp_ns", "<u8"), ("value", "<i4", (5,))])
+
+
+class RawLogWriter(object):
+    """Stores buffers in flat binary files, offers the interface of LogWriter
+
+    Payload of a buffer is handed to the kernel with one os.writev() and
+    without copying. With alignment set (e.g. 4096), every payload starts
+    at a multiple of it, the files can then be read and written with
+    O_DIRECT.
+
+    Args:
+        file_path (Path): Name of the recording, data is stored in a
+            directory with suffix ".raw" next to it
+        calibration_data (CalibrationData): Data is written as raw ADC
+            values. We need calibration data in order to convert to physical
+            units later.
+        mode (str): Indicates if this is data from harvester or emulator
+        datatype (str): see LogWriter
+        force_overwrite (bool): Overwrite existing directory with the same name
+        samples_per_buffer (int): Number of samples contained in a single
+            shepherd buffer
+        samplerate_sps (int): samples per second
+        skip_voltage (bool): store no voltage
+        skip_current (bool): store no current
+        skip_gpio (bool): store no gpio-edges
+        alignment (int): payloads get padded to a multiple of it, 0 for none
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        calibration_data: CalibrationData,
+        mode: str = None,
+        datatype: str = None,
+        force_overwrite: bool = False,
+        samples_per_buffer: int = 10_000,
+        samplerate_sps: int = 100_000,
+        skip_voltage: bool = False,
+        skip_current: bool = False,
+        skip_gpio: bool = False,
+        alignment: int = 0,
+    ):
+        file_path = Path(file_path).with_suffix(".raw")
+        if force_overwrite or not file_path.exists():
+            self.store_path = file_path
+        else:
+            base_dir = file_path.resolve().parents[0]
+            self.store_path = unique_path(base_dir / file_path.stem, file_path.suffix)
+            logger.warning(
+                f"Directory {file_path} already exists.. "
+                f"storing under {self.store_path} instead"
+            )
+        self.meta = {
+            "version": raw_format_version,
+            "mode": LogWriter.mode_default if mode is None else mode,
+            "datatype": LogWriter.datatype_default if datatype is None else datatype,
+            "calibration": calibration_data.data,
+            "samples_per_buffer": int(samples_per_buffer),
+            "samplerate_sps": int(samplerate_sps),
+            "skip_voltage": skip_voltage,
+            "skip_current": skip_current,
+            "skip_gpio": skip_gpio,
+            "alignment": int(alignment),
+            "attributes": {},
+            "config": None,
+        }
+        self._write_voltage = not skip_voltage
+        self._write_current = not skip_current
+        self._write_gpio = (not skip_gpio) and (self.meta["mode"] == "emulator")
+        self.alignment = int(alignment)
+        self._padding = np.zeros(max(self.alignment, 1), dtype="u1")
+        self._index = np.zeros(1, dtype=index_dtype)
+        self._telemetry = np.zeros(0, dtype=telemetry_dtype)
+        self.iv_pos = 0
+        self.buffers_pos = 0
+
+    def __enter__(self):
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        self._iv_fd = os.open(self.store_path / "iv.bin", flags, 0o644)
+        self._index_fd = os.open(self.store_path / "index.bin", flags, 0o644)
+        self._telemetry_fd = os.open(self.store_path / "telemetry.bin", flags, 0o644)
+        self._exception_file = open(self.store_path / "exceptions.yaml", "w")
+        self._write_meta()
+        logger.info(f"Storing raw data to '{self.store_path}'")
+        return self
+
+    def __exit__(self, *exc):
+        for fd in [self._iv_fd, self._index_fd, self._telemetry_fd]:
+            os.fsync(fd)
+            os.close(fd)
+        self._exception_file.close()
+        self._write_meta()
+        logger.info(
+            f"[RawLogWriter] closing raw files ({self.buffers_pos} buffers, "
+            f"{self.iv_pos / 2**20:.1f} MiB iv-data)"
+        )
+
+    def _write_meta(self) -> NoReturn:
+        """Replaces meta.yaml atomically"""
+        meta_path = self.store_path / "meta.yaml"
+        tmp_path = meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as meta_file:
+            yaml.safe_dump(self.meta, meta_file, sort_keys=False)
+        os.replace(tmp_path, meta_path)
+
+    def write_buffer(self, buffer: DataBuffer) -> NoReturn:
+        """Appends payload of buffer to iv.bin and its record to index.bin
+
+        Args:
+            buffer (DataBuffer): Buffer containing IV data
+        """
+        n_samples = len(buffer)
+        n_gpio = len(buffer.gpio_edges) if self._write_gpio else 0
+        payload = []
+        if self._write_voltage:
+            payload.append(np.ascontiguousarray(buffer.voltage[:n_samples], "<u4"))
+        if self._write_current:
+            payload.append(np.ascontiguousarray(buffer.current[:n_samples], "<u4"))
+        if n_gpio > 0:
+            payload.append(
+                np.ascontiguousarray(buffer.gpio_edges.timestamps_ns[:n_gpio], "<u8")
+            )
+            payload.append(
+                np.ascontiguousarray(buffer.gpio_edges.values[:n_gpio], "<u2")
+            )
+        length = sum(part.nbytes for part in payload)
+        if self.alignment > 0:
+            padding = -length % self.alignment
+            if padding > 0:
+                payload.append(self._padding[:padding])
+                length += padding
+        written = os.writev(self._iv_fd, payload)
+        if written != length:
+            raise OSError(f"short write to iv.bin ({written} of {length} byte)")
+
+        record = self._index[0]
+        record["timestamp_ns"] = buffer.timestamp_ns
+        record["offset"] = self.iv_pos
+        record["n_samples"] = n_samples
+        record["n_gpio"] = n_gpio
+        record["util_mean"] = buffer.util_mean
+        record["util_max"] = buffer.util_max
+        os.write(self._index_fd, self._index)
+        self.iv_pos += length
+        self.buffers_pos += 1
+
+        if (buffer.util_mean > 95) or (buffer.util_max > 100):
+            warn_msg = f"Pru0 Loop-Util:  mean = {buffer.util_mean} %, max = {buffer.util_max} % -> WARNING: broken real-time-condition"
+            self.write_exception(ExceptionRecord(int(time.time() * 1e9), warn_msg, 42))
+
+    def write_exception(self, exception: ExceptionRecord) -> NoReturn:
+        entry = {
+            "timestamp": int(exception.timestamp),
+            "message": str(exception.message),
+            "value": int(exception.value),
+        }
+        # every entry is a complete yaml-list item, the file stays readable
+        yaml.safe_dump([entry], self._exception_file, default_flow_style=None)
+        self._exception_file.flush()
+
+    def write_telemetry(self, timestamps: np.ndarray, values: np.ndarray) -> NoReturn:
+        if self._telemetry.shape[0] != len(timestamps):
+            self._telemetry = np.zeros(len(timestamps), dtype=telemetry_dtype)
+        self._telemetry["timestamp_ns"] = timestamps
+        self._telemetry["value"] = values
+        os.write(self._telemetry_fd, self._telemetry)
+
+    def flush_stage(self) -> NoReturn:
+        """Nothing is staged, offered for compatibility with LogWriter"""
+        pass
+
+    def embed_config(self, data: dict) -> NoReturn:
+        self.meta["config"] = data
+        self._write_meta()
+
+    def start_monitors(self, uart_baudrate: int = 0) -> NoReturn:
+        logger.warning("[RawLogWriter] monitors are not supported, skipped")
+
+    def __setitem__(self, key, item):
+        self.meta["attributes"][key] = item
+        self._write_meta()
+
+
+class RawLogReader(object):
+    """Reads the directory of a RawLogWriter, buffer by buffer
+
+    Args:
+        store_path (Path): directory with suffix ".raw"
+    """
+
+    def __init__(self, store_path: Path):
+        self.store_path = Path(store_path)
+        with open(self.store_path / "meta.yaml", "r") as meta_file:
+            self.meta = yaml.safe_load(meta_file)
+        if self.meta["version"] != raw_format_version:
+            raise ValueError(
+                f"raw format version {self.meta['version']} is not supported"
+            )
+        self.index = np.fromfile(self.store_path / "index.bin", dtype=index_dtype)
+        self.telemetry = np.fromfile(
+            self.store_path / "telemetry.bin", dtype=telemetry_dtype
+        )
+        with open(self.store_path / "exceptions.yaml", "r") as exception_file:
+            self.exceptions = [
+                ExceptionRecord(**entry)
+                for entry in (yaml.safe_load(exception_file) or [])
+            ]
+
+    def read_buffers(self):
+        """Generator for the buffers in order of writing"""
+        iv_path = self.store_path / "iv.bin"
+        if iv_path.stat().st_size == 0:
+            payload = np.zeros(0, dtype="u1")
+        else:
+            payload = np.memmap(iv_path, dtype="u1", mode="r")
+        for record in self.index:
+            pos = int(record["offset"])
+            n_samples = int(record["n_samples"])
+            n_gpio = int(record["n_gpio"])
+            arrays = {}
+            for name, dtype, length, enabled in [
+                ("voltage", "<u4", n_samples, not self.meta["skip_voltage"]),
+                ("current", "<u4", n_samples, not self.meta["skip_current"]),
+                ("gpio_time", "<u8", n_gpio, True),
+                ("gpio_value", "<u2", n_gpio, True),
+            ]:
+                if not enabled:
+                    continue
+                size = length * np.dtype(dtype).itemsize
+                arrays[name] = payload[pos : pos + size].view(dtype)
+                pos += size
+            # skipped channels are zero, LogWriter skips them as well
+            yield DataBuffer(
+                voltage=arrays.get("voltage", np.zeros(n_samples, dtype="u4")),
+                current=arrays.get("current", np.zeros(n_samples, dtype="u4")),
+                timestamp_ns=int(record["timestamp_ns"]),
+                gpio_edges=(
+                    GPIOEdges(arrays["gpio_time"], arrays["gpio_value"])
+                    if n_gpio > 0
+                    else None
+                ),
+                util_mean=float(record["util_mean"]),
+                util_max=float(record["util_max"]),
+            )
+
+
+def convert_raw(
+    input_path: Path, output_path: Path, force_overwrite: bool = False, **kwargs
+) -> Path:
+    """Builds the hdf5-file of LogWriter from the output of RawLogWriter
+
+    :param input_path: directory written by RawLogWriter
+    :param output_path: hdf5-file to create
+    :param force_overwrite: overwrite existing file
+    :param kwargs: passed to LogWriter, e.g. output_compression
+    :return: path of the hdf5-file
+    """
+    reader = RawLogReader(input_path)
+    meta = reader.meta
+    kwargs.setdefault("buffers_per_write", 10)
+    # offline there is time for the summaries
+    kwargs.setdefault("summary", True)
+    kwargs.setdefault("energy", True)
+    log_writer = LogWriter(
+        output_path,
+        CalibrationData(meta["calibration"]),
+        mode=meta["mode"],
+        datatype=meta["datatype"],
+        force_overwrite=force_overwrite,
+        samples_per_buffer=meta["samples_per_buffer"],
+        samplerate_sps=meta["samplerate_sps"],
+        skip_voltage=meta["skip_voltage"],
+        skip_current=meta["skip_current"],
+        skip_gpio=meta["skip_gpio"],
+        **kwargs,
+    )
+    # the recording is replayed, exceptions from util are already included
+    with log_writer:
+        for key, item in meta["attributes"].items():
+            log_writer[key] = item
+        if meta["config"] is not None:
+            log_writer.embed_config(meta["config"])
+        for buffer in reader.read_buffers():
+            buffer.util_mean = min(buffer.util_mean, 95)
+            buffer.util_max = min(buffer.util_max, 100)
+            log_writer.write_buffer(buffer)
+        for exception in reader.exceptions:
+            log_writer.write_exception(exception)
+        if reader.telemetry.shape[0] > 0:
+            log_writer.write_telemetry(
+                reader.telemetry["timestamp_ns"], reader.telemetry["value"]
+            )
+    logger.info(
+        f"[RawLogWriter] converted {reader.index.shape[0]} buffers "
+        f"to '{log_writer.store_path}'"
+    )
+    return log_writer.store_path
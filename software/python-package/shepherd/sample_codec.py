@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.sample_codec
+~~~~~
+Storage codecs for raw ADC samples. The 18 bit values change mostly by small
+amounts, so the difference to the preceding sample (zig-zag mapped to
+unsigned) leaves the upper bytes zero. Together with the shuffle filter of
+hdf5 the following compression (lzf, gzip) packs these bytes away.
+The first sample of every chunk is stored as is, so chunks decode
+independently of each other.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+
+import numpy as np
+
+# values for attribute "codec" of a dataset
+codec_list = [None, "shuffle", "delta_zigzag"]
+
+
+def encode_delta_zigzag(
+    values: np.ndarray, start_index: int, previous: int, chunk_length: int
+) -> np.ndarray:
+    """Encodes a section of a dataset
+
+    :param values: raw samples, below 2**31
+    :param start_index: position of first value in dataset
+    :param previous: sample before start_index, ignored at chunk-start
+    :param chunk_length: length of chunks of the dataset
+    :return: encoded samples as u4
+    """
+    values = values.astype("i8")
+    delta = np.diff(values, prepend=previous)
+    first = (-start_index) % chunk_length
+    delta[first::chunk_length] = values[first::chunk_length]
+    return ((delta << 1) ^ (delta >> 63)).astype("u4")
+
+
+def decode_delta_zigzag(
+    encoded: np.ndarray, start_index: int, chunk_length: int
+) -> np.ndarray:
+    """Decodes a section of a dataset
+
+    :param encoded: encoded samples, has to begin at a chunk
+    :param start_index: position of first value in dataset, multiple of chunk_length
+    :param chunk_length: length of chunks of the dataset
+    :return: raw samples as u4
+    """
+    if start_index % chunk_length != 0:
+        raise ValueError(
+            f"decoding has to start at a chunk (index {start_index}, "
+            f"chunk length {chunk_length})"
+        )
+    encoded = encoded.astype("i8")
+    delta = (encoded >> 1) ^ -(encoded & 1)
+    length = len(delta)
+    delta.resize(-(-length // chunk_length) * chunk_length, refcheck=False)
+    values = np.cumsum(delta.reshape(-1, chunk_length), axis=1)
+    return values.reshape(-1)[:length].astype("u4")
+
+
+class DeltaZigzagStream(object):
+    """Decodes a dataset buffer by buffer, in order and from its beginning
+
+    Readers that hand out buffers of their own length (e.g. shepherd_data)
+    do not begin at chunks, so the last value gets carried over.
+
+    Args:
+        chunk_length (int): length of chunks of the dataset
+    """
+
+    def __init__(self, chunk_length: int):
+        self.chunk_length = chunk_length
+        self.position = 0
+        self.previous = 0
+
+    def decode(self, encoded: np.ndarray) -> np.ndarray:
+        """Decodes the section that follows the previous one
+
+        :param encoded: encoded samples
+        :return: raw samples as u4
+        """
+        # continues the chunk of the previous section, rest begins at a chunk
+        first = min((-self.position) % self.chunk_length, len(encoded))
+        head = encoded[:first].astype("i8")
+        head = self.previous + np.cumsum((head >> 1) ^ -(head & 1))
+        tail = decode_delta_zigzag(encoded[first:], 0, self.chunk_length)
+        values = np.concatenate((head.astype("u4"), tail))
+        self.position += len(values)
+        if len(values) > 0:
+            self.previous = int(values[-1])
+        return values
+
+
+def decode_buffers(buffers, streams: dict):
+    """Generator that decodes the buffers of Reader.read_buffers()
+
+    :param buffers: tuples of timestamp, voltage and current
+    :param streams: DeltaZigzagStream per encoded channel ("voltage", "current")
+    """
+    for timestamp, voltage, current in buffers:
+        if "voltage" in streams:
+            voltage = streams["voltage"].decode(voltage)
+        if "current" in streams:
+            current = streams["current"].decode(current)
+        yield timestamp, voltage, current
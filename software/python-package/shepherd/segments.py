@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.segments
+~~~~~
+Long recordings get split into segments, separate hdf5-files that are closed
+after a given duration or size. Closed segments can be read and transferred
+while the recording goes on. A manifest (yaml) lists the segments with their
+time ranges and a virtual file (hdf5 VDS) presents the closed segments as
+one recording.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+
+import inspect
+import logging
+import os
+from pathlib import Path
+from typing import NoReturn, Union
+
+import h5py
+import yaml
+
+from shepherd.calibration import CalibrationData
+from shepherd.datalog import LogWriter
+from shepherd.datalog import ExceptionRecord
+from shepherd.datalog import unique_path
+from shepherd.raw_log import RawLogWriter
+from shepherd.shepherd_io import DataBuffer
+from shepherd.summary import merge_totals
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentedLogWriter(object):
+    """Writes a recording into segments, offers the interface of LogWriter
+
+    A new segment starts with the first buffer that lies segment_duration
+    past the start of the current segment, or after the current file has
+    reached segment_size. Rolling over happens between two buffers, each
+    buffer ends up in exactly one segment. Monitor-threads are handed over
+    to the new segment.
+
+    Files for output 'rec.h5': segments 'rec.0000.h5', 'rec.0001.h5', ...,
+    manifest 'rec.manifest.yaml' and the virtual file 'rec.h5'.
+
+    Args:
+        file_path (Path): Path of the virtual file, segments are stored next to it
+        calibration_data (CalibrationData): Data is written as raw ADC
+            values. We need calibration data in order to convert to physical
+            units later.
+        segment_duration (float): Seconds of iv-data per segment
+        segment_size (int): Bytes per segment, checked after each buffer
+        force_overwrite (bool): Overwrite existing file
+        **kwargs: passed to every LogWriter, duration gets limited to
+            segment_duration for preallocation. sample_codec "delta_zigzag"
+            is refused, the virtual file could not decode it
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        calibration_data: CalibrationData,
+        segment_duration: float = None,
+        segment_size: int = None,
+        force_overwrite: bool = False,
+        **kwargs,
+    ):
+        if (segment_duration is None) and (segment_size is None):
+            raise ValueError("segment_duration or segment_size has to be set")
+        if kwargs.get("sample_codec") == "delta_zigzag":
+            raise ValueError(
+                "sample_codec 'delta_zigzag' does not work with segments "
+                "(virtual file can not decode it), use 'shuffle' instead"
+            )
+        file_path = Path(file_path)
+        if force_overwrite or not file_path.exists():
+            self.store_path = file_path
+        else:
+            base_dir = file_path.resolve().parents[0]
+            self.store_path = unique_path(base_dir / file_path.stem, file_path.suffix)
+        self.manifest_path = self.store_path.with_suffix(".manifest.yaml")
+        self.calibration_data = calibration_data
+        self.segment_duration_ns = (
+            None if segment_duration is None else int(segment_duration * 10**9)
+        )
+        self.segment_size = segment_size
+        if segment_duration is not None:
+            duration = kwargs.get("duration")
+            kwargs["duration"] = (
+                segment_duration
+                if duration is None
+                else min(duration, segment_duration)
+            )
+        self._kwargs = kwargs
+        self._attrs = {}
+        self._config = None
+        self._writer: LogWriter = None
+        self.segments = []
+
+    def __enter__(self):
+        self._open_segment()
+        return self
+
+    def __exit__(self, *exc):
+        self._close_segment()
+        build_virtual_file(self.manifest_path, self.store_path)
+
+    def segment_path(self, index: int) -> Path:
+        return self.store_path.with_suffix(f".{index:04d}{self.store_path.suffix}")
+
+    def _open_segment(self) -> NoReturn:
+        path = self.segment_path(len(self.segments))
+        writer = LogWriter(
+            path, self.calibration_data, force_overwrite=True, **self._kwargs
+        )
+        writer.__enter__()
+        for key, item in self._attrs.items():
+            writer[key] = item
+        if self._config is not None:
+            writer.embed_config(self._config)
+        if self._writer is not None:
+            writer.adopt_monitors(self._writer)
+        self._writer = writer
+        self.segments.append(
+            {
+                "file": path.name,
+                "time_start_ns": None,
+                "time_end_ns": None,
+                "n_samples": 0,
+                "closed": False,
+            }
+        )
+        write_manifest(self.manifest_path, self.segments)
+        logger.info(f"[SegmentedLogWriter] started segment '{path.name}'")
+
+    def _close_segment(self) -> NoReturn:
+        self._writer.__exit__()
+        self.segments[-1].update(self._writer.energy_totals)
+        self.segments[-1]["closed"] = True
+        write_manifest(self.manifest_path, self.segments)
+
+    def _is_due(self, timestamp_ns: int) -> bool:
+        segment = self.segments[-1]
+        if segment["n_samples"] == 0:
+            return False
+        if (self.segment_duration_ns is not None) and (
+            timestamp_ns >= segment["time_start_ns"] + self.segment_duration_ns
+        ):
+            return True
+        return (self.segment_size is not None) and (
+            self._writer.file_size >= self.segment_size
+        )
+
+    def rollover(self) -> NoReturn:
+        """Closes the current segment and starts the next one"""
+        previous = self._writer
+        self._open_segment()
+        # closing after the handover keeps the monitors running
+        previous.__exit__()
+        self.segments[-2].update(previous.energy_totals)
+        self.segments[-2]["closed"] = True
+        write_manifest(self.manifest_path, self.segments)
+        build_virtual_file(self.manifest_path, self.store_path)
+
+    def write_buffer(self, buffer: DataBuffer) -> NoReturn:
+        if self._is_due(buffer.timestamp_ns):
+            self.rollover()
+        self._writer.write_buffer(buffer)
+        segment = self.segments[-1]
+        if segment["time_start_ns"] is None:
+            segment["time_start_ns"] = int(buffer.timestamp_ns)
+        segment["time_end_ns"] = int(
+            buffer.timestamp_ns + len(buffer) * self._writer.sample_interval_ns
+        )
+        segment["n_samples"] += len(buffer)
+
+    def write_exception(self, exception: ExceptionRecord) -> NoReturn:
+        self._writer.write_exception(exception)
+
+    def write_telemetry(self, timestamps, values) -> NoReturn:
+        self._writer.write_telemetry(timestamps, values)
+
+    def flush_stage(self) -> NoReturn:
+        self._writer.flush_stage()
+
+    def embed_config(self, data: dict) -> NoReturn:
+        self._config = data
+        self._writer.embed_config(data)
+
+    def start_monitors(self, uart_baudrate: int = 0) -> NoReturn:
+        self._writer.start_monitors(uart_baudrate)
+
+    def __setitem__(self, key, item):
+        self._attrs[key] = item
+        self._writer[key] = item
+
+
+def create_log_writer(
+    file_path: Path,
+    calibration_data: CalibrationData,
+    segment_duration: float = None,
+    segment_size: int = None,
+    raw_output: bool = False,
+    **kwargs,
+) -> Union[LogWriter, SegmentedLogWriter, RawLogWriter]:
+    """LogWriter for a single file, SegmentedLogWriter if a segment-limit is set,
+    RawLogWriter for raw_output (options that only concern hdf5 are dropped)
+    """
+    if raw_output:
+        parameters = inspect.signature(RawLogWriter).parameters
+        ignored = [key for key in kwargs if key not in parameters]
+        if ignored or (segment_duration is not None) or (segment_size is not None):
+            logger.info(f"[RawLogWriter] ignores hdf5-options, e.g. {ignored}")
+        kwargs = {key: item for key, item in kwargs.items() if key in parameters}
+        return RawLogWriter(file_path, calibration_data, **kwargs)
+    if (segment_duration is None) and (segment_size is None):
+        return LogWriter(file_path, calibration_data, **kwargs)
+    return SegmentedLogWriter(
+        file_path, calibration_data, segment_duration, segment_size, **kwargs
+    )
+
+
+def write_manifest(manifest_path: Path, segments: list) -> NoReturn:
+    """Replaces the manifest atomically, readers never see a partial file"""
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as manifest:
+        yaml.safe_dump({"segments": segments}, manifest, sort_keys=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def read_manifest(manifest_path: Path) -> list:
+    with open(manifest_path, "r") as manifest:
+        return yaml.safe_load(manifest)["segments"]
+
+
+def build_virtual_file(
+    manifest_path: Path, output_path: Path, closed_only: bool = True
+) -> Union[Path, None]:
+    """Creates a hdf5-file that concatenates the datasets of the segments
+
+    Numeric datasets get joined along their first axis as virtual datasets,
+    attributes are taken from the first segment, the energy-totals get
+    merged over all segments. Datasets with text are left out, they have to
+    be read per segment. Segments with codec "delta_zigzag" are refused,
+    decoding depends on the chunks of each segment.
+
+    :param manifest_path: manifest of the recording
+    :param output_path: virtual file to create, the segments have to stay
+        in the same directory
+    :param closed_only: skip the segment that is still written
+    :return: path of virtual file, None if no segment was usable
+    """
+    manifest_path = Path(manifest_path)
+    output_path = Path(output_path)
+    segments = [
+        segment
+        for segment in read_manifest(manifest_path)
+        if segment["closed"] or not closed_only
+    ]
+    if len(segments) == 0:
+        return None
+    paths = [manifest_path.parent / segment["file"] for segment in segments]
+    with h5py.File(paths[0], "r") as h5_first:
+        for channel in ["voltage", "current"]:
+            dataset = h5_first.get(f"data/{channel}")
+            if (dataset is not None) and (dataset.attrs.get("codec") == "delta_zigzag"):
+                raise ValueError(
+                    f"data/{channel} is delta_zigzag-encoded, "
+                    f"segments can not be joined virtually"
+                )
+
+    tmp_path = output_path.with_suffix(".tmp")
+    with h5py.File(tmp_path, "w") as h5_out, h5py.File(paths[0], "r") as h5_first:
+        h5_out.attrs.update(h5_first.attrs)
+        h5_out.attrs["segments"] = [segment["file"] for segment in segments]
+        sources = [h5py.File(path, "r") for path in paths]
+        try:
+            if all("energy_j" in source.attrs for source in sources):
+                h5_out.attrs.update(merge_totals([source.attrs for source in sources]))
+
+            def add_item(name: str, item) -> NoReturn:
+                if isinstance(item, h5py.Group):
+                    h5_out.require_group(name).attrs.update(item.attrs)
+                    return
+                if (item.dtype.kind not in "iuf") or (item.ndim == 0):
+                    logger.debug(f"[VirtualFile] {name} has to be read per segment")
+                    return
+                parts = [
+                    source[name]
+                    for source in sources
+                    if (name in source) and (source[name].shape[0] > 0)
+                ]
+                length = sum(part.shape[0] for part in parts)
+                if length == 0:
+                    h5_out.create_dataset(name, data=item[()], dtype=item.dtype)
+                    h5_out[name].attrs.update(item.attrs)
+                    return
+                layout = h5py.VirtualLayout(
+                    shape=(length,) + item.shape[1:], dtype=item.dtype
+                )
+                pos = 0
+                for part in parts:
+                    # relative to the virtual file, the directory can be moved
+                    source = h5py.VirtualSource(
+                        Path(part.file.filename).name,
+                        name,
+                        shape=part.shape,
+                        dtype=part.dtype,
+                    )
+                    layout[pos : pos + part.shape[0]] = source
+                    pos += part.shape[0]
+                h5_out.create_virtual_dataset(name, layout)
+                h5_out[name].attrs.update(item.attrs)
+
+            h5_first.visititems(add_item)
+        finally:
+            for source in sources:
+                source.close()
+    os.replace(tmp_path, output_path)
+    return output_path
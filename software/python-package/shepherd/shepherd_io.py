@@ -15,7 +15,6 @@ import os
 import weakref
 import logging
 import time
-import struct
 import mmap
 from pathlib import Path
 from typing import NoReturn, Union
@@ -25,14 +24,19 @@ from periphery import GPIO
 from shepherd import sysfs_interface
 from shepherd import commons
 from shepherd.calibration import CalibrationData, cal_component_list
-from shepherd.virtual_source_data import VirtualSourceConfig
+from shepherd.virtual_source_config import VirtualSourceConfig
 from shepherd.sysfs_interface import SysfsInterfaceException
-from shepherd.virtual_harvester_data import VirtualHarvesterConfig
+from shepherd.telemetry import BufferTelemetry
+from shepherd.virtual_harvester_config import VirtualHarvesterConfig
 
 logger = logging.getLogger(__name__)
 
 ID_ERR_TIMEOUT = 100
 
+# access to hardware, can be replaced (e.g. by the simulation)
+devmem_path = "/dev/mem"
+gpio_factory = GPIO
+
 gpio_pin_nums = {
     "target_pwr_sel": 31,
     "target_io_en": 60,
@@ -129,41 +133,40 @@ class SharedMem(object):
 
         self.mapped_mem = None
         self.devmem_fd = None
-
-        # With knowledge of structure of each buffer, we calculate its total size
-        self.buffer_size = (
-            # Header: 64 bit timestamp + 32 bit counter
-            8
-            + 4
-            # Actual IV data, 32 bit for each current and voltage
-            + 2 * 4 * self.samples_per_buffer
-            # GPIO edge count
-            + 4
-            # 64 bit timestamp per GPIO event
-            + 8 * commons.MAX_GPIO_EVT_PER_BUFFER
-            # 16 bit GPIO state per GPIO event
-            + 2 * commons.MAX_GPIO_EVT_PER_BUFFER  # GPIO edge data
-            # pru0 util stat
-            + 2 * 4
-        )  # NOTE: atm 4h of bug-search lead to this hardcoded piece
-        # TODO: put number in shared-mem or other way around
-
-        self.voltage_offset = 12
-        self.current_offset = 12 + 1 * 4 * self.samples_per_buffer
-        self.gpiostr_offset = 12 + 2 * 4 * self.samples_per_buffer
-        self.gpio_ts_offset = self.gpiostr_offset + 4
-        self.gpio_vl_offset = (
-            self.gpiostr_offset + 4 + 8 * commons.MAX_GPIO_EVT_PER_BUFFER
-        )
-        self.pru0_ut_offset = (
-            self.gpiostr_offset + 4 + 10 * commons.MAX_GPIO_EVT_PER_BUFFER
+        self.ring: np.ndarray = None
+
+        # Mirror of 'struct SampleBuffer' in firmware/include/commons.h (packed)
+        # NOTE: keep both definitions in sync, there is no automatic check for it
+        self.buffer_dtype = np.dtype(
+            [
+                ("len", "<u4"),
+                ("timestamp_ns", "<u8"),
+                ("values_voltage", "<u4", (self.samples_per_buffer,)),
+                ("values_current", "<u4", (self.samples_per_buffer,)),
+                (
+                    "gpio_edges",
+                    [
+                        ("idx", "<u4"),
+                        ("timestamp_ns", "<u8", (commons.MAX_GPIO_EVT_PER_BUFFER,)),
+                        ("bitmask", "<u2", (commons.MAX_GPIO_EVT_PER_BUFFER,)),
+                    ],
+                ),
+                ("pru0_max_ticks_per_sample", "<u4"),
+                ("pru0_sum_ticks_for_buffer", "<u4"),
+            ]
         )
+        self.buffer_size = self.buffer_dtype.itemsize
+        if self.n_buffers * self.buffer_size > self.size:
+            raise ValueError(
+                f"SharedMEM-Buffer is too small for {self.n_buffers} buffers "
+                f"({self.n_buffers * self.buffer_size} > {self.size} byte)"
+            )
 
         logger.debug(f"Size of 1 Buffer:\t{ self.buffer_size } byte")
 
     def __enter__(self):
         self.devmem_fd = os.open(
-            "/dev/mem", os.O_RDWR | os.O_SYNC
+            devmem_path, os.O_RDWR | os.O_SYNC
         )  # TODO: could it also be async? might be error-source
 
         self.mapped_mem = mmap.mmap(
@@ -173,18 +176,30 @@ class SharedMem(object):
             mmap.PROT_WRITE,
             offset=self.address,
         )
+        # one structured view over the whole ring, buffers are accessed by index
+        self.ring = np.frombuffer(
+            self.mapped_mem, self.buffer_dtype, count=self.n_buffers
+        )
 
         return self
 
     def __exit__(self, *args):
-        self.mapped_mem.close()
+        # the view has to be released before the mmap can be closed
+        self.ring = None
+        try:
+            self.mapped_mem.close()
+        except BufferError:
+            # DataBuffers from read_buffer() still point into the memory,
+            # the mapping gets released together with the last of them
+            logger.debug("SharedMEM-Buffer is still referenced, deferred unmap")
+        self.mapped_mem = None
         os.close(self.devmem_fd)
 
     def read_buffer(self, index: int, verbose: bool = False) -> DataBuffer:
         """Extracts buffer from shared memory.
 
         Extracts data from buffer with given index from the shared memory area
-        in RAM.
+        in RAM. The returned arrays are views into shared memory, no data is copied.
 
         :param index: (int): Buffer index. 0 <= index < n_buffers
         :param verbose: chatter-prevention, performance-critical computation saver
@@ -194,15 +209,14 @@ class SharedMem(object):
         """
         # The buffers are organized as an array in shared memory
         if not (0 <= index < self.n_buffers):
-            ValueError(
+            raise ValueError(
                 f"out of bound access (i={index}), tried reading from SharedMEM-Buffer"
             )
-        buffer_offset = index * self.buffer_size
-        self.mapped_mem.seek(buffer_offset)
+        buffer = self.ring[index]
 
-        # Read the header consisting of 12 (4 + 8 Bytes)
-        # First two values are number of samples and 64 bit timestamp
-        n_samples, buffer_timestamp = struct.unpack("=LQ", self.mapped_mem.read(12))
+        # Header consists of number of samples and 64 bit timestamp
+        n_samples = int(buffer["len"])
+        buffer_timestamp = int(buffer["timestamp_ns"])
         if verbose:
             logger.debug(
                 f"Retrieved buffer #{ index }  (@+0x{index * self.buffer_size:06X}) "
@@ -229,43 +243,17 @@ class SharedMem(object):
                 )
         self.prev_timestamp = buffer_timestamp
 
-        # Each buffer contains (n=) samples_per_buffer values. We have 2 variables
-        # (voltage and current), thus samples_per_buffer/2 samples per variable
-        voltage = np.frombuffer(
-            self.mapped_mem,
-            "=u4",
-            count=self.samples_per_buffer,
-            offset=buffer_offset + self.voltage_offset,
-        )
-        current = np.frombuffer(
-            self.mapped_mem,
-            "=u4",
-            count=self.samples_per_buffer,
-            offset=buffer_offset + self.current_offset,
+        # number of gpio events in the buffer limits the valid part of the edge-arrays
+        gpio_struct = buffer["gpio_edges"]
+        n_gpio_events = int(gpio_struct["idx"])
+        gpio_edges = GPIOEdges(
+            gpio_struct["timestamp_ns"][:n_gpio_events],
+            gpio_struct["bitmask"][:n_gpio_events],
         )
 
-        # Read the number of gpio events in the buffer
-        self.mapped_mem.seek(buffer_offset + self.gpiostr_offset)
-        (n_gpio_events,) = struct.unpack("=L", self.mapped_mem.read(4))
-
-        gpio_timestamps_ns = np.frombuffer(
-            self.mapped_mem,
-            "=u8",
-            count=n_gpio_events,
-            offset=buffer_offset + self.gpio_ts_offset,
-        )
-
-        gpio_values = np.frombuffer(
-            self.mapped_mem,
-            "=u2",
-            count=n_gpio_events,
-            offset=buffer_offset + self.gpio_vl_offset,
-        )
-        gpio_edges = GPIOEdges(gpio_timestamps_ns, gpio_values)
-
         # pru0 util
-        self.mapped_mem.seek(buffer_offset + self.pru0_ut_offset)
-        pru0_max_ticks, pru0_sum_ticks = struct.unpack("=LL", self.mapped_mem.read(8))
+        pru0_max_ticks = int(buffer["pru0_max_ticks_per_sample"])
+        pru0_sum_ticks = int(buffer["pru0_sum_ticks_for_buffer"])
         pru0_util_max = round(100 * pru0_max_ticks / 2000, 1)
         pru0_util_mean = round(100 * pru0_sum_ticks / n_samples / 2000, 1)
         if pru0_util_mean > pru0_util_max:
@@ -281,8 +269,8 @@ class SharedMem(object):
                 )
 
         return DataBuffer(
-            voltage,
-            current,
+            buffer["values_voltage"],
+            buffer["values_current"],
             buffer_timestamp,
             gpio_edges,
             pru0_util_mean,
@@ -292,14 +280,28 @@ class SharedMem(object):
     def write_buffer(self, index: int, voltage, current) -> NoReturn:
 
         if not (0 <= index < self.n_buffers):
-            ValueError(
+            raise ValueError(
                 f"out of bound access (i={index}), tried writing to SharedMEM-Buffer"
             )
-        buffer_offset = self.buffer_size * index
-        # Seek buffer location in memory and skip 12B header
-        self.mapped_mem.seek(buffer_offset + 12)
-        self.mapped_mem.write(voltage)
-        self.mapped_mem.write(current)
+        buffer = self.ring[index]
+        buffer["values_voltage"] = voltage
+        buffer["values_current"] = current
+
+    def get_write_views(self, index: int) -> (np.ndarray, np.ndarray):
+        """Writable views on the sample-arrays of a buffer in shared memory.
+
+        Allows filling the buffer in place (e.g. with out= of numpy-ufuncs)
+        instead of assembling the data first and copying it in afterwards.
+
+        :param index: (int): Buffer index. 0 <= index < n_buffers
+        :return: views for voltage and current, each with samples_per_buffer entries
+        """
+        if not (0 <= index < self.n_buffers):
+            raise ValueError(
+                f"out of bound access (i={index}), tried writing to SharedMEM-Buffer"
+            )
+        buffer = self.ring[index]
+        return buffer["values_voltage"], buffer["values_current"]
 
     def write_firmware(self, data: bytes):
         data_size = len(data)
@@ -329,6 +331,7 @@ class ShepherdIO(object):
     _instance = None
     _buffer_period = 0.1  # placeholder
     shared_mem: SharedMem = None
+    _msg_box: sysfs_interface.PruMsgBox = None
 
     def __new__(cls, *args, **kwds):
         """Implements singleton class."""
@@ -351,6 +354,7 @@ class ShepherdIO(object):
         else:
             self.component = "emulator"
         self.gpios = {}
+        self.telemetry = BufferTelemetry()
 
     def __del__(self):
         ShepherdIO._instance = None
@@ -358,7 +362,7 @@ class ShepherdIO(object):
     def __enter__(self):
         try:
             for name, pin in gpio_pin_nums.items():
-                self.gpios[name] = GPIO(pin, "out")
+                self.gpios[name] = gpio_factory(pin, "out")
 
             self._set_shepherd_pcb_power(True)
             self.set_target_io_level_conv(False)
@@ -372,6 +376,7 @@ class ShepherdIO(object):
 
             # clean up msg-channel provided by kernel module
             self._flush_msgs()
+            self._msg_box = sysfs_interface.PruMsgBox().__enter__()
 
             # Ask PRU for base address of shared mem (reserved with remoteproc)
             mem_address = sysfs_interface.get_mem_address()
@@ -425,18 +430,24 @@ class ShepherdIO(object):
     def _get_msg(self, timeout_n: int = 5):
         """Tries to retrieve formatted message from PRU0.
 
+        Blocks on the event-driven msg-box of the kernel module, so a message
+        is handled right after it arrived instead of after a sleep-cycle.
+
         Args:
             timeout_n (int): Maximum number of buffer_periods to wait for a message
                 before raising timeout exception
 
-        """  # TODO: cleanest way without exception: ask sysfs-file with current msg-count
-        for _ in range(timeout_n):
-            try:
-                return sysfs_interface.read_pru_msg()
-            except SysfsInterfaceException:
-                time.sleep(self._buffer_period)
-                continue
-        raise ShepherdIOException("Timeout waiting for message", ID_ERR_TIMEOUT)
+        """
+        try:
+            return self._msg_box.wait(timeout_n * self._buffer_period)
+        except SysfsInterfaceException:
+            raise ShepherdIOException("Timeout waiting for message", ID_ERR_TIMEOUT)
+
+    def get_msg_latency_stats(self) -> dict:
+        """Wake-up statistics of the msg-channel, see PruMsgBox.get_stats()"""
+        if self._msg_box is None:
+            return {}
+        return self._msg_box.get_stats()
 
     @staticmethod
     def _flush_msgs():
@@ -488,6 +499,18 @@ class ShepherdIO(object):
                 )
         self.set_aux_target_voltage(None, 0.0)
 
+        if self._msg_box is not None:
+            stats = self._msg_box.get_stats()
+            logger.debug(
+                f"Msg-channel received {stats['msgs']} msgs, "
+                f"wake-up latency: mean = {round(1e3 * stats['latency_mean_s'], 3)} ms, "
+                f"max = {round(1e3 * stats['latency_max_s'], 3)} ms "
+                f"({stats['notified']} notified, {stats['polled']} polled)"
+            )
+            self._msg_box.__exit__()
+            self._msg_box = None
+        self.telemetry.log_summary()
+
         if self.shared_mem is not None:
             self.shared_mem.__exit__()
 
@@ -650,7 +673,7 @@ class ShepherdIO(object):
         """
         sysfs_interface.write_virtual_harvester_settings(settings.export_for_sysfs())
 
-    def _return_buffer(self, index: int) -> NoReturn:
+    def _return_buffer(self, index: int, ts_begin_ns: int = None) -> NoReturn:
         """Returns a buffer to the PRU
 
         After reading the content of a buffer and potentially filling it with
@@ -659,8 +682,31 @@ class ShepherdIO(object):
 
         Args:
             index (int): Index of the buffer. 0 <= index < n_buffers
+            ts_begin_ns (int): perf-counter at begin of refilling the buffer,
+                for the telemetry
         """
         self._send_msg(commons.MSG_BUF_FROM_HOST, index)
+        self.telemetry.returned(index, ts_begin_ns)
+
+    def _return_buffer_range(self, index: int, count: int) -> NoReturn:
+        """Hands a consecutive range of buffers to the PRU with one message
+
+        Used to fill the ring of free buffers before start, replaces
+        count single calls of _return_buffer().
+
+        Args:
+            index (int): Index of the first buffer
+            count (int): Number of buffers, index + count <= n_buffers
+        """
+        if (index < 0) or (count < 0) or (index + count > self.n_buffers):
+            raise ShepherdIOException(
+                f"Invalid buffer-range {index} + {count} for {self.n_buffers} buffers"
+            )
+        if count == 0:
+            return
+        self._send_msg(commons.MSG_BUF_RANGE_FROM_HOST, [index, count])
+        for idx in range(index, index + count):
+            self.telemetry.returned(idx)
 
     def get_buffer(self, timeout_n: int = 10, verbose: bool = False):
         """Reads a data buffer from shared memory.
@@ -685,12 +731,15 @@ class ShepherdIO(object):
             # logger.debug(f"received msg type {msg_type}")
 
             if msg_type == commons.MSG_BUF_FROM_PRU:
-                ts_start = time.time()
+                ts_receive_ns = time.time_ns()
+                ts_start = time.perf_counter_ns()
                 buf = self.shared_mem.read_buffer(value, verbose)
+                read_ns = time.perf_counter_ns() - ts_start
+                self.telemetry.received(value, buf.timestamp_ns, ts_receive_ns, read_ns)
                 if verbose:
                     logger.debug(
                         f"Processing buffer #{ value } from shared memory took "
-                        f"{ round(1e3 * (time.time()-ts_start), 2) } ms"
+                        f"{ round(read_ns / 1e6, 2) } ms"
                     )
                 return value, buf
 
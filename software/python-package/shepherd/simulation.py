@@ -0,0 +1,550 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.simulation
+~~~~~
+Software replacement for kernel module and PRUs, allows running recorder
+and emulator on machines without shepherd hardware (CI, profiling).
+Shared memory is an anonymous memory-file, the message box and state are
+in-process handles and the remaining sysfs attributes live in a temporary
+directory. A thread plays the role of the PRUs and produces a buffer
+every buffer_period_ns, either from the virtual harvester / source models
+or by replaying a recording.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+
+import collections
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import NoReturn, Union
+
+import numpy as np
+from shepherd_data import Reader as ShpReader
+
+from shepherd import commons
+from shepherd import shepherd_io
+from shepherd import sysfs_interface
+from shepherd.calibration import CalibrationData
+from shepherd.calibration import cal_channel_hrv_dict
+from shepherd.calibration_default import RAW_MAX_ADC
+from shepherd.virtual_converter_model import KernelConverterStruct
+from shepherd.virtual_converter_model import PruCalibration
+from shepherd.virtual_converter_model import VirtualConverterModel
+from shepherd.virtual_harvester_model import KernelHarvesterStruct
+from shepherd.virtual_harvester_model import VirtualHarvesterModel
+
+logger = logging.getLogger(__name__)
+
+# environment-variable that activates the simulation for the CLI, see create_backend()
+env_simulate = "SHEPHERD_SIMULATE"
+
+# synthetic pv-cell as harvesting-source (diode-model)
+diode_voc_uV = 2_500_000
+diode_isc_nA = 10_000_000
+diode_vt_uV = 150_000
+
+
+class SimulatedGPIO(object):
+    """Stand-in for periphery.GPIO, only remembers the pin-state"""
+
+    def __init__(self, pin: int, direction: str):
+        self.pin = pin
+        self.direction = direction
+        self.value = False
+
+    def write(self, value: bool) -> NoReturn:
+        self.value = bool(value)
+
+    def read(self) -> bool:
+        return self.value
+
+    def close(self) -> NoReturn:
+        pass
+
+
+class SimulatedSettings(object):
+    """Settings as the kernel module got them, parsed from the sysfs-file
+
+    Offers export_for_sysfs() like the config-classes, so the kernel-structs
+    of the models can be built from what the host actually sent
+    """
+
+    def __init__(self, path: Path):
+        self.values = []
+        for line in path.read_text().splitlines():
+            parts = [int(part) for part in line.split()]
+            if len(parts) == 1:
+                self.values.append(parts[0])
+            elif len(parts) > 1:
+                self.values.append(parts)
+
+    def export_for_sysfs(self) -> list:
+        return self.values
+
+
+class SimulatedHandle(object):
+    """Base for in-process replacements of the hot sysfs-handles"""
+
+    def __init__(self, pru, attribute: str):
+        self.pru = pru
+        self.attribute = attribute
+
+    def open(self) -> NoReturn:
+        pass
+
+    def close(self) -> NoReturn:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def wait_notify(self, timeout: float) -> bool:
+        time.sleep(timeout)
+        return False
+
+
+class SimulatedMsgBox(SimulatedHandle):
+    """pru_msg_box - every read pops one message of the PRU"""
+
+    def read(self) -> bytes:
+        return self.pru.pop_msg()
+
+    def write(self, data: bytes) -> int:
+        values = [int(value) for value in bytes(data).split()]
+        self.pru.put_msg(values[0], values[1:])
+        return len(data)
+
+    def wait_notify(self, timeout: float) -> bool:
+        return self.pru.wait_msg(timeout)
+
+
+class SimulatedMsgNotifyTime(SimulatedHandle):
+    """pru_msg_notify_ns - time of the latest message of the PRU"""
+
+    def read(self) -> bytes:
+        return str(self.pru.msg_notify_ns).encode()
+
+
+class SimulatedState(SimulatedHandle):
+    """state - reports and commands the state of the PRU"""
+
+    def read(self) -> bytes:
+        return self.pru.state.encode()
+
+    def write(self, data: bytes) -> int:
+        self.pru.command(bytes(data).decode().strip())
+        return len(data)
+
+    def wait_notify(self, timeout: float) -> bool:
+        return self.pru.wait_state(timeout)
+
+
+class SimulatedPru(object):
+    """Behaves like kernel module and PRUs for the host-side of the buffer-protocol
+
+    Buffers returned by the host are filled one per buffer-period and
+    handed back with MSG_BUF_FROM_PRU. In harvesting-mode the data comes from
+    a synthetic pv-cell, sampled like the harvester-settings demand, in
+    emulation-mode the virtual source model processes the input that the
+    host put into the buffer. The models are evaluated every
+    `model_stride` samples and held in between, to keep up with real time.
+    With `input_path` the raw data of that recording is replayed instead.
+
+    Args:
+        shared_mem (SharedMem): entered shared memory, same area as the host uses
+        buffer_period_ns (int): time between two buffers
+        input_path (Path): optional recording to replay
+        model_stride (int): samples per evaluation of the models
+        load_current_nA (int): constant current drawn by the simulated target
+    """
+
+    def __init__(
+        self,
+        shared_mem: shepherd_io.SharedMem,
+        buffer_period_ns: int,
+        input_path: Path = None,
+        model_stride: int = 100,
+        load_current_nA: int = 1_000_000,
+    ):
+        self.shared_mem = shared_mem
+        self.buffer_period_ns = buffer_period_ns
+        self.input_path = input_path
+        self.model_stride = model_stride
+        self.load_current_nA = load_current_nA
+        self.calibration = CalibrationData.from_default()
+
+        self.state = "idle"
+        self._start_time = None
+        self._ts_next_ns = 0
+        self._free_buffers = collections.deque()
+        self._msgs_to_host = collections.deque()
+        self._msgs_from_host = collections.deque()
+        self._msg_event = threading.Event()
+        self.msg_notify_ns = 0
+        self._state_event = threading.Event()
+        self._host_event = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._replay = None
+        self._replay_reader = None
+        self._harvester = None
+        self._converter = None
+
+    def __enter__(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="SimulatedPru", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._host_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close_replay()
+
+    # host-side interface (called by the handles)
+
+    def pop_msg(self) -> bytes:
+        try:
+            msg_type, value = self._msgs_to_host.popleft()
+        except IndexError:
+            return b""
+        return f"{msg_type} {value} 0".encode()
+
+    def wait_msg(self, timeout: float) -> bool:
+        notified = self._msg_event.wait(timeout)
+        self._msg_event.clear()
+        return notified
+
+    def wait_state(self, timeout: float) -> bool:
+        notified = self._state_event.wait(timeout)
+        self._state_event.clear()
+        return notified
+
+    def put_msg(self, msg_type: int, values: list) -> NoReturn:
+        self._msgs_from_host.append((msg_type, values))
+        self._host_event.set()
+
+    def command(self, cmd: str) -> NoReturn:
+        with self._lock:
+            if cmd == "stop":
+                # like a pru-reset: buffers and messages are lost
+                self._set_state("idle")
+                self._free_buffers.clear()
+                self._msgs_to_host.clear()
+                self._msgs_from_host.clear()
+                self._close_replay()
+            elif self.state != "idle":
+                raise OSError(f"simulated PRU can't start from state {self.state}")
+            elif cmd == "start":
+                self._start_time = time.time()
+                self._set_state("armed")
+            else:
+                self._start_time = float(cmd)
+                self._set_state("armed")
+        self._host_event.set()
+
+    # PRU-side
+
+    def _set_state(self, state: str) -> NoReturn:
+        self.state = state
+        self._state_event.set()
+
+    def _send(self, msg_type: int, value: int) -> NoReturn:
+        self._msgs_to_host.append((msg_type, value))
+        self.msg_notify_ns = time.monotonic_ns()
+        self._msg_event.set()
+
+    def _run(self) -> NoReturn:
+        while not self._stop.is_set():
+            with self._lock:
+                self._process_host_msgs()
+                if (self.state == "armed") and (time.time() >= self._start_time):
+                    self._begin()
+                if self.state == "running":
+                    ts_due_ns = self._ts_next_ns + self.buffer_period_ns
+                    if time.time_ns() >= ts_due_ns:
+                        self._produce()
+                        continue
+                    timeout = (ts_due_ns - time.time_ns()) / 1e9
+                else:
+                    timeout = 0.01
+            self._host_event.wait(max(timeout, 0))
+            self._host_event.clear()
+
+    def _process_host_msgs(self) -> NoReturn:
+        while len(self._msgs_from_host) > 0:
+            msg_type, values = self._msgs_from_host.popleft()
+            if msg_type == commons.MSG_BUF_FROM_HOST:
+                self._free_buffers.append(values[0])
+            elif msg_type == commons.MSG_BUF_RANGE_FROM_HOST:
+                self._free_buffers.extend(range(values[0], values[0] + values[1]))
+            else:
+                self._send(commons.MSG_DEP_ERR_INVLDCMD, msg_type)
+
+    def _begin(self) -> NoReturn:
+        mode = sysfs_interface.get_mode()
+        self._ts_next_ns = int(self._start_time * 1e9)
+        if self.input_path is not None:
+            self._replay_reader = ShpReader(self.input_path, verbose=False)
+            self._replay_reader.__enter__()
+            self._replay = self._replay_reader.read_buffers(is_raw=True)
+        elif mode == "harvester":
+            settings = SimulatedSettings(
+                sysfs_interface.sysfs_path / "virtual_harvester_settings"
+            )
+            self._harvester = VirtualHarvesterModel(KernelHarvesterStruct(settings))
+        elif mode == "emulator":
+            settings = SimulatedSettings(
+                sysfs_interface.sysfs_path / "virtual_converter_settings"
+            )
+            self._converter = VirtualConverterModel(
+                KernelConverterStruct(settings), PruCalibration(self.calibration)
+            )
+            settings = SimulatedSettings(
+                sysfs_interface.sysfs_path / "virtual_harvester_settings"
+            )
+            self._harvester = VirtualHarvesterModel(KernelHarvesterStruct(settings))
+        else:
+            raise OSError(f"simulated PRU does not support mode '{mode}'")
+        self._set_state("running")
+        logger.debug(f"simulated PRU started in {mode}-mode")
+
+    def _close_replay(self) -> NoReturn:
+        if self._replay_reader is not None:
+            self._replay_reader.__exit__()
+            self._replay_reader = None
+            self._replay = None
+
+    def _produce(self) -> NoReturn:
+        timestamp_ns = self._ts_next_ns
+        self._ts_next_ns += self.buffer_period_ns
+        if len(self._free_buffers) < 1:
+            self._send(commons.MSG_DEP_ERR_NOFREEBUF, 0)
+            return
+        index = self._free_buffers.popleft()
+        buffer = self.shared_mem.ring[index]
+        voltage = buffer["values_voltage"]
+        current = buffer["values_current"]
+        if self._replay is not None:
+            self._fill_replay(voltage, current)
+        elif self._converter is not None:
+            self._fill_emulation(voltage, current)
+        else:
+            self._fill_harvest(voltage, current)
+        n_samples = voltage.size
+        buffer["len"] = n_samples
+        buffer["timestamp_ns"] = timestamp_ns
+        buffer["gpio_edges"]["idx"] = 0
+        buffer["pru0_max_ticks_per_sample"] = 200
+        buffer["pru0_sum_ticks_for_buffer"] = 100 * n_samples
+        self._send(commons.MSG_BUF_FROM_PRU, index)
+
+    def _fill_replay(self, voltage: np.ndarray, current: np.ndarray) -> NoReturn:
+        try:
+            _, dsv, dsc = next(self._replay)
+        except StopIteration:
+            self._replay = self._replay_reader.read_buffers(is_raw=True)
+            _, dsv, dsc = next(self._replay)
+        voltage[: dsv.size] = dsv
+        current[: dsc.size] = dsc
+
+    def _fill_harvest(self, voltage: np.ndarray, current: np.ndarray) -> NoReturn:
+        cfg = self._harvester._cfg
+        if cfg.window_size > 1:
+            # ivcurve-sweep like the adc-harvest-routine produces it
+            steps = np.arange(voltage.size) % cfg.window_size
+            voltage_uV = np.minimum(
+                cfg.voltage_min_uV + steps * cfg.voltage_step_uV, cfg.voltage_max_uV
+            )
+        else:
+            voltage_uV = np.full(voltage.size, cfg.voltage_uV)
+        voltage_uV = voltage_uV.astype(float)
+        current_nA = diode_isc_nA * (
+            1 - np.exp((voltage_uV - diode_voc_uV) / diode_vt_uV)
+        )
+        current_nA = np.clip(current_nA, 0, cfg.current_limit_nA)
+        if (cfg.window_size > 1) and (cfg.algorithm >= VirtualHarvesterModel.HRV_CV):
+            # algorithms like mppt pick their operating point from the curve,
+            # the model sees one full sweep per block and its result is held
+            window = cfg.window_size
+            block = window * -(-self.model_stride // window)
+            for pos in range(0, voltage.size, block):
+                for v_uV, c_nA in zip(
+                    voltage_uV[pos : pos + window], current_nA[pos : pos + window]
+                ):
+                    v_set, c_set = self._harvester.iv_sample(int(v_uV), int(c_nA))
+                voltage_uV[pos : pos + block] = v_set
+                current_nA[pos : pos + block] = c_set
+        voltage[:] = self._to_raw(
+            "harvester", cal_channel_hrv_dict, "voltage", voltage_uV / 1e6
+        )
+        current[:] = self._to_raw(
+            "harvester", cal_channel_hrv_dict, "current", current_nA / 1e9
+        )
+
+    def _fill_emulation(self, voltage: np.ndarray, current: np.ndarray) -> NoReturn:
+        cal = self.calibration
+        current_raw = cal.convert_value_to_raw(
+            "emulator", "adc_current", self.load_current_nA * 1e-9
+        )
+        for pos in range(0, voltage.size, self.model_stride):
+            # input from host is in uV and nA
+            v_inp_uV, i_inp_nA = self._harvester.iv_sample(
+                int(voltage[pos]), int(current[pos])
+            )
+            self._converter.calc_inp_power(v_inp_uV, i_inp_nA)
+            self._converter.calc_out_power(current_raw)
+            self._converter.update_cap_storage()
+            voltage_raw = self._converter.update_states_and_output()
+            voltage[pos : pos + self.model_stride] = voltage_raw
+        current[:] = current_raw
+
+    def _to_raw(self, component: str, channels: dict, name: str, values: np.ndarray):
+        cal = self.calibration.data[component][channels[name]]
+        raw = (values - cal["offset"]) / cal["gain"]
+        return np.clip(raw, 0, RAW_MAX_ADC)
+
+
+class SimulatedBackend(object):
+    """Replaces kernel module, PRUs, shared memory and GPIOs while active
+
+    Everything using sysfs_interface and ShepherdIO (Recorder, Emulator,
+    run_recorder(), run_emulator()) runs unchanged inside this context.
+
+    Args:
+        input_path (Path): optional recording that gets replayed
+        samples_per_buffer (int): samples per buffer
+        n_buffers (int): number of buffers in shared memory
+        buffer_period_ns (int): duration of one buffer
+        model_stride (int): samples per evaluation of the models
+    """
+
+    def __init__(
+        self,
+        input_path: Union[Path, str] = None,
+        samples_per_buffer: int = 10_000,
+        n_buffers: int = 64,
+        buffer_period_ns: int = 100_000_000,
+        model_stride: int = 100,
+    ):
+        self.input_path = None if input_path is None else Path(input_path)
+        self.samples_per_buffer = samples_per_buffer
+        self.n_buffers = n_buffers
+        self.buffer_period_ns = buffer_period_ns
+        self.model_stride = model_stride
+        self.pru = None
+        self._tmp_dir = None
+        self._mem_fd = None
+        self._shared_mem = None
+        self._hooks = {}
+
+    def __enter__(self):
+        # the layout of one buffer is defined by SharedMem
+        buffer_size = shepherd_io.SharedMem(
+            0, 2**40, 1, self.samples_per_buffer
+        ).buffer_size
+        mem_size = self.n_buffers * buffer_size
+        self._mem_fd = os.memfd_create("shepherd_shared_mem")
+        os.ftruncate(self._mem_fd, mem_size)
+
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="shepherd_sysfs_")
+        path = Path(self._tmp_dir.name)
+        (path / "memory").mkdir()
+        attributes = {
+            "mode": "harvester",
+            "n_buffers": self.n_buffers,
+            "samples_per_buffer": self.samples_per_buffer,
+            "buffer_period_ns": self.buffer_period_ns,
+            "memory/address": 0,
+            "memory/size": mem_size,
+            "dac_auxiliary_voltage_raw": 0,
+            "calibration_settings": "",
+            "virtual_converter_settings": "",
+            "virtual_harvester_settings": "",
+        }
+        for attribute, value in attributes.items():
+            (path / attribute).write_text(str(value))
+
+        hooks = {
+            (sysfs_interface, "sysfs_path"): path,
+            (sysfs_interface, "handle_factory"): self._create_handle,
+            (shepherd_io, "devmem_path"): f"/proc/self/fd/{self._mem_fd}",
+            (shepherd_io, "gpio_factory"): SimulatedGPIO,
+        }
+        sysfs_interface.close_handles()
+        for (module, name), value in hooks.items():
+            self._hooks[(module, name)] = getattr(module, name)
+            setattr(module, name, value)
+
+        self._shared_mem = shepherd_io.SharedMem(
+            0, mem_size, self.n_buffers, self.samples_per_buffer
+        ).__enter__()
+        self.pru = SimulatedPru(
+            self._shared_mem,
+            self.buffer_period_ns,
+            self.input_path,
+            self.model_stride,
+        ).__enter__()
+        logger.info(f"simulated shepherd-backend is active (sysfs in {path})")
+        return self
+
+    def __exit__(self, *args):
+        if self.pru is not None:
+            self.pru.__exit__()
+            self.pru = None
+        if self._shared_mem is not None:
+            self._shared_mem.__exit__()
+            self._shared_mem = None
+        sysfs_interface.close_handles()
+        for (module, name), value in self._hooks.items():
+            setattr(module, name, value)
+        self._hooks = {}
+        if self._mem_fd is not None:
+            os.close(self._mem_fd)
+            self._mem_fd = None
+        if self._tmp_dir is not None:
+            self._tmp_dir.cleanup()
+            self._tmp_dir = None
+
+    def _create_handle(self, attribute: str, writable: bool = True):
+        if attribute == "pru_msg_box":
+            return SimulatedMsgBox(self.pru, attribute)
+        if attribute == "pru_msg_notify_ns":
+            return SimulatedMsgNotifyTime(self.pru, attribute)
+        if attribute == "state":
+            return SimulatedState(self.pru, attribute)
+        return sysfs_interface.SysfsHandle(attribute, writable=writable)
+
+
+def create_backend(setting: Union[str, None]) -> Union[SimulatedBackend, None]:
+    """Creates the simulated backend from a CLI-option / environment-variable
+
+    Args:
+        setting (str): None, "" or "0" for real hardware, "1" for the models,
+            otherwise path of a recording to replay
+    Returns: SimulatedBackend (not yet entered) or None
+    """
+    if setting is None:
+        return None
+    setting = setting.strip()
+    if setting in ["", "0"]:
+        return None
+    if setting == "1":
+        return SimulatedBackend()
+    return SimulatedBackend(input_path=setting)
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.summary
+~~~~~
+Decimation of iv-data into a pyramid of summaries. Every level splits the
+samples into bins of fixed length and keeps min, max and mean of voltage,
+current and power per bin. The first level is computed from the samples,
+every further level from the bins of the level below. Unfinished bins are
+carried over to the next buffer, so bins do not depend on buffer boundaries.
+EnergyMeter keeps running totals of energy and power, per second and for
+the whole recording.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+
+from typing import NoReturn
+
+import numpy as np
+
+channel_list = ["voltage", "current", "power"]
+# totals of EnergyMeter, stored as attributes of the recording
+totals_list = [
+    "energy_j",
+    "power_mean_w",
+    "power_min_w",
+    "power_max_w",
+    "on_time_s",
+    "duration_s",
+]
+
+
+class SummaryPyramid(object):
+    """Computes min / max / mean per bin for several bin-lengths at once
+
+    Bins are counted in samples, their timestamp is the one of the first
+    sample. Completed bins of every level are collected until pop() takes
+    them out.
+
+    Args:
+        bin_samples (list): samples per bin for every level, ascending, each
+            a multiple of the one before
+        sample_interval_ns (int): time between two samples
+    """
+
+    def __init__(self, bin_samples: list, sample_interval_ns: int):
+        for smaller, larger in zip(bin_samples[:-1], bin_samples[1:]):
+            if (smaller < 1) or (larger % smaller != 0):
+                raise ValueError(
+                    f"bin_samples have to be ascending multiples, got {bin_samples}"
+                )
+        self.bin_samples = list(bin_samples)
+        self.sample_interval_ns = sample_interval_ns
+        # bins of level n consist of that many bins of level n-1
+        self.factors = [bin_samples[0]] + [
+            larger // smaller
+            for smaller, larger in zip(bin_samples[:-1], bin_samples[1:])
+        ]
+        self._carry_time = 0
+        # channels along the first axis, reductions run on contiguous memory
+        self._carry_values = np.zeros((len(channel_list), 0))
+        self._carry = [self._no_bins() for _ in bin_samples[1:]]
+        self._output = [[] for _ in bin_samples]
+
+    @staticmethod
+    def _no_bins() -> dict:
+        return {
+            "time": np.zeros(0, dtype="u8"),
+            "min": np.zeros((len(channel_list), 0)),
+            "max": np.zeros((len(channel_list), 0)),
+            "sum": np.zeros((len(channel_list), 0)),
+            "count": np.zeros(0, dtype="u8"),
+        }
+
+    def add(
+        self,
+        timestamp_ns: int,
+        voltage: np.ndarray,
+        current: np.ndarray,
+        power: np.ndarray = None,
+    ):
+        """Adds the samples of a buffer
+
+        :param timestamp_ns: time of first sample
+        :param voltage: voltage [V] per sample
+        :param current: current [A] per sample
+        :param power: power [W] per sample, computed if omitted
+        """
+        if power is None:
+            power = voltage * current
+        values = np.stack((voltage, current, power))
+        self._add_bins(self._bin_samples(int(timestamp_ns), values))
+
+    def finish(self) -> NoReturn:
+        """Closes the unfinished bins of all levels, e.g. at the end of recording"""
+        bins = self._no_bins()
+        rest = self._carry_values
+        if rest.shape[1] > 0:
+            count = np.ones(rest.shape[1], dtype="u8")
+            bins = self._append_rest(bins, self._carry_time, rest, rest, rest, count)
+            self._carry_values = rest[:, :0]
+        self._add_bins(bins, partial=True)
+
+    def _bin_samples(self, timestamp_ns: int, values: np.ndarray) -> dict:
+        """Bins of the first level, samples of an unfinished bin are carried"""
+        n_carry = self._carry_values.shape[1]
+        if n_carry == 0:
+            self._carry_time = timestamp_ns
+        values = np.concatenate((self._carry_values, values), axis=1)
+        factor = self.factors[0]
+        n_bins = values.shape[1] // factor
+        end = n_bins * factor
+        # timestamps follow the buffer, only the bin with carried samples
+        # starts with the previous buffer
+        time = timestamp_ns + (np.arange(n_bins, dtype="i8") * factor - n_carry) * int(
+            self.sample_interval_ns
+        )
+        if (n_bins > 0) and (n_carry > 0):
+            time[0] = self._carry_time
+        blocks = values[:, :end].reshape(len(channel_list), n_bins, factor)
+        self._carry_values = values[:, end:]
+        if n_bins > 0:
+            self._carry_time = timestamp_ns + (end - n_carry) * int(
+                self.sample_interval_ns
+            )
+        return {
+            "time": time.astype("u8"),
+            "min": blocks.min(axis=2),
+            "max": blocks.max(axis=2),
+            "sum": blocks.sum(axis=2),
+            "count": np.full(n_bins, factor, dtype="u8"),
+        }
+
+    def _add_bins(self, bins: dict, partial: bool = False) -> NoReturn:
+        self._output[0].append(bins)
+        for level in range(1, len(self.bin_samples)):
+            bins = self._aggregate(level, bins, partial)
+            self._output[level].append(bins)
+
+    def _aggregate(self, level: int, children: dict, partial: bool) -> dict:
+        """Joins bins of level-1 into bins of level, carries the remainder"""
+        carry = self._carry[level - 1]
+        merged = {
+            key: np.concatenate((carry[key], children[key]), axis=-1)
+            for key in children
+        }
+        factor = self.factors[level]
+        n_bins = merged["time"].shape[0] // factor
+        end = n_bins * factor
+        shape = (len(channel_list), n_bins, factor)
+        bins = {
+            "time": merged["time"][:end:factor],
+            "min": merged["min"][:, :end].reshape(shape).min(axis=2),
+            "max": merged["max"][:, :end].reshape(shape).max(axis=2),
+            "sum": merged["sum"][:, :end].reshape(shape).sum(axis=2),
+            "count": merged["count"][:end].reshape(shape[1:]).sum(axis=1),
+        }
+        rest = {key: value[..., end:] for key, value in merged.items()}
+        if partial and (rest["time"].shape[0] > 0):
+            bins = self._append_rest(
+                bins,
+                rest["time"][0],
+                rest["min"],
+                rest["max"],
+                rest["sum"],
+                rest["count"],
+            )
+            rest = self._no_bins()
+        self._carry[level - 1] = rest
+        return bins
+
+    @staticmethod
+    def _append_rest(bins: dict, time, min_, max_, sum_, count) -> dict:
+        """Adds one shorter bin made of the remaining elements"""
+        return {
+            "time": np.append(bins["time"], np.uint64(time)),
+            "min": np.column_stack((bins["min"], min_.min(axis=1))),
+            "max": np.column_stack((bins["max"], max_.max(axis=1))),
+            "sum": np.column_stack((bins["sum"], sum_.sum(axis=1))),
+            "count": np.append(bins["count"], np.uint64(count.sum())),
+        }
+
+    def pop(self, level: int) -> dict:
+        """Takes the completed bins of a level
+
+        :param level: index in bin_samples
+        :return: time [ns] and per channel an array with columns min, max, mean
+        """
+        bins = self._output[level]
+        self._output[level] = []
+        if len(bins) == 0:
+            bins = [self._no_bins()]
+        time = np.concatenate([part["time"] for part in bins])
+        min_ = np.concatenate([part["min"] for part in bins], axis=1)
+        max_ = np.concatenate([part["max"] for part in bins], axis=1)
+        count = np.concatenate([part["count"] for part in bins])
+        mean = np.concatenate([part["sum"] for part in bins], axis=1) / np.maximum(
+            count, 1
+        )
+        result = {"time": time}
+        for index, channel in enumerate(channel_list):
+            result[channel] = np.column_stack((min_[index], max_[index], mean[index]))
+        return result
+
+
+class EnergyMeter(object):
+    """Integrates power into energy while samples are written
+
+    Keeps totals for the whole recording and one row per intervall:
+    energy, min / max / mean of power and the time with power above
+    on_threshold_w.
+
+    Args:
+        sample_interval_ns (int): time between two samples
+        on_threshold_w (float): power that counts as on-time
+        intervall_ns (int): length of the rows, counted in samples
+    """
+
+    def __init__(
+        self,
+        sample_interval_ns: int,
+        on_threshold_w: float = 0.0,
+        intervall_ns: int = 10**9,
+    ):
+        self.sample_interval_ns = sample_interval_ns
+        self.on_threshold_w = on_threshold_w
+        self.bin_samples = intervall_ns // sample_interval_ns
+        self._sample_s = sample_interval_ns / 10**9
+        self._energy_j = 0.0
+        self._n_samples = 0
+        self._n_on = 0
+        self._power_min_w = np.inf
+        self._power_max_w = -np.inf
+        self._bin = None
+        self._rows = []
+
+    def add(self, timestamp_ns: int, power: np.ndarray) -> NoReturn:
+        """Adds the samples of a buffer
+
+        :param timestamp_ns: time of first sample
+        :param power: power [W] per sample
+        """
+        pos = 0
+        # a buffer is shorter than a row, this runs once or twice
+        while pos < power.shape[0]:
+            if self._bin is None:
+                self._bin = {
+                    "time": int(timestamp_ns) + pos * self.sample_interval_ns,
+                    "sum": 0.0,
+                    "n": 0,
+                    "n_on": 0,
+                    "min": np.inf,
+                    "max": -np.inf,
+                }
+            section = power[pos : pos + self.bin_samples - self._bin["n"]]
+            self._bin["sum"] += section.sum()
+            self._bin["n"] += section.shape[0]
+            self._bin["n_on"] += np.count_nonzero(section > self.on_threshold_w)
+            self._bin["min"] = min(self._bin["min"], section.min())
+            self._bin["max"] = max(self._bin["max"], section.max())
+            pos += section.shape[0]
+            if self._bin["n"] == self.bin_samples:
+                self._close_bin()
+
+    def _close_bin(self) -> NoReturn:
+        row = self._bin
+        self._bin = None
+        self._rows.append(row)
+        self._energy_j += row["sum"] * self._sample_s
+        self._n_samples += row["n"]
+        self._n_on += row["n_on"]
+        self._power_min_w = min(self._power_min_w, row["min"])
+        self._power_max_w = max(self._power_max_w, row["max"])
+
+    def finish(self) -> NoReturn:
+        """Closes the unfinished row, e.g. at the end of recording"""
+        if self._bin is not None:
+            self._close_bin()
+
+    def pop(self) -> dict:
+        """Takes the completed rows
+
+        :return: time [ns], energy [J], power (columns min, max, mean) [W] and
+            on_time [s] per row
+        """
+        rows = self._rows
+        self._rows = []
+        n_samples = np.array([row["n"] for row in rows], dtype="f8")
+        power_sum = np.array([row["sum"] for row in rows], dtype="f8")
+        return {
+            "time": np.array([row["time"] for row in rows], dtype="u8"),
+            "energy": power_sum * self._sample_s,
+            "power": np.column_stack(
+                (
+                    np.array([row["min"] for row in rows], dtype="f8"),
+                    np.array([row["max"] for row in rows], dtype="f8"),
+                    power_sum / np.maximum(n_samples, 1),
+                )
+            ),
+            "on_time": np.array([row["n_on"] for row in rows], dtype="f8")
+            * self._sample_s,
+        }
+
+    @property
+    def totals(self) -> dict:
+        """Totals of completed rows, see totals_list"""
+        duration_s = self._n_samples * self._sample_s
+        if self._n_samples == 0:
+            return {key: 0.0 for key in totals_list}
+        return {
+            "energy_j": float(self._energy_j),
+            "power_mean_w": float(self._energy_j / duration_s),
+            "power_min_w": float(self._power_min_w),
+            "power_max_w": float(self._power_max_w),
+            "on_time_s": float(self._n_on * self._sample_s),
+            "duration_s": float(duration_s),
+        }
+
+
+def merge_totals(totals: list) -> dict:
+    """Joins totals of consecutive recordings, e.g. segments
+
+    :param totals: dicts (or hdf5-attributes) with keys of totals_list
+    :return: totals of the joined recording
+    """
+    totals = [total for total in totals if total["duration_s"] > 0]
+    if len(totals) == 0:
+        return {key: 0.0 for key in totals_list}
+    energy_j = sum(float(total["energy_j"]) for total in totals)
+    duration_s = sum(float(total["duration_s"]) for total in totals)
+    return {
+        "energy_j": energy_j,
+        "power_mean_w": energy_j / duration_s,
+        "power_min_w": min(float(total["power_min_w"]) for total in totals),
+        "power_max_w": max(float(total["power_max_w"]) for total in totals),
+        "on_time_s": sum(float(total["on_time_s"]) for total in totals),
+        "duration_s": duration_s,
+    }
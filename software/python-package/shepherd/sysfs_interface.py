@@ -10,7 +10,10 @@ provided by the shepherd kernel module
 :copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
 :license: MIT, see LICENSE for more details.
 """
+import errno
 import logging
+import os
+import select
 import time
 from pathlib import Path
 from typing import NoReturn, Union
@@ -26,35 +29,174 @@ class SysfsInterfaceException(Exception):
     pass
 
 
+class SysfsHandle:
+    """Persistent file-descriptor for a frequently used sysfs attribute.
+
+    Opening, reading and closing a pathlib-path costs several syscalls and
+    python-objects per access. The handle keeps the descriptor open, reads
+    with a single pread() at offset 0 (sysfs regenerates the content for
+    every read from the start) into a preallocated buffer and writes with
+    pwrite(). A descriptor that went stale (e.g. kernel module was reloaded)
+    is reopened once.
+
+    Args:
+        attribute (str): name of attribute, relative to sysfs_path
+        size (int): maximum number of bytes to read
+        writable (bool): False for read-only attributes, sysfs refuses to
+            open them for writing (even for root)
+    """
+
+    # stale descriptors report these, everything else comes from the kernel module
+    _stale_errnos = [errno.ENODEV, errno.EBADF]
+
+    def __init__(self, attribute: str, size: int = 64, writable: bool = True):
+        self.attribute = attribute
+        self._flags = os.O_RDWR if writable else os.O_RDONLY
+        self._fd = None
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+
+    def open(self) -> NoReturn:
+        if self._fd is None:
+            self._fd = os.open(sysfs_path / self.attribute, self._flags)
+
+    def close(self) -> NoReturn:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def fileno(self) -> int:
+        self.open()
+        return self._fd
+
+    def read(self) -> memoryview:
+        """
+        Returns: content of attribute, view is only valid until the next read
+        """
+        self.open()
+        try:
+            length = os.preadv(self._fd, [self._buffer], 0)
+        except OSError as xcp:
+            if xcp.errno not in self._stale_errnos:
+                raise
+            self.close()
+            self.open()
+            length = os.preadv(self._fd, [self._buffer], 0)
+        return self._view[:length]
+
+    def write(self, data: bytes) -> int:
+        self.open()
+        try:
+            return os.pwrite(self._fd, data, 0)
+        except OSError as xcp:
+            if xcp.errno not in self._stale_errnos:
+                raise
+            self.close()
+            self.open()
+            return os.pwrite(self._fd, data, 0)
+
+    def wait_notify(self, timeout: float) -> bool:
+        """Blocks until the kernel module notifies the attribute
+
+        Args:
+            timeout (float): Timeout in seconds
+        Returns: True if notified, False on timeout
+        """
+        # sysfs_notify() is signaled as exceptional condition
+        try:
+            _, _, xlist = select.select([], [], [self], timeout)
+        except (OSError, ValueError):
+            # descriptor is not pollable (e.g. not a real sysfs attribute)
+            time.sleep(timeout)
+            return False
+        return len(xlist) > 0
+
+
+# creates handles for hot attributes, can be replaced (e.g. by the simulation)
+handle_factory = SysfsHandle
+
+# cache for the descriptors of hot attributes (pru_msg_box, state)
+_handles = {}
+
+# limits of the sleep between two reads of the state, in seconds
+state_backoff_min = 0.001
+state_backoff_max = 0.1
+
+
+def get_handle(attribute: str) -> SysfsHandle:
+    """Returns the cached handle for an attribute, it is opened on first use"""
+    handle = _handles.get(attribute)
+    if handle is None:
+        handle = handle_factory(attribute)
+        _handles[attribute] = handle
+    return handle
+
+
+def close_handles() -> NoReturn:
+    """Closes all cached handles, e.g. before unloading the kernel module"""
+    for handle in _handles.values():
+        handle.close()
+    _handles.clear()
+
+
 # dedicated sampling modes
 # - _adc_read - modes are used per rpc (currently to calibrate the hardware)
 # TODO: what is with "None"?
 shepherd_modes = ["harvester", "hrv_adc_read", "emulator", "emu_adc_read", "debug"]
 
 
-def wait_for_state(wanted_state: str, timeout: float) -> NoReturn:
+def wait_for_state(wanted_state: str, timeout: float) -> float:
     """Waits until shepherd is in specified state.
 
-    Polls the sysfs 'state' attribute until it contains the target state or
-    until the timeout expires.
+    See wait_for_states().
 
     Args:
-        wanted_state (int): Target state
+        wanted_state (str): Target state
         timeout (float): Timeout in seconds
+    Returns: duration of waiting in seconds
     """
     ts_start = time.time()
+    wait_for_states([wanted_state], timeout)
+    return time.time() - ts_start
+
+
+def wait_for_states(wanted_states: list, timeout: float) -> str:
+    """Waits until shepherd is in one of the specified states.
+
+    Reads the sysfs 'state' attribute and sleeps in between until the kernel
+    module notifies a state change. Without notification-support the wake-up
+    happens after a backoff, that starts at 1 ms and doubles up to 100 ms.
+
+    Args:
+        wanted_states (list): Target states, e.g. ["running", "fault"]
+        timeout (float): Timeout in seconds
+    Returns: the state that was reached
+    """
+    ts_end = time.time() + timeout
+    backoff = state_backoff_min
+    handle = get_handle("state")
     while True:
+        # reading also re-arms the notification
         current_state = get_state()
-        if current_state == wanted_state:
-            return time.time() - ts_start
+        if current_state in wanted_states:
+            return current_state
 
-        if time.time() - ts_start > timeout:
+        remaining = ts_end - time.time()
+        if remaining <= 0:
             raise SysfsInterfaceException(
-                f"timed out waiting for state { wanted_state } - "
+                f"timed out waiting for state { ' or '.join(wanted_states) } - "
                 f"state is { current_state }"
             )
 
-        time.sleep(0.1)
+        if not handle.wait_notify(min(backoff, remaining)):
+            backoff = min(2 * backoff, state_backoff_max)
 
 
 def set_start(start_time: float = None) -> NoReturn:
@@ -72,15 +214,14 @@ def set_start(start_time: float = None) -> NoReturn:
     if current_state != "idle":
         raise SysfsInterfaceException(f"Cannot start from state { current_state }")
 
-    with open(sysfs_path / "state", "w") as f:
-        if isinstance(start_time, float):
-            start_time = int(start_time)
-        if isinstance(start_time, int):
-            logger.debug(f"writing start-time = {start_time} to sysfs")
-            f.write(f"{start_time}")
-        else:  # unknown type
-            logger.debug(f"writing 'start' to sysfs")
-            f.write("start")
+    if isinstance(start_time, float):
+        start_time = int(start_time)
+    if isinstance(start_time, int):
+        logger.debug(f"writing start-time = {start_time} to sysfs")
+        get_handle("state").write(f"{start_time}".encode())
+    else:  # unknown type
+        logger.debug(f"writing 'start' to sysfs")
+        get_handle("state").write(b"start")
 
 
 def set_stop(force: bool = False) -> NoReturn:
@@ -94,8 +235,7 @@ def set_stop(force: bool = False) -> NoReturn:
         if current_state != "running":
             raise SysfsInterfaceException(f"Cannot stop from state { current_state }")
 
-    with open(sysfs_path / "state", "w") as f:
-        f.write("stop")
+    get_handle("state").write(b"stop")
 
 
 def write_mode(mode: str, force: bool = False) -> NoReturn:
@@ -368,20 +508,139 @@ def write_pru_msg(msg_type: int, values: list) -> NoReturn:
                 f"expected u32 for type (={type(value)}) and content (={value})"
             )
 
-    with open(sysfs_path / "pru_msg_box", "w") as file:
-        file.write(f"{msg_type} {values[0]} {values[1]}")
+    get_handle("pru_msg_box").write(f"{msg_type} {values[0]} {values[1]}".encode())
+
+
+def parse_pru_msg(message: memoryview) -> Union[tuple, None]:
+    """
+    Returns: tuple of msg-type and values, or None for an empty msg-box
+    """
+    msg_parts = [int(x) for x in bytes(message).split()]
+    if len(msg_parts) < 2:
+        return None
+    return msg_parts[0], msg_parts[1:]
 
 
 def read_pru_msg() -> tuple:
     """
     Returns:
     """
-    with open(sysfs_path / "pru_msg_box", "r") as f:
-        message = f.read().rstrip()
-    msg_parts = [int(x) for x in message.split()]
-    if len(msg_parts) < 2:
+    message = parse_pru_msg(get_handle("pru_msg_box").read())
+    if message is None:
         raise SysfsInterfaceException(f"pru_msg was too short")
-    return msg_parts[0], msg_parts[1:]
+    return message
+
+
+class PruMsgBox:
+    """Persistent, event-driven handle for the 'pru_msg_box' sysfs attribute.
+
+    The kernel module notifies the attribute whenever a message from the PRU
+    gets queued, so waiting for a message is a select() on the open file that
+    blocks up to the timeout. The time of the latest notification is
+    published in 'pru_msg_notify_ns' (CLOCK_MONOTONIC), every notified message
+    updates the latency statistic with the time from that notification to
+    the retrieval of the message.
+    Kernel modules without notification (and without that attribute) are
+    handled by adaptive polling, the interval starts in the sub-millisecond
+    range and doubles up to poll_max_s. Their latency is only an upper bound
+    (time since the wake-up plus the interval slept).
+
+    Args:
+        poll_min_s (float): first polling interval of the fallback-path
+        poll_max_s (float): upper limit for the polling interval
+    """
+
+    def __init__(self, poll_min_s: float = 50e-6, poll_max_s: float = 2e-3):
+        self.poll_min_s = poll_min_s
+        self.poll_max_s = poll_max_s
+        # own descriptor, the notification-state is tracked per open file
+        self._handle = handle_factory("pru_msg_box")
+        self._notify_ns = handle_factory("pru_msg_notify_ns", writable=False)
+        self.notify_supported = False
+        self.reset_stats()
+
+    def __enter__(self):
+        self._handle.open()
+        try:
+            self._notify_ns.open()
+            self.notify_supported = True
+        except OSError as xcp:
+            logger.debug(f"[sysfs] pru_msg_box is not notified ({xcp}) -> will poll")
+            self.notify_supported = False
+        return self
+
+    def __exit__(self, *args):
+        self._handle.close()
+        self._notify_ns.close()
+
+    def reset_stats(self) -> NoReturn:
+        self.n_msgs = 0
+        self.n_notified = 0
+        self.n_polled = 0
+        self.latency_sum_s = 0.0
+        self.latency_max_s = 0.0
+
+    def get_stats(self) -> dict:
+        """
+        Returns: dict with msg-count, wake-up source and latency [s]
+        """
+        n_woken = self.n_notified + self.n_polled
+        return {
+            "msgs": self.n_msgs,
+            "notified": self.n_notified,
+            "polled": self.n_polled,
+            "latency_mean_s": self.latency_sum_s / n_woken if n_woken else 0.0,
+            "latency_max_s": self.latency_max_s,
+        }
+
+    def read(self) -> Union[tuple, None]:
+        """Non-blocking read of the message box
+
+        Returns: tuple of msg-type and values, or None for an empty box
+        """
+        return parse_pru_msg(self._handle.read())
+
+    def wait(self, timeout: float) -> tuple:
+        """Blocks until a message from the PRU arrives
+
+        Args:
+            timeout (float): Timeout in seconds
+        Returns: tuple of msg-type and values
+        """
+        ts_start = time.monotonic()
+        interval = self.poll_min_s
+        ts_wake = None
+        notified = False
+        while True:
+            message = self.read()
+            if message is not None:
+                self.n_msgs += 1
+                if notified:
+                    ts_notify_ns = int(bytes(self._notify_ns.read()))
+                    self._add_latency(max(time.monotonic_ns() - ts_notify_ns, 0) / 1e9)
+                    self.n_notified += 1
+                elif ts_wake is not None:
+                    # polling might have overslept by up to one interval
+                    self._add_latency(time.monotonic() - ts_wake + interval)
+                    self.n_polled += 1
+                return message
+
+            remaining = timeout - (time.monotonic() - ts_start)
+            if remaining <= 0:
+                raise SysfsInterfaceException(
+                    f"timed out waiting for pru_msg ({timeout} s)"
+                )
+            if self.notify_supported:
+                notified = self._handle.wait_notify(remaining)
+            else:
+                if ts_wake is not None:
+                    interval = min(2 * interval, self.poll_max_s)
+                self._handle.wait_notify(min(interval, remaining))
+            ts_wake = time.monotonic()
+
+    def _add_latency(self, latency: float) -> NoReturn:
+        self.latency_sum_s += latency
+        self.latency_max_s = max(self.latency_max_s, latency)
 
 
 prog_attribs = ["protocol", "datarate", "pin_tck", "pin_tdio", "pin_tdo", "pin_tms"]
@@ -450,9 +709,16 @@ def get_mode() -> str:
         return str(f.read().rstrip())
 
 
+# interned names avoid a decode per state-read
+_state_names = {
+    name.encode(): name
+    for name in ["idle", "armed", "running", "reset", "fault", "unknown"]
+}
+
+
 def get_state() -> str:
-    with open(sysfs_path / "state", "r") as f:
-        return str(f.read().rstrip())
+    state = bytes(get_handle("state").read()).rstrip()
+    return _state_names.get(state, state.decode())
 
 
 def get_n_buffers() -> int:
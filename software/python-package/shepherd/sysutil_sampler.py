@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.sysutil_sampler
+~~~~~
+Samples the state of the system (cpu, ram, io, network, temperature) in a
+separate thread. Counters are read directly from /proc and /sys, which is
+much lighter than psutil. Rows are queued and get written in batches by
+LogWriter, so the thread never touches the hdf5-file.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import NoReturn
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SysutilSampler(object):
+    """Collects one row of system-statistics per intervall
+
+    Every row is (timestamp_ns, *columns), counters are deltas since the
+    previous row:
+        - cpu: utilization of all cores [%]
+        - ram: available [%], used [%]
+        - io: reads [n], writes [n], read [byte], written [byte]
+        - net: sent [byte], received [byte]
+        - cpu_core: utilization per core [%]
+        - ctxt: context switches [n]
+        - temp: temperature per thermal zone [m°C], omitted without zones
+        - write_latency: longest write of LogWriter [us], see add_write_latency()
+
+    Args:
+        intervall_ns (int): time between rows
+        proc_path (Path): mount point of procfs
+        sys_path (Path): mount point of sysfs
+    """
+
+    def __init__(
+        self,
+        intervall_ns: int = 10**9,
+        proc_path: Path = Path("/proc"),
+        sys_path: Path = Path("/sys"),
+    ):
+        self.intervall_ns = intervall_ns
+        self.proc_path = Path(proc_path)
+        self.queue = deque()
+        # whole disks only, partitions would count twice
+        self.disks = [
+            path.name
+            for path in sorted((Path(sys_path) / "block").glob("*"))
+            if not path.name.startswith(("loop", "ram", "zram"))
+        ]
+        self.thermal_zones = sorted(
+            (Path(sys_path) / "class" / "thermal").glob("thermal_zone*/temp")
+        )
+        self._write_latency_ns = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._last = self.read_counters()
+        self.n_cores = self._last["cpu"].shape[0] - 1
+        self.columns = ["cpu", "ram", "io", "net", "cpu_core", "ctxt"]
+        if self.thermal_zones:
+            self.columns.append("temp")
+        self.columns.append("write_latency")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self) -> NoReturn:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sysutil_sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> NoReturn:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> NoReturn:
+        next_ns = time.monotonic_ns()
+        while True:
+            next_ns += self.intervall_ns
+            if self._stop.wait(max(next_ns - time.monotonic_ns(), 0) / 1e9):
+                break
+            try:
+                self.sample()
+            except (OSError, ValueError) as e:
+                logger.error(f"[SysutilSampler] failed to read counters ({e})")
+
+    def add_write_latency(self, duration_ns: int) -> NoReturn:
+        """LogWriter reports its writes, the longest is kept per row"""
+        if duration_ns > self._write_latency_ns:
+            self._write_latency_ns = duration_ns
+
+    def sample(self) -> NoReturn:
+        """Reads counters and appends a row to the queue"""
+        timestamp_ns = time.time_ns()
+        now = self.read_counters()
+        last = self._last
+        self._last = now
+
+        busy, total = (now["cpu"] - last["cpu"]).T
+        cpu = np.round(100 * busy / np.maximum(total, 1)).astype("u1")
+        mem_total, mem_available = now["mem"]
+        ram = [
+            round(100 * mem_available / mem_total),
+            round(100 * (mem_total - mem_available) / mem_total),
+        ]
+        latency_ns, self._write_latency_ns = self._write_latency_ns, 0
+        values = {
+            "cpu": cpu[0],
+            "ram": ram,
+            "io": now["io"] - last["io"],
+            "net": now["net"] - last["net"],
+            "cpu_core": cpu[1:],
+            "ctxt": now["ctxt"] - last["ctxt"],
+            "write_latency": latency_ns // 1000,
+        }
+        if self.thermal_zones:
+            values["temp"] = self.read_temperatures()
+        self.queue.append((timestamp_ns, *[values[name] for name in self.columns]))
+
+    def read_counters(self) -> dict:
+        counters = {"io": np.zeros(4, dtype="u8"), "net": np.zeros(2, dtype="u8")}
+
+        cpu = []
+        for line in (self.proc_path / "stat").read_text().splitlines():
+            if line.startswith("cpu"):
+                values = [int(value) for value in line.split()[1:]]
+                idle = values[3] + values[4]  # idle, iowait
+                total = sum(values[:8])  # without guest, part of user already
+                cpu.append([total - idle, total])
+            elif line.startswith("ctxt"):
+                counters["ctxt"] = int(line.split()[1])
+        counters["cpu"] = np.array(cpu, dtype="i8")
+
+        meminfo = {}
+        for line in (self.proc_path / "meminfo").read_text().splitlines():
+            key, value = line.split(":")
+            meminfo[key] = int(value.split()[0])
+        counters["mem"] = (meminfo["MemTotal"], meminfo["MemAvailable"])
+
+        for line in (self.proc_path / "diskstats").read_text().splitlines():
+            values = line.split()
+            if values[2] in self.disks:
+                # reads, sectors read, writes, sectors written
+                reads, sectors_read = int(values[3]), int(values[5])
+                writes, sectors_written = int(values[7]), int(values[9])
+                counters["io"] += np.array(
+                    [reads, writes, 512 * sectors_read, 512 * sectors_written],
+                    dtype="u8",
+                )
+
+        for line in (self.proc_path / "net" / "dev").read_text().splitlines()[2:]:
+            values = line.split(":")[1].split()
+            counters["net"] += np.array([values[8], values[0]], dtype="u8")
+        return counters
+
+    def read_temperatures(self) -> np.ndarray:
+        temperatures = np.zeros(len(self.thermal_zones), dtype="i4")
+        for index, path in enumerate(self.thermal_zones):
+            try:
+                temperatures[index] = int(path.read_text())
+            except (OSError, ValueError):
+                pass  # some zones can not be read while suspended
+        return temperatures
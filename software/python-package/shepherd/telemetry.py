@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.telemetry
+~~~~~
+Per-buffer timing of the data-exchange with the PRU. Every cycle of
+get_buffer() / return_buffer() yields one entry with the latency of the
+buffer, the duration of the host-side stages and the estimated number of
+buffers that are still owned by the PRU, i.e. the headroom before it runs
+out of buffers.
+Entries leave through a sink (e.g. the hdf5-file), only a bounded
+reservoir-sample and running min / max stay in memory for the summary.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+import logging
+import time
+from typing import Callable
+from typing import NoReturn
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BufferTelemetry(object):
+    """Collects timing of the buffer-cycles between host and PRU
+
+    Entries are gathered in blocks of block_size. Every completed block is
+    handed to sink (if set), e.g. LogWriter.write_telemetry(). flush() passes
+    on the incomplete block. For the summary only min / max of all entries
+    and a uniform random sample of reservoir_size entries are kept, so memory
+    stays constant for runs of any length, percentiles are exact as long as
+    there are fewer entries than that.
+
+    Columns of value (all i4):
+        - latency_us: host-receive time minus timestamp of the buffer,
+          includes one buffer-period as the timestamp marks its first sample
+        - read_us: reading the buffer from shared memory
+        - handle_us: from leaving get_buffer() to return_buffer(), e.g. writing
+        - return_us: refilling the buffer and handing it back to the PRU
+        - pru_buffers: buffers owned by PRU when this one was received
+
+    Args:
+        block_size (int): entries per block
+        reservoir_size (int): entries sampled for the percentiles
+    """
+
+    columns = ["latency_us", "read_us", "handle_us", "return_us", "pru_buffers"]
+
+    def __init__(self, block_size: int = 100, reservoir_size: int = 10_000):
+        if block_size < 1:
+            raise ValueError(f"block_size must be positive, got {block_size}")
+        self.block_size = block_size
+        self.reservoir_size = reservoir_size
+        self._rng = np.random.default_rng()
+        self.sink: Callable = None
+        self._pending = {}
+        self.reset()
+
+    def reset(self) -> NoReturn:
+        """Drops all entries and the ownership-estimation"""
+        self._pending.clear()
+        self._n_entries = 0
+        self._min = np.full(len(self.columns), np.iinfo("i4").max, dtype="i4")
+        self._max = np.full(len(self.columns), np.iinfo("i4").min, dtype="i4")
+        self._reservoir = np.zeros((self.reservoir_size, len(self.columns)), dtype="i4")
+        self._time = np.zeros(self.block_size, dtype="u8")
+        self._value = np.zeros((self.block_size, len(self.columns)), dtype="i4")
+        self._pos = 0
+        self.pru_buffers = 0
+
+    def received(
+        self, index: int, timestamp_ns: int, ts_receive_ns: int, read_ns: int
+    ) -> NoReturn:
+        """PRU handed over a buffer, it was read in read_ns
+
+        :param index: index of the buffer in shared memory
+        :param timestamp_ns: timestamp of the buffer, set by PRU
+        :param ts_receive_ns: system time when the msg of the PRU was received
+        :param read_ns: duration of reading the buffer
+        """
+        self.pru_buffers = max(self.pru_buffers - 1, 0)
+        self._pending[index] = (
+            timestamp_ns,
+            (ts_receive_ns - timestamp_ns) // 1000,
+            read_ns // 1000,
+            time.perf_counter_ns(),
+            self.pru_buffers,
+        )
+
+    def returned(self, index: int, ts_begin_ns: int = None) -> NoReturn:
+        """Buffer is handed back to the PRU
+
+        :param index: index of the buffer in shared memory
+        :param ts_begin_ns: perf-counter when return_buffer() started,
+            None if it consisted only of sending the msg
+        """
+        self.pru_buffers += 1
+        ts_now_ns = time.perf_counter_ns()
+        if ts_begin_ns is None:
+            ts_begin_ns = ts_now_ns
+        entry = self._pending.pop(index, None)
+        if entry is None:
+            # initial buffers were never received
+            return
+        timestamp_ns, latency_us, read_us, ts_handled_ns, pru_buffers = entry
+        self._time[self._pos] = timestamp_ns
+        self._value[self._pos] = [
+            latency_us,
+            read_us,
+            (ts_begin_ns - ts_handled_ns) // 1000,
+            (ts_now_ns - ts_begin_ns) // 1000,
+            pru_buffers,
+        ]
+        self._pos += 1
+        if self._pos >= self.block_size:
+            self._hand_over(self._pos)
+
+    def flush(self) -> NoReturn:
+        """Hands the incomplete block to the sink"""
+        if self._pos > 0:
+            self._hand_over(self._pos)
+
+    def _hand_over(self, length: int) -> NoReturn:
+        time_ = self._time[:length].copy()
+        value = self._value[:length].copy()
+        self._pos = 0
+        self._add_to_summary(value)
+        if self.sink is not None:
+            self.sink(time_, value)
+
+    def _add_to_summary(self, value: np.ndarray) -> NoReturn:
+        """Running min / max and reservoir-sampling (algorithm R)"""
+        self._min = np.minimum(self._min, value.min(axis=0))
+        self._max = np.maximum(self._max, value.max(axis=0))
+        indices = self._n_entries + np.arange(value.shape[0])
+        self._n_entries += value.shape[0]
+        # fill the reservoir first, then replace with probability size / index
+        fill = indices < self.reservoir_size
+        self._reservoir[indices[fill]] = value[fill]
+        slots = self._rng.integers(0, indices[~fill] + 1)
+        replace = slots < self.reservoir_size
+        self._reservoir[slots[replace]] = value[~fill][replace]
+
+    def get_summary(self) -> dict:
+        """Percentiles of the sampled entries, min and max of all entries
+
+        :return: dict with number of entries and p50, p99, max, min per column
+        """
+        pending = self._value[: self._pos]
+        summary = {"buffers": self._n_entries + self._pos}
+        if summary["buffers"] == 0:
+            return summary
+        sample = np.concatenate(
+            (self._reservoir[: min(self._n_entries, self.reservoir_size)], pending)
+        )
+        min_, max_ = self._min, self._max
+        if self._pos > 0:
+            min_ = np.minimum(min_, pending.min(axis=0))
+            max_ = np.maximum(max_, pending.max(axis=0))
+        for column, name in enumerate(self.columns):
+            p50, p99 = np.percentile(sample[:, column], [50, 99])
+            summary[name] = {
+                "p50": float(p50),
+                "p99": float(p99),
+                "max": int(max_[column]),
+                "min": int(min_[column]),
+            }
+        return summary
+
+    def log_summary(self) -> NoReturn:
+        summary = self.get_summary()
+        if summary["buffers"] == 0:
+            return
+        parts = [
+            f"{name} p50 = {summary[name]['p50']:.0f}, "
+            f"p99 = {summary[name]['p99']:.0f}, max = {summary[name]['max']}"
+            for name in self.columns[:-1]
+        ]
+        logger.info(
+            f"[Telemetry] {summary['buffers']} buffers, "
+            + ", ".join(parts)
+            + f", buffers owned by PRU min = {summary['pru_buffers']['min']}"
+        )
@@ -0,0 +1,92 @@
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+from shepherd import CalibrationData
+from shepherd import LogWriter
+from shepherd import LogReader
+from shepherd.shepherd_io import DataBuffer
+from shepherd.sample_codec import encode_delta_zigzag
+from shepherd.sample_codec import decode_delta_zigzag
+
+# compares file-size and cpu-time of the sample-codecs for several compressions
+# sudo python3 /opt/shepherd/software/python-package/shepherd/testbench_codec.py
+# optional argument: recording (hdf5) to take the iv-data from, otherwise synthetic
+
+n_buffers = 300  # 30 s of recording
+samples_per_buffer = 10_000
+
+
+def get_iv_data(path: Path = None) -> (np.ndarray, np.ndarray):
+    length = n_buffers * samples_per_buffer
+    if path is not None:
+        with h5py.File(path, "r") as h5file:
+            return (
+                h5file["data"]["voltage"][:length].astype("u4"),
+                h5file["data"]["current"][:length].astype("u4"),
+            )
+    steps = np.arange(length)
+    voltage = 150_000 + 50_000 * np.sin(1e-5 * steps)
+    current = 20_000 + 10_000 * np.sin(3e-5 * steps) ** 2
+    noise = np.random.randint(-16, 16, size=(2, length))
+    return (voltage + noise[0]).astype("u4"), (current + noise[1]).astype("u4")
+
+
+def measure(path: Path, voltage, current, compression, sample_codec) -> dict:
+    ts_cpu = time.process_time()
+    with LogWriter(
+        path,
+        CalibrationData.from_default(),
+        force_overwrite=True,
+        samples_per_buffer=samples_per_buffer,
+        output_compression=compression,
+        buffers_per_write=10,
+        implicit_time=True,
+        sample_codec=sample_codec,
+    ) as writer:
+        for index in range(n_buffers):
+            section = slice(
+                index * samples_per_buffer, (index + 1) * samples_per_buffer
+            )
+            writer.write_buffer(
+                DataBuffer(voltage[section], current[section], index * 10**8)
+            )
+    cpu_write = time.process_time() - ts_cpu
+    ts_cpu = time.process_time()
+    with LogReader(path) as reader:
+        reader.get_data("voltage")
+        reader.get_data("current")
+    cpu_read = time.process_time() - ts_cpu
+    return {"size": path.stat().st_size, "write": cpu_write, "read": cpu_read}
+
+
+if __name__ == "__main__":
+    voltage, current = get_iv_data(Path(sys.argv[1]) if len(sys.argv) > 1 else None)
+
+    ts_cpu = time.process_time()
+    encoded = encode_delta_zigzag(voltage, 0, 0, samples_per_buffer)
+    cpu_encode = time.process_time() - ts_cpu
+    ts_cpu = time.process_time()
+    decode_delta_zigzag(encoded, 0, samples_per_buffer)
+    cpu_decode = time.process_time() - ts_cpu
+    print(
+        f"delta_zigzag for {len(voltage) / 1e6:.1f} M samples: "
+        f"encode = {1e3 * cpu_encode:.0f} ms, decode = {1e3 * cpu_decode:.0f} ms"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for compression in [None, "lzf", 1]:
+            for sample_codec in [None, "shuffle", "delta_zigzag"]:
+                path = Path(tmp_dir) / f"bench_{compression}_{sample_codec}.h5"
+                result = measure(path, voltage, current, compression, sample_codec)
+                print(
+                    f"compression = {str(compression):4}, "
+                    f"codec = {str(sample_codec):12}: "
+                    f"size = {result['size'] / 2**20:6.1f} MiB, "
+                    f"cpu write = {result['write']:5.2f} s, "
+                    f"read = {result['read']:5.2f} s"
+                )
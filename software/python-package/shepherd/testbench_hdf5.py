@@ -0,0 +1,113 @@
+import itertools
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from shepherd import CalibrationData
+from shepherd import LogWriter
+from shepherd.shepherd_io import DataBuffer
+from shepherd.shepherd_io import GPIOEdges
+
+# searches the hdf5 cache- and chunk-settings with the highest throughput of LogWriter
+# sudo python3 /opt/shepherd/software/python-package/shepherd/testbench_hdf5.py
+# optional argument: yaml-file for the best settings, usable with
+#   sheep emulator --hdf5_settings hdf5_settings.yaml ...
+
+n_buffers = 300  # 30 s of recording
+samples_per_buffer = 10_000
+gpio_per_buffer = 200
+compression = "lzf"
+
+rdcc_nbytes_list = [None, 4 * 2**20, 16 * 2**20]  # None is 1 MiB
+data_chunk_list = [samples_per_buffer, 5 * samples_per_buffer, 10 * samples_per_buffer]
+page_buf_list = [None, 4 * 2**20]
+
+
+def next_prime(value: int) -> int:
+    value = max(value, 2)
+    while any(value % divisor == 0 for divisor in range(2, int(value**0.5) + 1)):
+        value += 1
+    return value
+
+
+def get_settings(rdcc_nbytes: int, data_chunk: int, page_buf_size: int) -> dict:
+    settings = {"chunk_lengths": {"data": data_chunk}}
+    if rdcc_nbytes is not None:
+        # about 100 slots per chunk fitting the cache, u4 per sample
+        n_chunks = max(rdcc_nbytes // (4 * data_chunk), 1)
+        settings["rdcc_nbytes"] = rdcc_nbytes
+        settings["rdcc_nslots"] = next_prime(100 * n_chunks)
+    if page_buf_size is not None:
+        settings["page_buf_size"] = page_buf_size
+    return settings
+
+
+def get_buffers(n_variants: int = 10) -> list:
+    buffers = []
+    for index in range(n_variants):
+        gpio_edges = GPIOEdges(
+            np.arange(gpio_per_buffer, dtype="u8") * 1000,
+            np.random.randint(0, 2**10, size=gpio_per_buffer, dtype="u2"),
+        )
+        buffers.append(
+            DataBuffer(
+                np.random.randint(0, 2**18, size=samples_per_buffer, dtype="u4"),
+                np.random.randint(0, 2**18, size=samples_per_buffer, dtype="u4"),
+                0,
+                gpio_edges,
+            )
+        )
+    return buffers
+
+
+def measure(path: Path, cal, buffers: list, settings: dict) -> dict:
+    writer = LogWriter(
+        path,
+        cal,
+        mode="emulator",
+        force_overwrite=True,
+        samples_per_buffer=samples_per_buffer,
+        output_compression=compression,
+        buffers_per_write=10,
+        **settings,
+    )
+    ts_wall = time.perf_counter()
+    ts_cpu = time.process_time()
+    with writer:
+        for index in range(n_buffers):
+            buffer = buffers[index % len(buffers)]
+            buffer.timestamp_ns = index * 10**8
+            writer.write_buffer(buffer)
+    return {"wall": time.perf_counter() - ts_wall, "cpu": time.process_time() - ts_cpu}
+
+
+def report(settings: dict, result: dict) -> None:
+    n_bytes = n_buffers * samples_per_buffer * 8
+    print(
+        f"{str(settings):90}: {n_bytes / result['wall'] / 2**20:6.1f} MiB/s, "
+        f"cpu = {1e3 * result['cpu'] / n_buffers:5.2f} ms/buffer"
+    )
+
+
+if __name__ == "__main__":
+    output_path = Path(sys.argv[1] if len(sys.argv) > 1 else "hdf5_settings.yaml")
+    cal = CalibrationData.from_default()
+    buffers = get_buffers()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for params in itertools.product(
+            rdcc_nbytes_list, data_chunk_list, page_buf_list
+        ):
+            settings = get_settings(*params)
+            result = measure(Path(tmp_dir) / "log.h5", cal, buffers, settings)
+            report(settings, result)
+            results.append((result["wall"], settings))
+
+    best = min(results, key=lambda entry: entry[0])[1]
+    with open(output_path, "w") as settings_file:
+        yaml.safe_dump(best, settings_file, default_flow_style=False)
+    print(f"best settings stored in {output_path}: {best}")
@@ -0,0 +1,62 @@
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from shepherd import CalibrationData
+from shepherd import LogWriter
+from shepherd.shepherd_io import DataBuffer
+
+# compares cpu-time of LogWriter.write_buffer() for several write-batch-sizes
+# run on the node with (takes ~ 1 min, writes to /var/shepherd/recordings by default)
+# sudo python3 /opt/shepherd/software/python-package/shepherd/testbench_logwriter.py
+# optional arguments: output directory, compression (lzf or 1)
+
+n_buffers = 600  # 1 min of recording
+samples_per_buffer = 10_000
+buffer_period_s = 0.1
+
+
+def measure(path: Path, buffers_per_write: int, compression=None) -> (float, float):
+    cal = CalibrationData.from_default()
+    voltage = np.random.randint(0, high=2**18, size=samples_per_buffer, dtype="u4")
+    current = np.random.randint(0, high=2**18, size=samples_per_buffer, dtype="u4")
+    with LogWriter(
+        path,
+        cal,
+        force_overwrite=True,
+        samples_per_buffer=samples_per_buffer,
+        samplerate_sps=int(samples_per_buffer / buffer_period_s),
+        output_compression=compression,
+        duration=n_buffers * buffer_period_s,
+        buffers_per_write=buffers_per_write,
+    ) as writer:
+        ts_cpu = time.process_time()
+        ts_wall = time.perf_counter()
+        for index in range(n_buffers):
+            timestamp_ns = int(index * buffer_period_s * 1e9)
+            writer.write_buffer(DataBuffer(voltage, current, timestamp_ns))
+        writer.flush_stage()
+        return time.process_time() - ts_cpu, time.perf_counter() - ts_wall
+
+
+if __name__ == "__main__":
+    out_dir = (
+        Path(sys.argv[1]) if len(sys.argv) > 1 else Path("/var/shepherd/recordings")
+    )
+    compression = None
+    if len(sys.argv) > 2:
+        compression = int(sys.argv[2]) if sys.argv[2].isdigit() else sys.argv[2]
+
+    recorded_h = n_buffers * buffer_period_s / 3600
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir:
+        for buffers_per_write in [1, 2, 5, 10, 20]:
+            path = Path(tmp_dir) / f"bench_{buffers_per_write}.h5"
+            cpu_s, wall_s = measure(path, buffers_per_write, compression)
+            print(
+                f"buffers_per_write = {buffers_per_write:3d}: "
+                f"cpu = {cpu_s / recorded_h:7.1f} s per recorded hour, "
+                f"wall = {1e3 * wall_s / n_buffers:6.2f} ms per buffer"
+            )
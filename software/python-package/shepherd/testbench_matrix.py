@@ -0,0 +1,213 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from shepherd import CalibrationData
+from shepherd import LogWriter
+from shepherd.shepherd_io import DataBuffer
+from shepherd.shepherd_io import GPIOEdges
+
+# throughput of LogWriter for every combination of compression, chunk-size and
+# skip-flags, fed with synthetic buffers -> runs on any linux machine
+# python3 /opt/shepherd/software/python-package/shepherd/testbench_matrix.py --json matrix.json
+# every combination runs in a fresh process, peak-RSS is reset there before the run
+# and reported as increase over the RSS the process already had (/proc/self/status)
+# in MB/s is the input of the PRU, out MB/s the uncompressed data LogWriter keeps
+
+samples_per_buffer = 10_000
+buffer_period_s = 0.1
+compression_list = [None, "lzf"] + list(range(1, 10))  # "gzip" equals level 4
+chunk_list = [samples_per_buffer, 5 * samples_per_buffer, 10 * samples_per_buffer]
+skip_list = list(itertools.product([False, True], repeat=3))  # voltage, current, gpio
+
+
+def get_buffers(noise_lsb: int, gpio_edges_per_s: float, n_variants: int = 10):
+    """Slowly changing iv-signal with uniform adc-noise, gpio-edges at random
+    times with a poisson-distributed count per buffer
+    """
+    buffers = []
+    steps = np.arange(n_variants * samples_per_buffer)
+    voltage = 150_000 + 50_000 * np.sin(1e-5 * steps)
+    current = 20_000 + 10_000 * np.sin(3e-5 * steps) ** 2
+    buffer_period_ns = int(buffer_period_s * 10**9)
+    for index in range(n_variants):
+        section = slice(index * samples_per_buffer, (index + 1) * samples_per_buffer)
+        noise = np.random.randint(
+            -noise_lsb, noise_lsb + 1, size=(2, samples_per_buffer)
+        )
+        n_edges = np.random.poisson(gpio_edges_per_s * buffer_period_s)
+        gpio_edges = GPIOEdges(
+            np.sort(np.random.randint(0, buffer_period_ns, size=n_edges)).astype("u8"),
+            np.random.randint(0, 2**10, size=n_edges, dtype="u2"),
+        )
+        buffers.append(
+            DataBuffer(
+                (voltage[section] + noise[0]).astype("u4"),
+                (current[section] + noise[1]).astype("u4"),
+                0,
+                gpio_edges,
+            )
+        )
+    return buffers
+
+
+def get_rss_mib(key: str) -> float:
+    """Current ("VmRSS") or peak ("VmHWM") resident memory of this process"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(key + ":"):
+                return int(line.split()[1]) / 2**10
+    raise ValueError(f"{key} not found in /proc/self/status")
+
+
+def reset_peak_rss() -> None:
+    """Sets VmHWM back to the current RSS (linux >= 4.0)"""
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def measure(args: tuple) -> dict:
+    """Runs one combination, meant for a fresh worker-process"""
+    path, settings, duration, noise_lsb, gpio_edges_per_s = args
+    buffers = get_buffers(noise_lsb, gpio_edges_per_s)
+    # bytes per sample / edge that LogWriter keeps (before compression)
+    bytes_per_sample = 8 + 4 * (not settings["skip_voltage"])
+    bytes_per_sample += 4 * (not settings["skip_current"])
+    bytes_per_edge = 0 if settings["skip_gpio"] else 10
+    n_buffers = int(round(duration / buffer_period_s))
+    writer = LogWriter(
+        path,
+        CalibrationData.from_default(),
+        mode="emulator",
+        force_overwrite=True,
+        samples_per_buffer=samples_per_buffer,
+        samplerate_sps=int(samples_per_buffer / buffer_period_s),
+        output_compression=settings["compression"],
+        skip_voltage=settings["skip_voltage"],
+        skip_current=settings["skip_current"],
+        skip_gpio=settings["skip_gpio"],
+        duration=duration,
+        buffers_per_write=10,
+        chunk_lengths={"data": settings["chunk"]},
+    )
+    n_bytes_in = 0
+    n_bytes_out = 0
+    reset_peak_rss()
+    rss_base = get_rss_mib("VmRSS")
+    ts_wall = time.perf_counter()
+    ts_cpu = time.process_time()
+    with writer:
+        for index in range(n_buffers):
+            buffer = buffers[index % len(buffers)]
+            timestamp_ns = int(index * buffer_period_s * 10**9)
+            gpio_edges = GPIOEdges(
+                buffer.gpio_edges.timestamps_ns + np.uint64(timestamp_ns),
+                buffer.gpio_edges.values,
+            )
+            writer.write_buffer(
+                DataBuffer(buffer.voltage, buffer.current, timestamp_ns, gpio_edges)
+            )
+            # input of PRU: u4 voltage & current per sample, u8 time & u2 value per edge
+            n_bytes_in += 8 * len(buffer) + 10 * len(gpio_edges)
+            # output: u8 time per sample, skipped datasets are left out
+            n_bytes_out += bytes_per_sample * len(buffer)
+            n_bytes_out += bytes_per_edge * len(gpio_edges)
+    wall_s = time.perf_counter() - ts_wall
+    cpu_s = time.process_time() - ts_cpu
+    return {
+        **settings,
+        "in_mb_per_s": n_bytes_in / wall_s / 10**6,
+        "out_mb_per_s": n_bytes_out / wall_s / 10**6,
+        "cpu_s_per_s": cpu_s / (n_buffers * buffer_period_s),
+        "rss_increase_mib": get_rss_mib("VmHWM") - rss_base,
+        "file_size_mib": Path(path).stat().st_size / 2**20,
+    }
+
+
+def print_table(results: list) -> None:
+    print(
+        f"{'compression':>11} {'chunk':>7} {'skip v/c/g':>10} | {'in MB/s':>8} "
+        f"{'out MB/s':>8} {'cpu s/s':>8} {'+RSS MiB':>8} {'file MiB':>9}"
+    )
+    for result in results:
+        skips = "".join(
+            "x" if result[f"skip_{name}"] else "-"
+            for name in ["voltage", "current", "gpio"]
+        )
+        print(
+            f"{str(result['compression']):>11} {result['chunk']:7d} {skips:>10} | "
+            f"{result['in_mb_per_s']:8.1f} {result['out_mb_per_s']:8.1f} "
+            f"{result['cpu_s_per_s']:8.3f} {result['rss_increase_mib']:8.1f} "
+            f"{result['file_size_mib']:9.2f}"
+        )
+
+
+def compression_arg(value: str):
+    if value == "none":
+        return None
+    return int(value) if value.isdigit() else value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LogWriter throughput matrix")
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="recorded seconds per run"
+    )
+    parser.add_argument("--noise", type=int, default=16, help="adc-noise [+- lsb]")
+    parser.add_argument(
+        "--gpio_edges", type=float, default=1000.0, help="gpio-edges per second"
+    )
+    parser.add_argument(
+        "--compression",
+        type=compression_arg,
+        nargs="+",
+        default=compression_list,
+        help="none, lzf or gzip-level 1-9",
+    )
+    parser.add_argument("--chunks", type=int, nargs="+", default=chunk_list)
+    parser.add_argument(
+        "--no_skips", action="store_true", help="only run without skip-flags"
+    )
+    parser.add_argument("--output", type=Path, default=None, help="dir for files")
+    parser.add_argument(
+        "--json", type=Path, default=None, help="store results, printed otherwise"
+    )
+    args = parser.parse_args()
+
+    skips = [(False, False, False)] if args.no_skips else skip_list
+    results = []
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory(dir=args.output) as tmp_dir:
+        for compression, chunk, skip in itertools.product(
+            args.compression, args.chunks, skips
+        ):
+            settings = {
+                "compression": compression,
+                "chunk": chunk,
+                "skip_voltage": skip[0],
+                "skip_current": skip[1],
+                "skip_gpio": skip[2],
+            }
+            job = (
+                Path(tmp_dir) / "matrix.h5",
+                settings,
+                args.duration,
+                args.noise,
+                args.gpio_edges,
+            )
+            with context.Pool(processes=1, maxtasksperchild=1) as pool:
+                results.append(pool.apply(measure, (job,)))
+
+    print_table(results)
+    if args.json is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f"results stored in {args.json}")
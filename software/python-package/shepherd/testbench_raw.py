@@ -0,0 +1,87 @@
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from shepherd import CalibrationData
+from shepherd import LogWriter
+from shepherd import RawLogWriter
+from shepherd.raw_log import convert_raw
+from shepherd.shepherd_io import DataBuffer
+from shepherd.shepherd_io import GPIOEdges
+
+# compares throughput of LogWriter and RawLogWriter for emulation with gpio-tracing
+# sudo python3 /opt/shepherd/software/python-package/shepherd/testbench_raw.py
+
+n_buffers = 600  # 60 s of recording
+samples_per_buffer = 10_000
+gpio_per_buffer = 200
+
+
+def get_buffers(n_variants: int = 10) -> list:
+    buffers = []
+    for index in range(n_variants):
+        gpio_edges = GPIOEdges(
+            np.arange(gpio_per_buffer, dtype="u8") * 1000,
+            np.random.randint(0, 2**10, size=gpio_per_buffer, dtype="u2"),
+        )
+        buffers.append(
+            DataBuffer(
+                np.random.randint(0, 2**18, size=samples_per_buffer, dtype="u4"),
+                np.random.randint(0, 2**18, size=samples_per_buffer, dtype="u4"),
+                0,
+                gpio_edges,
+            )
+        )
+    return buffers
+
+
+def measure(writer, buffers: list) -> dict:
+    ts_wall = time.perf_counter()
+    ts_cpu = time.process_time()
+    with writer:
+        for index in range(n_buffers):
+            buffer = buffers[index % len(buffers)]
+            buffer.timestamp_ns = index * 10**8
+            writer.write_buffer(buffer)
+    return {"wall": time.perf_counter() - ts_wall, "cpu": time.process_time() - ts_cpu}
+
+
+def report(name: str, result: dict) -> None:
+    n_bytes = n_buffers * samples_per_buffer * 8
+    print(
+        f"{name:28}: {n_buffers / result['wall']:7.1f} buffers/s, "
+        f"{n_bytes / result['wall'] / 2**20:6.1f} MiB/s, "
+        f"cpu = {1e3 * result['cpu'] / n_buffers:5.2f} ms/buffer"
+    )
+
+
+if __name__ == "__main__":
+    cal = CalibrationData.from_default()
+    buffers = get_buffers()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for compression in [None, "lzf"]:
+            writer = LogWriter(
+                Path(tmp_dir) / f"log_{compression}.h5",
+                cal,
+                mode="emulator",
+                samples_per_buffer=samples_per_buffer,
+                output_compression=compression,
+                buffers_per_write=10,
+            )
+            report(f"LogWriter ({compression})", measure(writer, buffers))
+
+        for alignment in [0, 4096]:
+            writer = RawLogWriter(
+                Path(tmp_dir) / f"raw_{alignment}.h5",
+                cal,
+                mode="emulator",
+                samples_per_buffer=samples_per_buffer,
+                alignment=alignment,
+            )
+            report(f"RawLogWriter (align {alignment})", measure(writer, buffers))
+
+        ts_wall = time.perf_counter()
+        convert_raw(Path(tmp_dir) / "raw_0.raw", Path(tmp_dir) / "converted.h5")
+        print(f"conversion to hdf5 took {time.perf_counter() - ts_wall:.1f} s")
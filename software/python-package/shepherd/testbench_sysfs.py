@@ -0,0 +1,52 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from shepherd import sysfs_interface
+
+# compares per-call cost of the cached sysfs-handles with the former open/read/close
+# run with (module must be loaded, shepherd should be idle -> msg-box stays empty)
+# sudo python3 /opt/shepherd/software/python-package/shepherd/testbench_sysfs.py
+# optional argument: alternative directory with fake attributes (regular files)
+
+
+def legacy_read(attribute: str) -> str:
+    with open(sysfs_interface.sysfs_path / attribute, "r") as f:
+        return str(f.read().rstrip())
+
+
+def measure(fn, iterations: int = 10_000) -> np.ndarray:
+    durations = np.empty(iterations)
+    for i in range(iterations):
+        ts_start = time.perf_counter()
+        fn()
+        durations[i] = time.perf_counter() - ts_start
+    return durations
+
+
+def report(name: str, durations: np.ndarray) -> None:
+    print(
+        f"{name:<24} mean = {1e6 * durations.mean():7.2f} us, "
+        f"p99 = {1e6 * np.percentile(durations, 99):7.2f} us, "
+        f"max = {1e6 * durations.max():8.2f} us"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sysfs_interface.sysfs_path = Path(sys.argv[1])
+
+    candidates = {
+        "state (legacy)": lambda: legacy_read("state"),
+        "state (handle)": sysfs_interface.get_state,
+        "pru_msg_box (legacy)": lambda: legacy_read("pru_msg_box"),
+        "pru_msg_box (handle)": lambda: sysfs_interface.get_handle(
+            "pru_msg_box"
+        ).read(),
+    }
+    for name, fn in candidates.items():
+        fn()  # warm up, handles get opened
+        report(name, measure(fn))
+    sysfs_interface.close_handles()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+shepherd.uart_capture
+~~~~~
+Captures the raw bytes of the target-uart. A thread waits with select() on
+the serial port and reads whatever arrived directly into a preallocated
+ring buffer, every read becomes a chunk with its own receive-timestamp.
+LogWriter takes the bytes and the chunk-table out in bulk and appends them
+to the file, so nothing gets decoded, split or lost at high baudrates.
+
+
+:copyright: (c) 2019 Networked Embedded Systems Lab, TU Dresden.
+:license: MIT, see LICENSE for more details.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from typing import NoReturn
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class UartCapture(object):
+    """Ring buffer for the bytes of a file descriptor (e.g. a serial port)
+
+    The capture-thread is the only one writing to the ring, pop() is the
+    only one taking bytes out. When the ring is full, new bytes get
+    dropped and counted, see n_dropped.
+
+    Args:
+        ring_size (int): capacity of the ring buffer [byte]
+        max_chunks (int): capacity of the chunk-table [reads], when full
+            further reads get appended to the latest chunk
+        wait_timeout (float): longest wait for data [s], the thread checks
+            for stop that often
+    """
+
+    def __init__(
+        self,
+        ring_size: int = 2**20,
+        max_chunks: int = 2**14,
+        wait_timeout: float = 0.1,
+    ):
+        self.ring_size = ring_size
+        self.max_chunks = max_chunks
+        self.wait_timeout = wait_timeout
+        self._ring = np.zeros(ring_size, dtype="u1")
+        self._view = memoryview(self._ring)
+        self._chunk_time = np.zeros(max_chunks, dtype="u8")
+        self._chunk_offset = np.zeros(max_chunks, dtype="u8")
+        # counters only grow, positions in ring and chunk-table are modulo
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._chunks_in = 0
+        self._chunks_out = 0
+        self.n_dropped = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, fd: int) -> NoReturn:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(fd,), name="uart_capture", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> NoReturn:
+        self._stop.set()
+        # monitor-thread and LogWriter may both stop the capture
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _run(self, fd: int) -> NoReturn:
+        while not self._stop.is_set():
+            try:
+                readable, _, _ = select.select([fd], [], [], self.wait_timeout)
+                if readable:
+                    self.read(fd, time.time_ns())
+            except OSError as e:
+                logger.error(f"[UartCapture] failed to read ({e}) -> will stop")
+                break
+
+    def read(self, fd: int, timestamp_ns: int) -> int:
+        """Reads the pending bytes of fd into the ring as one chunk
+
+        :param fd: file descriptor, readable without blocking
+        :param timestamp_ns: receive-time of the chunk
+        :return: number of bytes stored
+        """
+        with self._lock:
+            free = self.ring_size - (self._bytes_in - self._bytes_out)
+        if free == 0:
+            # drain fd anyway, select() would return immediately otherwise
+            self.n_dropped += len(os.read(fd, 4096))
+            return 0
+        start = self._bytes_in % self.ring_size
+        end = min(start + free, self.ring_size)
+        # free space may wrap around, readv() fills both parts at once
+        parts = [self._view[start:end]]
+        if end - start < free:
+            parts.append(self._view[: free - (end - start)])
+        n_bytes = os.readv(fd, parts)
+        if n_bytes == 0:
+            return 0
+        with self._lock:
+            if self._chunks_in - self._chunks_out < self.max_chunks:
+                index = self._chunks_in % self.max_chunks
+                self._chunk_time[index] = timestamp_ns
+                self._chunk_offset[index] = self._bytes_in
+                self._chunks_in += 1
+            self._bytes_in += n_bytes
+        return n_bytes
+
+    def pop(self) -> dict:
+        """Takes the captured bytes and their chunk-table
+
+        :return: data (u1), time [ns] and offset of every chunk, offsets
+            point into data
+        """
+        with self._lock:
+            bytes_out, bytes_in = self._bytes_out, self._bytes_in
+            chunks_out, chunks_in = self._chunks_out, self._chunks_in
+        start = bytes_out % self.ring_size
+        end = start + bytes_in - bytes_out
+        if end <= self.ring_size:
+            data = self._ring[start:end].copy()
+        else:
+            data = np.concatenate(
+                (self._ring[start:], self._ring[: end - self.ring_size])
+            )
+        chunks = np.arange(chunks_out, chunks_in) % self.max_chunks
+        result = {
+            "data": data,
+            "time": self._chunk_time[chunks],
+            "offset": self._chunk_offset[chunks] - np.uint64(bytes_out),
+        }
+        with self._lock:
+            self._bytes_out = bytes_in
+            self._chunks_out = chunks_in
+        return result
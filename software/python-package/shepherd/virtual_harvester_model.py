@@ -12,7 +12,7 @@ Compromises:
 - Python has no static vars -> FName_reset is handling the class-vars
 
 """
-from shepherd.virtual_harvester_data import VirtualHarvesterConfig
+from shepherd.virtual_harvester_config import VirtualHarvesterConfig
 
 
 class KernelHarvesterStruct:
@@ -4,7 +4,7 @@ from pathlib import Path
 import yaml
 import logging
 
-from shepherd import VirtualHarvesterConfig
+from shepherd.virtual_harvester_config import VirtualHarvesterConfig
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,105 @@
+import pytest
+import numpy as np
+import h5py
+
+from shepherd import LogWriter
+from shepherd import CalibrationData
+from shepherd.buffer_pipeline import PipelinedWriter
+from shepherd.buffer_pipeline import PrefetchReader
+from shepherd.shepherd_io import DataBuffer
+from shepherd.shepherd_io import GPIOEdges
+from shepherd.shepherd_io import ShepherdIOException
+from shepherd.datalog import ExceptionRecord
+
+
+def random_data(length):
+    return np.random.randint(0, high=2**18, size=length, dtype="u4")
+
+
+@pytest.fixture
+def calibration_data():
+    return CalibrationData.from_default()
+
+
+@pytest.mark.parametrize("queue_size", [1, 16])
+def test_pipelined_writer_copies_buffers(tmp_path, calibration_data, queue_size):
+    len_ = 10_000
+    voltage = np.empty(len_, dtype="u4")
+    current = np.empty(len_, dtype="u4")
+    voltages = list()
+    d = tmp_path / "pipelined.h5"
+    with LogWriter(d, calibration_data, mode="emulator") as log_writer:
+        with PipelinedWriter(log_writer, len_, queue_size) as writer:
+            for i in range(50):
+                # reuse the same arrays, like the shared memory would be
+                voltage[:] = random_data(len_)
+                current[:] = random_data(len_)
+                voltages.append(voltage.copy())
+                edges = GPIOEdges(
+                    np.array([i * 10**8], dtype="u8"), np.array([i], dtype="u2")
+                )
+                writer.write_buffer(DataBuffer(voltage, current, i * 10**8, edges))
+            writer.write_exception(ExceptionRecord(0, "test", 42))
+            stats = writer.get_stats()
+            assert stats["buffers"] == 50
+            assert stats["queue_depth_max"] <= queue_size
+
+    with h5py.File(d, "r") as written:
+        assert np.array_equal(written["data"]["voltage"][:], np.concatenate(voltages))
+        assert np.array_equal(written["gpio"]["value"][:], np.arange(50))
+        assert written["exceptions"]["value"][0] == 42
+
+
+def test_pipelined_writer_raises_writer_errors():
+    class FailingWriter:
+        @staticmethod
+        def write_buffer(buffer):
+            raise OSError("disk full")
+
+    writer = PipelinedWriter(FailingWriter(), 100)
+    buffer = DataBuffer(random_data(100), random_data(100), 0)
+    with pytest.raises(ShepherdIOException):
+        with writer:
+            for _ in range(100):
+                writer.write_buffer(buffer)
+
+
+def scale_by_two(buffer, voltage_out, current_out):
+    np.multiply(buffer.voltage, 2, out=voltage_out, casting="unsafe")
+    np.multiply(buffer.current, 2, out=current_out, casting="unsafe")
+
+
+@pytest.mark.parametrize("lookahead", [1, 4])
+def test_prefetch_reader_converts_in_order(lookahead):
+    len_ = 1_000
+    source = [(i, random_data(len_), random_data(len_)) for i in range(40)]
+    with PrefetchReader(source, len_, scale_by_two, lookahead) as reader:
+        for (ts, voltage, current), buffer in zip(source, reader):
+            assert buffer.timestamp_ns == ts
+            assert np.array_equal(buffer.voltage, 2 * voltage)
+            assert np.array_equal(buffer.current, 2 * current)
+        stats = reader.get_stats()
+    assert stats["buffers"] == len(source)
+
+
+def test_prefetch_reader_short_buffer():
+    len_ = 1_000
+    source = [(i, random_data(len_), random_data(len_)) for i in range(5)]
+    # last buffer of a file is shorter, its slot held a full one before
+    source.append((5, random_data(300), random_data(300)))
+    with PrefetchReader(source, len_, scale_by_two, 1) as reader:
+        buffers = [(buffer.voltage.copy(), buffer.current.copy()) for buffer in reader]
+    assert len(buffers[-1][0]) == 300
+    assert np.array_equal(buffers[-1][0], 2 * source[-1][1])
+    assert np.array_equal(buffers[-1][1], 2 * source[-1][2])
+
+
+def test_prefetch_reader_raises_source_errors():
+    def failing_source():
+        yield 0, random_data(100), random_data(100)
+        raise OSError("read error")
+
+    with PrefetchReader(failing_source(), 100, scale_by_two) as reader:
+        with pytest.raises(ShepherdIOException):
+            for _ in reader:
+                pass
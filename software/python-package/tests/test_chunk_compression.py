@@ -0,0 +1,96 @@
+import pytest
+import h5py
+import numpy as np
+
+from shepherd import LogWriter
+from shepherd import CalibrationData
+from shepherd.shepherd_io import DataBuffer
+from shepherd.chunk_compression import ChunkCompressor
+from shepherd.chunk_compression import repack
+
+
+def random_data(length):
+    return np.random.randint(0, high=2**18, size=length, dtype="u4")
+
+
+@pytest.fixture
+def voltages():
+    return [random_data(10_000) for _ in range(12)]
+
+
+def write_recording(path, voltages, **kwargs):
+    with LogWriter(path, CalibrationData.from_default(), **kwargs) as writer:
+        for i, voltage in enumerate(voltages):
+            writer.write_buffer(DataBuffer(voltage, random_data(len(voltage)), i))
+
+
+@pytest.mark.parametrize("buffers_per_write", [1, 5])
+def test_logwriter_threaded_compression(tmp_path, voltages, buffers_per_write):
+    path = tmp_path / "threaded.h5"
+    write_recording(
+        path,
+        voltages,
+        output_compression=1,
+        buffers_per_write=buffers_per_write,
+        compression_threads=2,
+    )
+    with h5py.File(path, "r") as written:
+        # readable with the regular gzip-filter
+        assert written["data"]["voltage"].compression == "gzip"
+        assert np.array_equal(written["data"]["voltage"][:], np.concatenate(voltages))
+        assert written["data"]["time"][-1] == 11 + 99_990_000
+
+
+def test_logwriter_threaded_compression_partial_buffer(tmp_path, voltages):
+    path = tmp_path / "threaded_partial.h5"
+    voltages[5] = voltages[5][:1234]
+    write_recording(path, voltages, output_compression="gzip", compression_threads=2)
+    with h5py.File(path, "r") as written:
+        assert np.array_equal(written["data"]["voltage"][:], np.concatenate(voltages))
+
+
+def test_logwriter_threaded_compression_needs_gzip(tmp_path):
+    writer = LogWriter(
+        tmp_path / "lzf.h5",
+        CalibrationData.from_default(),
+        output_compression="lzf",
+        compression_threads=2,
+    )
+    assert writer.compression_threads == 0
+
+
+def test_compressor_pending_limit(tmp_path):
+    with h5py.File(tmp_path / "direct.h5", "w") as h5file:
+        dataset = h5file.create_dataset(
+            "value", (0,), dtype="u8", maxshape=(None,), chunks=(100,), compression=9
+        )
+        dataset.resize((10_000,))
+        with ChunkCompressor(9, threads=1, max_pending=3) as compressor:
+            assert not compressor.is_aligned(dataset, 50, 100)
+            compressor.submit(dataset, 0, np.arange(10_000, dtype="u8"))
+            assert len(compressor._pending) <= 3
+        assert np.array_equal(dataset[:], np.arange(10_000))
+
+
+def test_repack(tmp_path, voltages):
+    path = tmp_path / "uncompressed.h5"
+    path_packed = tmp_path / "packed.h5"
+    write_recording(path, voltages)
+    repack(path, path_packed, level=6, threads=2)
+    assert path_packed.stat().st_size < path.stat().st_size
+
+    with h5py.File(path, "r") as original, h5py.File(path_packed, "r") as packed:
+        assert dict(packed.attrs) == dict(original.attrs)
+        for name in ["data/voltage", "data/current", "data/time", "buffers/time"]:
+            assert packed[name].compression == "gzip"
+            assert packed[name].compression_opts == 6
+            assert np.array_equal(packed[name][:], original[name][:])
+        assert packed["data"]["voltage"].attrs["gain"] == pytest.approx(
+            original["data"]["voltage"].attrs["gain"]
+        )
+        assert (
+            packed["telemetry"]["value"].shape == original["telemetry"]["value"].shape
+        )
+
+    with pytest.raises(ValueError):
+        repack(path, tmp_path / "invalid.h5", level=0)
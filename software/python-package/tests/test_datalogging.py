@@ -9,6 +9,8 @@ from shepherd_data import Reader
 
 from shepherd import cal_channel_list
 from shepherd import LogWriter
+from shepherd import LogReader
+from shepherd import LogFollower
 from shepherd import CalibrationData
 from shepherd.calibration import cal_parameter_list, cal_channel_hrv_dict
 
@@ -137,6 +139,272 @@ def test_exception_logging(tmp_path, data_buffer, calibration_data):
         assert writer.xcpt_grp["time"][1] == ts + 1
 
 
+@pytest.mark.parametrize("duration", [None, 2, 10])
+def test_logwriter_preallocation(tmp_path, calibration_data, duration):
+    d = tmp_path / "harvest_prealloc.h5"
+    len_ = 10_000
+    with LogWriter(
+        file_path=d, calibration_data=calibration_data, duration=duration
+    ) as writer:
+        if duration is not None:
+            assert writer.data_grp["time"].shape[0] == duration * 100_000 + len_
+        for i in range(30):
+            writer.write_buffer(DataBuffer(random_data(len_), random_data(len_), i))
+            assert writer.data_length == writer.data_grp["time"].shape[0]
+            assert writer.data_length % writer.data_grp["time"].chunks[0] == 0
+
+    with h5py.File(d, "r") as written:
+        assert written["data"]["voltage"].shape[0] == 30 * len_
+        assert written["data"]["time"][-1] == 29 + 99_990_000
+
+
+@pytest.mark.parametrize("buffers_per_write", [1, 4])
+def test_logwriter_staging(tmp_path, calibration_data, buffers_per_write):
+    d = tmp_path / "harvest_staged.h5"
+    len_ = 10_000
+    voltages = []
+    with LogWriter(
+        file_path=d,
+        calibration_data=calibration_data,
+        buffers_per_write=buffers_per_write,
+    ) as writer:
+        for i in range(10):
+            voltages.append(random_data(len_))
+            writer.write_buffer(DataBuffer(voltages[-1], random_data(len_), i))
+            # only complete batches have reached the file
+            n_written = (i + 1) // buffers_per_write * buffers_per_write
+            assert writer.data_pos == n_written * len_
+
+    with h5py.File(d, "r") as written:
+        assert np.array_equal(written["data"]["voltage"][:], np.concatenate(voltages))
+        assert written["data"]["time"][-1] == 9 + 99_990_000
+
+
+def test_logwriter_staging_timer(tmp_path, calibration_data, data_buffer):
+    d = tmp_path / "harvest_staged.h5"
+    with LogWriter(
+        file_path=d, calibration_data=calibration_data, buffers_per_write=100
+    ) as writer:
+        writer.stage_intervall_ns = 0
+        writer.write_buffer(data_buffer)
+        assert writer.data_pos == len(data_buffer)
+
+
+@pytest.mark.parametrize("buffers_per_write", [1, 4])
+def test_logwriter_implicit_time(tmp_path, calibration_data, buffers_per_write):
+    len_ = 10_000
+    buffer_period_ns = 100_000_000
+    # buffer 6 arrives one period late -> gap
+    timestamps = [i * buffer_period_ns for i in range(6)]
+    timestamps += [(i + 1) * buffer_period_ns for i in range(6, 10)]
+    paths = {}
+    for implicit_time in [False, True]:
+        paths[implicit_time] = tmp_path / f"harvest_implicit_{implicit_time}.h5"
+        with LogWriter(
+            file_path=paths[implicit_time],
+            calibration_data=calibration_data,
+            buffers_per_write=buffers_per_write,
+            implicit_time=implicit_time,
+        ) as writer:
+            for timestamp in timestamps:
+                writer.write_buffer(
+                    DataBuffer(random_data(len_), random_data(len_), timestamp)
+                )
+
+    with h5py.File(paths[True], "r") as written:
+        assert "time" not in written["data"]
+        assert written["buffers"]["time"].shape[0] == 10
+        assert np.all(written["buffers"]["n_samples"][:] == len_)
+
+    with LogReader(paths[False]) as explicit, LogReader(paths[True]) as implicit:
+        assert implicit.implicit_time and not explicit.implicit_time
+        assert implicit.n_samples == explicit.n_samples == 10 * len_
+        assert np.array_equal(implicit.get_time(), explicit.get_time())
+        assert np.array_equal(
+            implicit.get_time(55_555, 65_432), explicit.get_time(55_555, 65_432)
+        )
+        chunks = list(implicit.read_time(chunk_size=30_000))
+        assert len(chunks) == 4
+        assert np.array_equal(np.concatenate(chunks), explicit.get_time())
+        assert np.array_equal(implicit.find_gaps(), [6])
+        assert np.array_equal(explicit.find_gaps(), [6])
+        assert implicit.get_buffer_jitter()[5] == buffer_period_ns
+
+
+def test_logwriter_monitor_queues(tmp_path, calibration_data, data_buffer):
+    d = tmp_path / "harvest_monitors.h5"
+    with LogWriter(file_path=d, calibration_data=calibration_data) as writer:
+        # monitor-threads only fill the queues
+        for i in range(250):
+            writer._dmesg_queue.append((i, f"line {i}"))
+        writer._timesync_queue.append((7, [-4426, 285889, 12484]))
+        assert writer.dmesg_pos == 0
+        writer.write_buffer(data_buffer)
+        assert writer.dmesg_pos == 250
+        assert len(writer._dmesg_queue) == 0
+        writer._dmesg_queue.append((250, "last line"))
+
+    with h5py.File(d, "r") as written:
+        assert written["dmesg"]["time"].shape[0] == 251
+        assert written["dmesg"]["message"][250].decode() == "last line"
+        assert np.array_equal(written["dmesg"]["time"][:], np.arange(251))
+        assert list(written["timesync"]["value"][0]) == [-4426, 285889, 12484]
+
+
+@pytest.mark.parametrize("compression_threads", [0, 2])
+def test_logwriter_swmr(tmp_path, calibration_data, compression_threads):
+    d = tmp_path / "harvest_swmr.h5"
+    voltages = [random_data(10_000) for _ in range(6)]
+    with LogWriter(
+        file_path=d,
+        calibration_data=calibration_data,
+        output_compression=1,
+        compression_threads=compression_threads,
+        swmr=True,
+    ) as writer:
+        writer.swmr_flush_intervall_ns = 0
+        writer["hostname"] = "sheep0"
+        for i in range(3):
+            writer.write_buffer(DataBuffer(voltages[i], voltages[i], i * 10**8))
+
+        with LogFollower(d) as follower:
+            assert follower.n_samples == 30_000
+            assert np.array_equal(
+                follower.get_data("voltage"), np.concatenate(voltages[:3])
+            )
+            for i in range(3, 6):
+                writer.write_buffer(DataBuffer(voltages[i], voltages[i], i * 10**8))
+            assert follower.refresh() == 30_000
+            assert np.array_equal(
+                follower.get_data("current", 30_000), np.concatenate(voltages[3:])
+            )
+            assert follower.get_time()[-1] == 5 * 10**8 + 9_999 * 10**4
+
+    with LogFollower(d) as follower:
+        batches = list(follower.follow(poll_intervall=0.01, timeout=0.05))
+        assert len(batches) == 1
+        assert np.array_equal(batches[0][1], np.concatenate(voltages))
+
+
+def test_logwriter_summary(tmp_path, calibration_data, monkeypatch):
+    d = tmp_path / "harvest_summary.h5"
+    monkeypatch.setattr(LogWriter, "summary_bins_ns", [10**6, 10**7, 10**9])
+    voltages = [random_data(10_000) for _ in range(25)]
+    with LogWriter(
+        file_path=d, calibration_data=calibration_data, summary=True
+    ) as writer:
+        for i, voltage in enumerate(voltages):
+            writer.write_buffer(DataBuffer(voltage, voltage, i * 10**8))
+        cal = writer.get_calibration("voltage")
+    voltage = np.concatenate(voltages) * cal["gain"] + cal["offset"]
+
+    with h5py.File(d, "r") as written:
+        summary = written["summary"]
+        assert summary["level_0"].attrs["bin_samples"] == 100
+        assert summary["level_0"]["time"].shape[0] == 2_500
+        assert summary["level_1"]["time"].shape[0] == 250
+        # last bin is shorter
+        assert summary["level_2"]["time"].shape[0] == 3
+        bins = voltage.reshape(-1, 100)
+        values = summary["level_0"]["voltage"][:]
+        assert np.allclose(values[:, 0], bins.min(axis=1))
+        assert np.allclose(values[:, 1], bins.max(axis=1))
+        assert np.allclose(values[:, 2], bins.mean(axis=1))
+        assert np.allclose(summary["level_2"]["voltage"][2, 2], voltage[200_000:].mean())
+
+    with LogReader(d) as reader:
+        summary = reader.get_summary(max_points=300)
+        assert summary["time"].shape[0] == 250
+        summary = reader.get_summary(5 * 10**6, 25 * 10**6)
+        assert np.array_equal(summary["time"], np.arange(5, 25) * 10**6)
+        # merged from the coarsest level that is still too fine
+        summary = reader.get_summary(max_points=2)
+        assert summary["time"].shape[0] == 2
+        assert np.isclose(summary["voltage"][0, 0], voltage[:200_000].min())
+        assert np.isclose(summary["voltage"][0, 1], voltage[:200_000].max())
+
+
+def test_logwriter_summary_optional(tmp_path, calibration_data, data_buffer):
+    d = tmp_path / "harvest_no_summary.h5"
+    with LogWriter(file_path=d, calibration_data=calibration_data) as writer:
+        writer.write_buffer(data_buffer)
+    with LogReader(d) as reader:
+        assert reader.energy_totals == {}
+        with pytest.raises(ValueError):
+            reader.get_summary()
+
+    # no buffer reached the summary
+    d = tmp_path / "harvest_empty_summary.h5"
+    with LogWriter(file_path=d, calibration_data=calibration_data, summary=True):
+        pass
+    with LogReader(d) as reader:
+        summary = reader.get_summary()
+        assert summary["time"].shape == (0,)
+        assert summary["voltage"].shape == (0, 3)
+
+
+def test_logwriter_energy(tmp_path, calibration_data):
+    d = tmp_path / "harvest_energy.h5"
+    voltages = [random_data(10_000) for _ in range(25)]
+    with LogWriter(
+        file_path=d,
+        calibration_data=calibration_data,
+        energy=True,
+        on_threshold_w=1e-3,
+    ) as writer:
+        for i, voltage in enumerate(voltages):
+            writer.write_buffer(DataBuffer(voltage, voltage, i * 10**8))
+        cal_v = writer.get_calibration("voltage")
+        cal_c = writer.get_calibration("current")
+    raw = np.concatenate(voltages)
+    power = (raw * cal_v["gain"] + cal_v["offset"]) * (
+        raw * cal_c["gain"] + cal_c["offset"]
+    )
+
+    with h5py.File(d, "r") as written:
+        energy = written["summary"]["energy"]
+        assert energy["time"].shape[0] == 3
+        assert np.isclose(energy["energy"][0], power[:100_000].sum() * 1e-5)
+        assert np.isclose(written.attrs["energy_j"], power.sum() * 1e-5)
+    with LogReader(d) as reader:
+        totals = reader.energy_totals
+        assert np.isclose(totals["power_mean_w"], power.mean())
+        assert np.isclose(totals["on_time_s"], np.sum(power > 1e-3) * 1e-5)
+        assert np.isclose(totals["duration_s"], 2.5)
+        # energy-accounting runs without the summary-pyramid
+        assert reader.get_summary()["time"].shape == (0,)
+
+
+def test_logwriter_cache_settings(tmp_path, calibration_data):
+    d = tmp_path / "harvest_cache.h5"
+    voltages = [random_data(10_000) for _ in range(5)]
+    with LogWriter(
+        file_path=d,
+        calibration_data=calibration_data,
+        mode="emulator",
+        rdcc_nbytes=4 * 2**20,
+        rdcc_nslots=10_007,
+        mdc_nbytes=2**20,
+        page_buf_size=2**20,
+        chunk_lengths={"data": 25_000, "gpio": 500, "timesync": 10},
+    ) as writer:
+        cache = writer._h5file.id.get_access_plist().get_cache()
+        assert list(cache[1:3]) == [10_007, 4 * 2**20]
+        assert writer._h5file.id.get_mdc_size()[0] >= 2**20
+        assert writer.data_length % 25_000 == 0
+        for i, voltage in enumerate(voltages):
+            writer.write_buffer(DataBuffer(voltage, voltage, i * 10**8))
+
+    with h5py.File(d, "r") as written:
+        assert written["data"]["voltage"].chunks == (25_000,)
+        assert written["gpio"]["value"].chunks == (500,)
+        assert written["timesync"]["value"].chunks == (10, 3)
+        assert np.array_equal(written["data"]["voltage"][:], np.concatenate(voltages))
+
+    with pytest.raises(ValueError):
+        LogWriter(d, calibration_data, chunk_lengths={"voltage": 100})
+
+
 def test_key_value_store(tmp_path, calibration_data):
     d = tmp_path / "harvest.h5"
 
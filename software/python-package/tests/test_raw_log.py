@@ -0,0 +1,90 @@
+import h5py
+import numpy as np
+import pytest
+
+from shepherd import CalibrationData
+from shepherd import LogReader
+from shepherd import RawLogWriter
+from shepherd.datalog import ExceptionRecord
+from shepherd.raw_log import RawLogReader
+from shepherd.raw_log import convert_raw
+from shepherd.segments import create_log_writer
+from shepherd.shepherd_io import DataBuffer
+from shepherd.shepherd_io import GPIOEdges
+
+
+def random_data(length):
+    return np.random.randint(0, high=2**18, size=length, dtype="u4")
+
+
+def write_recording(writer, n_buffers: int) -> list:
+    buffers = []
+    for i in range(n_buffers):
+        gpio_edges = GPIOEdges(
+            np.arange(i, dtype="u8") + i * 10**8, np.arange(i, dtype="u2")
+        )
+        buffers.append(
+            DataBuffer(random_data(10_000), random_data(10_000), i * 10**8, gpio_edges)
+        )
+        writer.write_buffer(buffers[-1])
+    return buffers
+
+
+@pytest.mark.parametrize("alignment", [0, 4096])
+def test_raw_log_writer(tmp_path, alignment):
+    with RawLogWriter(
+        tmp_path / "rec.h5",
+        CalibrationData.from_default(),
+        mode="emulator",
+        alignment=alignment,
+    ) as writer:
+        writer["hostname"] = "sheep0"
+        writer.embed_config({"dtype": "ivsample"})
+        buffers = write_recording(writer, 5)
+        writer.write_exception(ExceptionRecord(7, "failure", 3))
+        writer.write_telemetry(np.arange(2), np.ones((2, 5), dtype="i4"))
+    assert writer.store_path == tmp_path / "rec.raw"
+
+    reader = RawLogReader(tmp_path / "rec.raw")
+    assert reader.meta["attributes"]["hostname"] == "sheep0"
+    assert reader.exceptions == [ExceptionRecord(7, "failure", 3)]
+    assert reader.telemetry.shape[0] == 2
+    if alignment:
+        assert np.all(reader.index["offset"] % alignment == 0)
+    for buffer, written in zip(buffers, reader.read_buffers()):
+        assert written.timestamp_ns == buffer.timestamp_ns
+        assert np.array_equal(written.voltage, buffer.voltage)
+        assert np.array_equal(written.current, buffer.current)
+        assert np.array_equal(written.gpio_edges.values, buffer.gpio_edges.values)
+
+
+def test_convert_raw(tmp_path):
+    cal = CalibrationData.from_default()
+    with RawLogWriter(tmp_path / "rec.h5", cal, mode="emulator") as writer:
+        writer["hostname"] = "sheep0"
+        buffers = write_recording(writer, 5)
+        writer.write_exception(ExceptionRecord(7, "failure", 3))
+
+    path = convert_raw(tmp_path / "rec.raw", tmp_path / "rec.h5")
+    with LogReader(path) as reader:
+        assert reader.n_samples == 50_000
+        assert np.array_equal(
+            reader.get_data("voltage"),
+            np.concatenate([buffer.voltage for buffer in buffers]),
+        )
+        assert reader.energy_totals["duration_s"] == pytest.approx(0.5)
+    with h5py.File(path, "r") as converted:
+        assert converted.attrs["hostname"] == "sheep0"
+        assert converted["gpio"]["time"].shape[0] == sum(range(5))
+        assert converted["exceptions"]["message"][0].decode() == "failure"
+
+
+def test_create_raw_log_writer(tmp_path):
+    writer = create_log_writer(
+        tmp_path / "rec.h5",
+        CalibrationData.from_default(),
+        raw_output=True,
+        output_compression="lzf",
+        buffers_per_write=10,
+    )
+    assert isinstance(writer, RawLogWriter)
@@ -0,0 +1,112 @@
+import pytest
+import h5py
+import numpy as np
+
+from shepherd import LogWriter
+from shepherd import LogReader
+from shepherd import CalibrationData
+from shepherd.shepherd_io import DataBuffer
+from shepherd.sample_codec import encode_delta_zigzag
+from shepherd.sample_codec import decode_delta_zigzag
+from shepherd.sample_codec import DeltaZigzagStream
+from shepherd.sample_codec import decode_buffers
+
+
+def smooth_data(length):
+    # slowly changing signal with a few bits of noise, like a real adc
+    signal = 100_000 + 50_000 * np.sin(1e-4 * np.arange(length))
+    noise = np.random.randint(-8, 8, size=length)
+    return (signal + noise).astype("u4")
+
+
+def test_delta_zigzag_roundtrip():
+    values = np.random.randint(0, high=2**18, size=1_000, dtype="u4")
+    values[:4] = [0, 2**18 - 1, 0, 1]
+    encoded = encode_delta_zigzag(values, 0, 0, 300)
+    assert encoded.dtype == np.dtype("u4")
+    assert np.array_equal(decode_delta_zigzag(encoded, 0, 300), values)
+    # chunks decode independently
+    assert np.array_equal(decode_delta_zigzag(encoded[600:], 600, 300), values[600:])
+    with pytest.raises(ValueError):
+        decode_delta_zigzag(encoded[50:], 50, 300)
+
+
+def test_delta_zigzag_sections():
+    values = smooth_data(1_000)
+    # encoding in sections that do not match the chunks gives the same result
+    sections = [
+        encode_delta_zigzag(values[start:end], start, values[start - 1], 300)
+        for start, end in [(0, 250), (250, 600), (600, 1_000)]
+    ]
+    assert np.array_equal(
+        np.concatenate(sections), encode_delta_zigzag(values, 0, 0, 300)
+    )
+    assert np.all(np.concatenate(sections)[1:300] < 64)
+
+
+def test_delta_zigzag_stream():
+    values = smooth_data(1_000)
+    encoded = encode_delta_zigzag(values, 0, 0, 300)
+    # buffers of the reader do not match the chunks, like in run_emulator()
+    streams = {"current": DeltaZigzagStream(300)}
+    buffers = [
+        (start, values[start : start + 128], encoded[start : start + 128])
+        for start in range(0, 1_000, 128)
+    ]
+    decoded = list(decode_buffers(buffers, streams))
+    assert [buffer[0] for buffer in decoded] == list(range(0, 1_000, 128))
+    assert np.array_equal(np.concatenate([buffer[1] for buffer in decoded]), values)
+    assert np.array_equal(np.concatenate([buffer[2] for buffer in decoded]), values)
+
+
+@pytest.mark.parametrize("sample_codec", [None, "shuffle", "delta_zigzag"])
+@pytest.mark.parametrize("compression_threads", [0, 2])
+def test_logwriter_sample_codec(tmp_path, sample_codec, compression_threads):
+    path = tmp_path / "codec.h5"
+    voltages = [smooth_data(10_000) for _ in range(8)]
+    voltages[3] = voltages[3][:3_333]
+    with LogWriter(
+        path,
+        CalibrationData.from_default(),
+        output_compression=1,
+        buffers_per_write=3,
+        compression_threads=compression_threads,
+        sample_codec=sample_codec,
+    ) as writer:
+        for i, voltage in enumerate(voltages):
+            writer.write_buffer(DataBuffer(voltage, voltage, i))
+
+    with h5py.File(path, "r") as written:
+        assert written["data"]["voltage"].attrs.get("codec") == sample_codec
+        assert written["data"]["current"].shuffle == (sample_codec is not None)
+
+    with LogReader(path) as reader:
+        values = np.concatenate(voltages)
+        assert np.array_equal(reader.get_data("voltage"), values)
+        assert np.array_equal(reader.get_data("current"), values)
+        assert np.array_equal(
+            reader.get_data("voltage", 12_345, 23_456), values[12_345:23_456]
+        )
+
+
+def test_sample_codec_reduces_size(tmp_path):
+    sizes = {}
+    voltages = [smooth_data(10_000) for _ in range(20)]
+    for sample_codec in [None, "delta_zigzag"]:
+        path = tmp_path / f"codec_{sample_codec}.h5"
+        with LogWriter(
+            path,
+            CalibrationData.from_default(),
+            output_compression="lzf",
+            sample_codec=sample_codec,
+            implicit_time=True,
+        ) as writer:
+            for i, voltage in enumerate(voltages):
+                writer.write_buffer(DataBuffer(voltage, voltage, i))
+        sizes[sample_codec] = path.stat().st_size
+    assert sizes["delta_zigzag"] < 0.6 * sizes[None]
+
+
+def test_logwriter_invalid_codec(tmp_path):
+    with pytest.raises(ValueError):
+        LogWriter(tmp_path / "x.h5", CalibrationData.from_default(), sample_codec="x")
@@ -0,0 +1,137 @@
+import h5py
+import numpy as np
+import pytest
+
+from shepherd import CalibrationData
+from shepherd import LogReader
+from shepherd import LogWriter
+from shepherd import SegmentedLogWriter
+from shepherd.shepherd_io import DataBuffer
+from shepherd.segments import read_manifest
+from shepherd.segments import create_log_writer
+from shepherd.segments import write_manifest
+from shepherd.segments import build_virtual_file
+
+
+def random_data(length):
+    return np.random.randint(0, high=2**18, size=length, dtype="u4")
+
+
+def write_buffers(writer, n_buffers: int, offset: int = 0) -> list:
+    voltages = []
+    for i in range(offset, offset + n_buffers):
+        voltages.append(random_data(10_000))
+        writer.write_buffer(DataBuffer(voltages[-1], random_data(10_000), i * 10**8))
+    return voltages
+
+
+def test_create_log_writer(tmp_path):
+    cal = CalibrationData.from_default()
+    assert not isinstance(create_log_writer(tmp_path / "a.h5", cal), SegmentedLogWriter)
+    writer = create_log_writer(tmp_path / "a.h5", cal, segment_duration=60)
+    assert isinstance(writer, SegmentedLogWriter)
+    with pytest.raises(ValueError):
+        SegmentedLogWriter(tmp_path / "a.h5", cal)
+    with pytest.raises(ValueError):
+        create_log_writer(
+            tmp_path / "a.h5", cal, segment_size=2**20, sample_codec="delta_zigzag"
+        )
+
+
+@pytest.mark.parametrize("buffers_per_write", [1, 4])
+def test_segments_by_duration(tmp_path, monkeypatch, buffers_per_write):
+    path = tmp_path / "rec.h5"
+    with SegmentedLogWriter(
+        path,
+        CalibrationData.from_default(),
+        segment_duration=1.0,
+        buffers_per_write=buffers_per_write,
+    ) as writer:
+        writer["hostname"] = "sheep0"
+        writer.embed_config({"dtype": "ivsample"})
+        voltages = write_buffers(writer, 25)
+
+    segments = read_manifest(tmp_path / "rec.manifest.yaml")
+    assert [segment["file"] for segment in segments] == [
+        "rec.0000.h5",
+        "rec.0001.h5",
+        "rec.0002.h5",
+    ]
+    assert [segment["n_samples"] for segment in segments] == [100_000, 100_000, 50_000]
+    assert all(segment["closed"] for segment in segments)
+    for previous, segment in zip(segments[:-1], segments[1:]):
+        assert previous["time_end_ns"] == segment["time_start_ns"]
+
+    with h5py.File(tmp_path / "rec.0001.h5", "r") as segment:
+        assert segment.attrs["hostname"] == "sheep0"
+        assert "config" in segment["data"].attrs
+        assert segment["data"]["time"][0] == 10 * 10**8
+
+    # the virtual file joins all segments, also from another directory
+    monkeypatch.chdir(tmp_path.parent)
+    with h5py.File(path, "r") as joined:
+        assert np.array_equal(joined["data"]["voltage"][:], np.concatenate(voltages))
+        assert joined["data"]["voltage"].attrs["gain"] > 0
+        assert joined["buffers"]["time"].shape[0] == 25
+    with LogReader(path) as reader:
+        assert reader.n_samples == 250_000
+        assert len(reader.find_gaps()) == 0
+
+
+def test_segments_by_size(tmp_path):
+    with SegmentedLogWriter(
+        tmp_path / "rec.h5",
+        CalibrationData.from_default(),
+        segment_size=200_000,
+        energy=True,
+    ) as writer:
+        write_buffers(writer, 12)
+        assert len(writer.segments) > 1
+        # only closed segments are part of the virtual file
+        with h5py.File(tmp_path / "rec.h5", "r") as joined:
+            n_closed = len(writer.segments) - 1
+            assert list(joined.attrs["segments"]) == [
+                segment["file"] for segment in writer.segments[:n_closed]
+            ]
+    segments = read_manifest(tmp_path / "rec.manifest.yaml")
+    assert sum(segment["n_samples"] for segment in segments) == 120_000
+    with LogReader(tmp_path / "rec.h5") as reader:
+        # totals get merged over all segments
+        assert reader.energy_totals["duration_s"] == pytest.approx(1.2)
+        assert reader.energy_totals["energy_j"] == pytest.approx(
+            sum(segment["energy_j"] for segment in segments)
+        )
+
+
+def test_segments_hand_over_monitors(tmp_path):
+    with SegmentedLogWriter(
+        tmp_path / "rec.h5", CalibrationData.from_default(), segment_duration=0.5
+    ) as writer:
+        queue = writer._writer._dmesg_queue
+        for i in range(12):
+            # monitor-thread keeps appending to the queue it started with
+            queue.append((i, f"line {i}"))
+            write_buffers(writer, 1, offset=i)
+        assert writer._writer._dmesg_queue is queue
+
+    lines = []
+    for segment in read_manifest(tmp_path / "rec.manifest.yaml"):
+        with h5py.File(tmp_path / segment["file"], "r") as h5file:
+            lines += [line.decode() for line in h5file["dmesg"]["message"][:]]
+    assert lines == [f"line {i}" for i in range(12)]
+
+
+def test_virtual_file_refuses_delta_zigzag(tmp_path):
+    with LogWriter(
+        tmp_path / "rec.0000.h5",
+        CalibrationData.from_default(),
+        sample_codec="delta_zigzag",
+    ) as writer:
+        write_buffers(writer, 2)
+    write_manifest(
+        tmp_path / "rec.manifest.yaml", [{"file": "rec.0000.h5", "closed": True}]
+    )
+    with pytest.raises(ValueError):
+        build_virtual_file(tmp_path / "rec.manifest.yaml", tmp_path / "rec.h5")
+    assert not (tmp_path / "rec.h5").exists()
+    assert not (tmp_path / "rec.tmp").exists()
@@ -0,0 +1,130 @@
+import pytest
+import time
+import h5py
+import numpy as np
+
+from shepherd import Recorder
+from shepherd import Emulator
+from shepherd import run_recorder
+from shepherd import DataBuffer
+from shepherd import commons
+from shepherd import sysfs_interface
+from shepherd.shepherd_io import ShepherdIOException
+from shepherd.sysfs_interface import SysfsInterfaceException
+from shepherd.simulation import SimulatedBackend
+from shepherd.simulation import create_backend
+
+
+@pytest.fixture()
+def simulation():
+    with SimulatedBackend(samples_per_buffer=1_000, n_buffers=8) as sim:
+        yield sim
+
+
+def test_create_backend():
+    assert create_backend(None) is None
+    assert create_backend("0") is None
+    assert isinstance(create_backend("1"), SimulatedBackend)
+    assert create_backend("rec.h5").input_path.name == "rec.h5"
+
+
+def test_simulated_recorder(simulation):
+    rec = Recorder(harvester="cv20")
+    with rec:
+        rec.start(wait_blocking=True)
+        timestamps = []
+        for _ in range(10):
+            idx, buf = rec.get_buffer()
+            assert len(buf) == 1_000
+            assert buf.voltage.max() > 0
+            timestamps.append(buf.timestamp_ns)
+            rec.return_buffer(idx)
+        del buf
+        # blocking on the notification, latency is measured from its timestamp
+        stats = rec.get_msg_latency_stats()
+        assert stats["notified"] > 0
+        assert stats["polled"] == 0
+        assert 0 < stats["latency_max_s"] < 0.05
+    del rec
+    assert np.all(np.diff(timestamps) == 100_000_000)
+
+
+def test_simulated_bulk_handover(simulation):
+    rec = Recorder()
+    with rec:
+        # all buffers are handed over with one message in __enter__()
+        assert rec.telemetry.pru_buffers == 8
+        with pytest.raises(ShepherdIOException):
+            rec._return_buffer_range(4, 5)
+        rec.start(wait_blocking=True)
+        for _ in range(8):
+            rec.get_buffer()
+    del rec
+
+
+def test_simulated_emulator(simulation):
+    buffers = [
+        DataBuffer(np.full(1_000, 200_000, "u4"), np.full(1_000, 8_000, "u4"))
+        for _ in range(8)
+    ]
+    emu = Emulator(
+        initial_buffers=buffers,
+        vsource="BQ25570",
+        infile_vh_cfg={"dtype": "ivsample", "window_samples": 0},
+    )
+    with emu:
+        emu.start(wait_blocking=True)
+        for _ in range(10):
+            idx, buf = emu.get_buffer()
+            assert buf.voltage.max() > 0
+            emu.return_buffer(idx, buffers[0])
+        del buf
+    del emu
+
+
+def test_simulated_overrun(simulation):
+    rec = Recorder()
+    with rec:
+        rec.start(wait_blocking=True)
+        with pytest.raises(ShepherdIOException) as e:
+            # buffers are never returned
+            for _ in range(20):
+                rec.get_buffer()
+        assert e.value.id_num == commons.MSG_DEP_ERR_NOFREEBUF
+    # the traceback keeps a reference to the singleton
+    del e, rec
+
+
+def test_simulated_state_watch(simulation):
+    sysfs_interface.set_start(time.time() + 10)
+    assert sysfs_interface.wait_for_states(["armed", "running"], 1) == "armed"
+    with pytest.raises(SysfsInterfaceException):
+        sysfs_interface.wait_for_state("running", 0.05)
+    sysfs_interface.set_stop(force=True)
+    assert sysfs_interface.wait_for_state("idle", 1) < 0.1
+
+
+def test_simulation_restores_hardware_access(simulation):
+    assert sysfs_interface.get_n_buffers() == 8
+    simulation.__exit__()
+    assert sysfs_interface.sysfs_path.as_posix() == "/sys/shepherd"
+
+
+@pytest.mark.timeout(60)
+def test_simulated_record_fn(tmp_path):
+    output = tmp_path / "rec.h5"
+    start_time = int(time.time() + 3)
+    with SimulatedBackend():
+        run_recorder(
+            output_path=output,
+            duration=2,
+            force_overwrite=True,
+            use_cal_default=True,
+            start_time=start_time,
+        )
+
+    with h5py.File(output, "r") as hf:
+        assert hf["data"]["time"].shape[0] == 200_000
+        assert hf["data"]["time"][0] == start_time * 10**9
+        assert hf["telemetry"]["time"].shape[0] == 20
+        assert hf["telemetry"]["value"][:, 4].max() <= 64
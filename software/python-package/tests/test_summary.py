@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from shepherd.summary import EnergyMeter
+from shepherd.summary import SummaryPyramid
+from shepherd.summary import merge_totals
+from shepherd.summary import totals_list
+
+
+def test_summary_carries_bins_across_buffers():
+    pyramid = SummaryPyramid([10, 100, 1000], sample_interval_ns=10_000)
+    voltage = np.random.rand(2345)
+    current = np.random.rand(2345)
+    pos = 0
+    for length in [7, 100, 333, 1000, 905]:
+        section = slice(pos, pos + length)
+        pyramid.add(pos * 10_000, voltage[section], current[section])
+        pos += length
+    pyramid.finish()
+
+    for level, bin_samples in enumerate([10, 100, 1000]):
+        bins = pyramid.pop(level)
+        n_bins = -(-2345 // bin_samples)
+        assert np.array_equal(bins["time"], np.arange(n_bins) * bin_samples * 10_000)
+        for index in range(n_bins):
+            section = slice(index * bin_samples, (index + 1) * bin_samples)
+            for channel, values in [
+                ("voltage", voltage),
+                ("current", current),
+                ("power", voltage * current),
+            ]:
+                expected = [
+                    values[section].min(),
+                    values[section].max(),
+                    values[section].mean(),
+                ]
+                assert np.allclose(bins[channel][index], expected)
+        assert pyramid.pop(level)["time"].shape[0] == 0
+
+
+def test_summary_follows_buffer_timestamps():
+    pyramid = SummaryPyramid([100], sample_interval_ns=10_000)
+    pyramid.add(0, np.ones(150), np.ones(150))
+    # gap of 1 s before the second buffer, the bin with carried samples
+    # keeps the time of its first sample
+    pyramid.add(10**9 + 150 * 10_000, np.ones(150), np.ones(150))
+    assert list(pyramid.pop(0)["time"]) == [0, 10**6, 10**9 + 2 * 10**6]
+
+
+def test_summary_needs_multiples():
+    with pytest.raises(ValueError):
+        SummaryPyramid([100, 150], sample_interval_ns=10_000)
+
+
+def test_energy_meter():
+    meter = EnergyMeter(sample_interval_ns=10_000, on_threshold_w=0.5)
+    power = np.random.rand(250_000)
+    for start in range(0, 250_000, 10_000):
+        meter.add(start * 10_000, power[start : start + 10_000])
+    rows = meter.pop()
+    assert list(rows["time"]) == [0, 10**9]
+    assert np.isclose(rows["energy"][0], power[:100_000].sum() * 1e-5)
+    assert np.isclose(rows["power"][1, 0], power[100_000:200_000].min())
+    assert np.isclose(rows["power"][1, 2], power[100_000:200_000].mean())
+    assert np.isclose(rows["on_time"][0], np.sum(power[:100_000] > 0.5) * 1e-5)
+
+    meter.finish()
+    assert meter.pop()["time"].shape[0] == 1
+    totals = meter.totals
+    assert np.isclose(totals["energy_j"], power.sum() * 1e-5)
+    assert np.isclose(totals["power_mean_w"], power.mean())
+    assert totals["power_max_w"] == power.max()
+    assert np.isclose(totals["duration_s"], 2.5)
+
+
+def test_merge_totals():
+    first = {"energy_j": 2.0, "power_mean_w": 1.0, "power_min_w": 0.5}
+    first.update({"power_max_w": 1.5, "on_time_s": 2.0, "duration_s": 2.0})
+    second = {"energy_j": 9.0, "power_mean_w": 3.0, "power_min_w": 1.0}
+    second.update({"power_max_w": 4.0, "on_time_s": 1.0, "duration_s": 3.0})
+    totals = merge_totals([first, second, {key: 0.0 for key in totals_list}])
+    assert totals["energy_j"] == 11.0
+    assert totals["power_mean_w"] == 11.0 / 5.0
+    assert totals["power_min_w"] == 0.5
+    assert totals["power_max_w"] == 4.0
+    assert totals["on_time_s"] == 3.0
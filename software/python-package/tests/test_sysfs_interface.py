@@ -11,7 +11,7 @@ from shepherd import (
     VirtualHarvesterConfig,
 )
 from shepherd.calibration import CalibrationData
-from shepherd.virtual_source_data import flatten_dict_list
+from shepherd.virtual_source_config import flatten_dict_list
 
 
 @pytest.fixture
@@ -186,3 +186,36 @@ def test_initial_virtsource_settings(shepherd_up):
     vsource_settings = [list(range(100, 124)), list(range(12 * 12)), list(range(12))]
     values_1d = flatten_dict_list(vsource_settings)
     assert sysfs_interface.read_virtual_converter_settings() == values_1d
+
+
+@pytest.mark.hardware
+def test_pru_msg_box_timeout(shepherd_up):
+    with sysfs_interface.PruMsgBox() as msg_box:
+        assert msg_box.read() is None
+        ts_start = time.time()
+        with pytest.raises(sysfs_interface.SysfsInterfaceException):
+            msg_box.wait(0.2)
+        assert 0.2 <= time.time() - ts_start < 0.3
+
+
+@pytest.fixture
+def msg_box_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sysfs_interface, "sysfs_path", tmp_path)
+    (tmp_path / "pru_msg_box").write_bytes(b"")
+    return tmp_path
+
+
+def test_pru_msg_box_read_only_notify(msg_box_dir):
+    # sysfs refuses to open attributes without write-bits for writing, even for root
+    read_only = Path("/sys/devices/system/cpu/online")
+    if not read_only.exists():
+        pytest.skip("needs a read-only sysfs attribute")
+    (msg_box_dir / "pru_msg_notify_ns").symlink_to(read_only)
+    with sysfs_interface.PruMsgBox() as msg_box:
+        assert msg_box.notify_supported
+
+
+def test_pru_msg_box_without_notify(msg_box_dir):
+    with sysfs_interface.PruMsgBox() as msg_box:
+        assert not msg_box.notify_supported
+        assert msg_box.read() is None
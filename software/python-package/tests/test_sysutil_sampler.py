@@ -0,0 +1,120 @@
+import pytest
+import numpy as np
+import h5py
+
+from shepherd import LogWriter
+from shepherd import CalibrationData
+from shepherd.shepherd_io import DataBuffer
+from shepherd.sysutil_sampler import SysutilSampler
+
+
+def write_counters(proc_path, cpu: list, ctxt: int, disk: list, net: list):
+    (proc_path / "net").mkdir(parents=True, exist_ok=True)
+    (proc_path / "stat").write_text(
+        "\n".join(
+            [f"cpu {' '.join(str(sum(v)) for v in zip(*cpu))} 0 0"]
+            + [f"cpu{i} {' '.join(map(str, v))} 0 0" for i, v in enumerate(cpu)]
+            + ["intr 1 2 3", f"ctxt {ctxt}", "btime 1"]
+        )
+    )
+    (proc_path / "meminfo").write_text(
+        "MemTotal: 1000 kB\nMemFree: 100 kB\nMemAvailable: 250 kB\n"
+    )
+    (proc_path / "diskstats").write_text(
+        f"179 0 mmcblk0 {disk[0]} 0 {disk[1]} 0 {disk[2]} 0 {disk[3]} 0 0 0 0\n"
+        f"179 1 mmcblk0p1 {disk[0]} 0 {disk[1]} 0 {disk[2]} 0 {disk[3]} 0 0 0 0\n"
+    )
+    (proc_path / "net" / "dev").write_text(
+        "Inter-|   Receive |  Transmit\n face |bytes packets|bytes packets\n"
+        f"  eth0: {net[1]} 0 0 0 0 0 0 0 {net[0]} 0 0 0 0 0 0 0\n"
+        f"    lo: 10 0 0 0 0 0 0 0 10 0 0 0 0 0 0 0\n"
+    )
+
+
+@pytest.fixture
+def fake_system(tmp_path):
+    proc_path = tmp_path / "proc"
+    sys_path = tmp_path / "sys"
+    (sys_path / "block" / "mmcblk0").mkdir(parents=True)
+    (sys_path / "block" / "loop0").mkdir(parents=True)
+    zone = sys_path / "class" / "thermal" / "thermal_zone0"
+    zone.mkdir(parents=True)
+    (zone / "temp").write_text("45123\n")
+    # per core: user nice system idle iowait irq softirq steal
+    write_counters(
+        proc_path, [[10, 0, 0, 90, 0, 0, 0, 0]] * 2, 100, [1, 2, 3, 4], [5, 6]
+    )
+    return proc_path, sys_path
+
+
+def test_sampler_counters(fake_system):
+    proc_path, sys_path = fake_system
+    sampler = SysutilSampler(proc_path=proc_path, sys_path=sys_path)
+    assert sampler.disks == ["mmcblk0"]
+    assert sampler.n_cores == 2
+    assert "temp" in sampler.columns
+
+    write_counters(
+        proc_path,
+        [[60, 0, 0, 140, 0, 0, 0, 0], [10, 0, 0, 190, 0, 0, 0, 0]],
+        350,
+        [11, 12, 23, 34],
+        [105, 1006],
+    )
+    sampler.add_write_latency(1_500_000)
+    sampler.add_write_latency(700_000)
+    sampler.sample()
+    row = dict(zip(["time"] + sampler.columns, sampler.queue.popleft()))
+    assert row["cpu"] == 25
+    assert list(row["cpu_core"]) == [50, 0]
+    assert row["ram"] == [25, 75]
+    assert list(row["io"]) == [10, 20, 512 * 10, 512 * 30]
+    assert list(row["net"]) == [100, 1000]
+    assert row["ctxt"] == 250
+    assert list(row["temp"]) == [45123]
+    assert row["write_latency"] == 1500
+
+    sampler.sample()
+    assert sampler.queue.popleft()[-1] == 0
+
+
+@pytest.mark.timeout(5)
+def test_sampler_thread():
+    # runs on the /proc of the host
+    with SysutilSampler(intervall_ns=10_000_000) as sampler:
+        while len(sampler.queue) < 3:
+            pass
+    n_rows = len(sampler.queue)
+    assert len(sampler.queue[0]) == len(sampler.columns) + 1
+    sampler.stop()
+    assert len(sampler.queue) == n_rows
+
+
+def test_logwriter_sysutil(tmp_path):
+    path = tmp_path / "sysutil.h5"
+    writer = LogWriter(path, CalibrationData.from_default(), sysutil_intervall=0.01)
+    assert writer.sysutil_sampler.intervall_ns == 10_000_000
+    writer.monitor_intervall_ns = 0
+    with writer:
+        for i in range(10):
+            voltage = np.zeros(10_000, dtype="u4")
+            writer.write_buffer(DataBuffer(voltage, voltage, i))
+            writer.sysutil_sampler.stop()
+            writer.sysutil_sampler.sample()
+        n_rows = writer.sysutil_pos
+
+    with h5py.File(path, "r") as written:
+        sysutil = written["sysutil"]
+        assert n_rows >= 9
+        for name in ["time"] + writer.sysutil_sampler.columns:
+            assert sysutil[name].shape[0] == sysutil["time"].shape[0]
+        assert sysutil["cpu_core"].shape[1] == writer.sysutil_sampler.n_cores
+        assert sysutil["write_latency"][:].max() > 0
+
+
+def test_logwriter_sysutil_intervall(tmp_path):
+    cal = CalibrationData.from_default()
+    writer = LogWriter(tmp_path / "default.h5", cal)
+    assert writer.sysutil_sampler.intervall_ns == LogWriter.sys_log_intervall_ns
+    with pytest.raises(ValueError):
+        LogWriter(tmp_path / "invalid.h5", cal, sysutil_intervall=0)
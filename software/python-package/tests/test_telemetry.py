@@ -0,0 +1,65 @@
+import pytest
+import numpy as np
+
+from shepherd.telemetry import BufferTelemetry
+
+
+def run_cycles(telemetry, n_buffers, n_cycles):
+    for index in range(n_buffers):
+        telemetry.returned(index)
+    for cycle in range(n_cycles):
+        index = cycle % n_buffers
+        timestamp_ns = cycle * 10**8
+        telemetry.received(index, timestamp_ns, timestamp_ns + 2 * 10**6, 5_000)
+        telemetry.returned(index)
+
+
+def test_telemetry_entries():
+    blocks = []
+    telemetry = BufferTelemetry()
+    telemetry.sink = lambda ts, val: blocks.append((ts, val))
+    run_cycles(telemetry, 8, 20)
+    telemetry.flush()
+    timestamps = np.concatenate([block[0] for block in blocks])
+    values = np.concatenate([block[1] for block in blocks])
+    assert np.array_equal(timestamps, np.arange(20) * 10**8)
+    assert np.all(values[:, 0] == 2_000)
+    assert np.all(values[:, 1] == 5)
+    # one buffer is always held by the host
+    assert np.all(values[:, 4] == 7)
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 100])
+def test_telemetry_sink_gets_all_entries(block_size):
+    blocks = []
+    telemetry = BufferTelemetry(block_size)
+    telemetry.sink = lambda ts, val: blocks.append((ts, val))
+    run_cycles(telemetry, 4, 50)
+    telemetry.flush()
+    assert all(len(block[0]) <= block_size for block in blocks)
+    timestamps = np.concatenate([block[0] for block in blocks])
+    assert np.array_equal(timestamps, np.arange(50) * 10**8)
+
+
+def test_telemetry_summary():
+    telemetry = BufferTelemetry()
+    assert telemetry.get_summary()["buffers"] == 0
+    run_cycles(telemetry, 4, 10)
+    summary = telemetry.get_summary()
+    assert summary["buffers"] == 10
+    assert summary["latency_us"]["p50"] == 2_000
+    assert summary["latency_us"]["max"] == 2_000
+    assert summary["pru_buffers"]["min"] == 3
+
+
+def test_telemetry_summary_is_bounded():
+    telemetry = BufferTelemetry(block_size=10, reservoir_size=50)
+    run_cycles(telemetry, 4, 1_000)
+    telemetry.received(0, 0, 9 * 10**6, 5_000)
+    telemetry.returned(0)
+    summary = telemetry.get_summary()
+    assert summary["buffers"] == 1_001
+    assert telemetry._reservoir.shape[0] == 50
+    assert summary["latency_us"]["p50"] == 2_000
+    # extremes are tracked for all entries, also the pending ones
+    assert summary["latency_us"]["max"] == 9_000
@@ -0,0 +1,82 @@
+import os
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from shepherd import LogWriter
+from shepherd import LogReader
+from shepherd import CalibrationData
+from shepherd.uart_capture import UartCapture
+
+
+@pytest.fixture
+def pipe():
+    fd_read, fd_write = os.pipe()
+    yield fd_read, fd_write
+    os.close(fd_read)
+    os.close(fd_write)
+
+
+def test_capture_chunks(pipe):
+    fd_read, fd_write = pipe
+    capture = UartCapture(ring_size=16)
+    for index, message in enumerate([b"hello ", b"world\n"]):
+        os.write(fd_write, message)
+        assert capture.read(fd_read, 1000 + index) == 6
+    captured = capture.pop()
+    assert captured["data"].tobytes() == b"hello world\n"
+    assert list(captured["time"]) == [1000, 1001]
+    assert list(captured["offset"]) == [0, 6]
+
+    # wraps around the end of the ring, overflow gets dropped
+    os.write(fd_write, b"0123456789abcdefXYZ")
+    assert capture.read(fd_read, 2000) == 16
+    assert capture.read(fd_read, 2001) == 0
+    assert capture.n_dropped == 3
+    captured = capture.pop()
+    assert captured["data"].tobytes() == b"0123456789abcdef"
+    assert list(captured["offset"]) == [0]
+    assert capture.pop()["data"].shape[0] == 0
+
+
+def test_capture_thread(pipe):
+    fd_read, fd_write = pipe
+    capture = UartCapture(wait_timeout=0.01)
+    capture.start(fd_read)
+    os.write(fd_write, bytes(range(256)))
+    received = b""
+    deadline = time.monotonic() + 5
+    while (len(received) < 256) and (time.monotonic() < deadline):
+        received += capture.pop()["data"].tobytes()
+        time.sleep(0.001)
+    capture.stop()
+    assert received == bytes(range(256))
+
+
+def test_logwriter_uart(tmp_path, pipe, monkeypatch):
+    fd_read, fd_write = pipe
+    uart_path = tmp_path / "ttyO1"
+    uart_path.touch()
+    monkeypatch.setattr(LogWriter, "uart_path", str(uart_path))
+    path = tmp_path / "uart.h5"
+    # stays below the capacity of the pipe (64 KiB), os.write() would block
+    messages = [b"boot\x00\xff", b"", b"x" * 50_000, b"done\n"]
+    with LogWriter(path, CalibrationData.from_default()) as writer:
+        writer.uart_data_inc = 2**12
+        for index, message in enumerate(messages):
+            if message:
+                os.write(fd_write, message)
+                writer.uart_capture.read(fd_read, index * 10**6)
+            writer.flush_uart()
+
+    with h5py.File(path, "r") as written:
+        assert written["uart"]["data"].dtype == np.uint8
+        assert written["uart"]["data"].shape[0] == sum(map(len, messages))
+    with LogReader(path) as reader:
+        assert reader.get_uart() == [
+            (index * 10**6, message)
+            for index, message in enumerate(messages)
+            if message
+        ]